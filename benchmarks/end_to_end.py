@@ -0,0 +1,388 @@
+"""
+End-to-end benchmark of the formatter on synthetic inputs, without Azure.
+
+    python -m benchmarks.end_to_end [--sizes N ...] [--formats osm pbf zip] [--modes format service]
+                                    [--repeat N] [--workers N] [--timeout S] [--report report.json]
+                                    [--baseline baseline.json] [--max-regression 0.25]
+
+Inputs are sidewalk grids of about `--sizes` nodes, written as OSM XML (.osm), OSM PBF (.pbf)
+and OSW (.zip). `format` mode times OSWFormat.format on its own; `service` mode runs
+OSWFomatterService on the local backend (BACKEND=local), publishes a request to its topic and
+times it up to the response. Containers are in a temporary directory, topics are in-process.
+
+Each run records its wall time, the time of each traced stage and its peak RSS, the peak of
+the worker process when there is one, into the JSON `--report`. With `--baseline`, a result
+whose median wall time or peak RSS is more than `--max-regression` above the baseline's, or
+that fails where the baseline succeeded, is a regression and the exit status is 1.
+"""
+import os
+
+# Settings are read at import, the benchmark's topics and container replace the Azure ones
+os.environ.setdefault('FORMATTER_TOPIC', 'benchmark-requests')
+os.environ.setdefault('FORMATTER_SUBSCRIPTION', 'benchmark')
+os.environ.setdefault('FORMATTER_UPLOAD_TOPIC', 'benchmark-responses')
+os.environ.setdefault('CONTAINER_NAME', 'osw')
+
+import sys
+import json
+import math
+import time
+import uuid
+import shutil
+import zipfile
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import statistics
+from datetime import datetime, timezone
+from unittest.mock import patch
+from python_ms_core import Core
+from python_ms_core.core.queue.models.queue_message import QueueMessage
+from src.local_backend import LocalCore
+from src.tracing import configure_tracing, get_tracer
+
+FORMATS = ['osm', 'pbf', 'zip']
+MODES = ['format', 'service']
+# South west corner of the grid and the distance between neighbouring nodes, about 11m
+ORIGIN = (47.6, -122.3)
+STEP = 0.0001
+# Seconds to wait for the service to finish the trace of a job it has responded to
+JOB_SPAN_WAIT = 5
+
+
+def grid_side(nodes: int) -> int:
+    return max(int(math.ceil(math.sqrt(nodes))), 2)
+
+
+def grid_node(side: int, row: int, column: int):
+    """Id, latitude and longitude of a grid node."""
+    return row * side + column + 1, ORIGIN[0] + row * STEP, ORIGIN[1] + column * STEP
+
+
+def write_osm(path: str, nodes: int) -> str:
+    """A grid of about `nodes` nodes joined by sidewalks along every row and column, as OSM XML."""
+    side = grid_side(nodes)
+    with open(path, 'w') as file:
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6" generator="osw-formatter-benchmark">\n')
+        for row in range(side):
+            for column in range(side):
+                node_id, lat, lon = grid_node(side, row, column)
+                file.write(f'  <node id="{node_id}" version="1" lat="{lat:.7f}" lon="{lon:.7f}"/>\n')
+        lines = [[grid_node(side, row, column)[0] for column in range(side)] for row in range(side)]
+        lines += [[grid_node(side, row, column)[0] for row in range(side)] for column in range(side)]
+        for way_id, refs in enumerate(lines, start=1):
+            file.write(f'  <way id="{way_id}" version="1">\n')
+            for ref in refs:
+                file.write(f'    <nd ref="{ref}"/>\n')
+            file.write('    <tag k="highway" v="footway"/>\n    <tag k="footway" v="sidewalk"/>\n  </way>\n')
+        file.write('</osm>\n')
+    return path
+
+
+def write_pbf(path: str, nodes: int) -> str:
+    """The grid of `write_osm` as OSM PBF."""
+    import osmium
+    osm_path = f'{path}.osm'
+    write_osm(osm_path, nodes)
+    try:
+        reader = osmium.io.Reader(osm_path)
+        writer = osmium.WriteHandler(path)
+        osmium.apply(reader, writer)
+        writer.close()
+        reader.close()
+    finally:
+        os.remove(osm_path)
+    return path
+
+
+def write_osw(path: str, nodes: int) -> str:
+    """The grid of `write_osm` as an OSW zip of nodes and sidewalk edges between neighbouring nodes."""
+    side = grid_side(nodes)
+    node_features = []
+    edge_features = []
+    for row in range(side):
+        for column in range(side):
+            node_id, lat, lon = grid_node(side, row, column)
+            node_features.append({
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+                'properties': {'_id': str(node_id)}
+            })
+            for next_row, next_column in ((row, column + 1), (row + 1, column)):
+                if next_row == side or next_column == side:
+                    continue
+                next_id, next_lat, next_lon = grid_node(side, next_row, next_column)
+                edge_features.append({
+                    'type': 'Feature',
+                    'geometry': {'type': 'LineString', 'coordinates': [[lon, lat], [next_lon, next_lat]]},
+                    'properties': {'_id': str(len(edge_features) + 1), '_u_id': str(node_id), '_v_id': str(next_id),
+                                   'highway': 'footway', 'footway': 'sidewalk', 'length': 11.1}
+                })
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, features in (('nodes', node_features), ('edges', edge_features)):
+            archive.writestr(f'bench.graph.{name}.geojson',
+                             json.dumps({'type': 'FeatureCollection', 'features': features}))
+    return path
+
+
+WRITERS = {'osm': write_osm, 'pbf': write_pbf, 'zip': write_osw}
+
+
+class Responses:
+    """Collects the final responses of the service, the ones that are not progress heartbeats."""
+
+    def __init__(self):
+        self._responses = {}
+        self._condition = threading.Condition()
+
+    def receive(self, message: QueueMessage):
+        if message.messageType.endswith('-progress'):
+            return
+        with self._condition:
+            self._responses[message.messageId] = message
+            self._condition.notify_all()
+
+    def wait(self, message_id: str, timeout: float = None) -> QueueMessage:
+        with self._condition:
+            if not self._condition.wait_for(lambda: message_id in self._responses, timeout):
+                raise TimeoutError(f'No response to {message_id} within {timeout:g}s')
+            return self._responses.pop(message_id)
+
+
+def process_peak_rss() -> int:
+    """Highest RSS in bytes of this process or any of its waited for children so far."""
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * 1024
+
+
+def trace_stages(spans, trace_id: str) -> dict:
+    """Seconds spent in each stage of a trace, stages that ran more than once are summed."""
+    stages = {}
+    for span in spans:
+        if span.trace_id == trace_id and span.parent_id is not None:
+            stages[span.name] = stages.get(span.name, 0.0) + span.duration
+    return stages
+
+
+def job_trace_id(spans, job_id: str):
+    """Trace of the service's job span of `job_id`, it starts on the thread that received the message."""
+    for span in spans:
+        if span.parent_id is None and span.attributes.get('job_id') == job_id:
+            return span.trace_id
+    return None
+
+
+def worker_peak_rss(spans, trace_id: str):
+    peaks = [span.attributes['peak_rss'] for span in spans
+             if span.trace_id == trace_id and 'peak_rss' in span.attributes]
+    return max(peaks) if peaks else None
+
+
+def format_message(job_id: str, url: str) -> QueueMessage:
+    return QueueMessage.data_from({
+        'messageId': job_id,
+        'messageType': 'osw-format',
+        'publishedDate': datetime.now(timezone.utc).isoformat(),
+        'data': {'file_upload_path': url, 'tdei_project_group_id': 'benchmark'}
+    })
+
+
+def start_service(core: LocalCore, workers: int, **settings):
+    """
+    Runs OSWFomatterService on the local backend of `core` with `workers` worker processes and
+    `settings` overridden, returns it and the `Responses` it publishes.
+    """
+    from src.service.osw_formatter_service import OSWFomatterService
+    event_bus = OSWFomatterService._settings.event_bus
+    responses = Responses()
+    core.broker.subscription(event_bus.formatter_topic, 'benchmark')
+    threading.Thread(target=core.get_topic(event_bus.formatter_topic).subscribe,
+                     args=('benchmark', responses.receive), daemon=True).start()
+    with patch.multiple(OSWFomatterService._settings, backend='local',
+                        local_storage_directory=core.get_storage_client().root_dir,
+                        worker_pool_size=workers, **settings):
+        service = OSWFomatterService()
+    return service, responses
+
+
+class Benchmark:
+    def __init__(self, work_dir: str, workers: int, timeout: float):
+        self.workers = workers
+        self.timeout = timeout
+        self.storage_dir = os.path.join(work_dir, 'storage')
+        self.core = LocalCore(root_dir=self.storage_dir)
+        self.storage = self.core.get_storage_client()
+        self.container_name = os.environ['CONTAINER_NAME']
+        self.exporter = configure_tracing('memory').exporter
+        self.service = None
+        self.worker_pool = None
+        self.responses = None
+
+    def upload(self, path: str) -> str:
+        file = self.storage.get_container(self.container_name).create_file(f'inputs/{os.path.basename(path)}')
+        with open(path, 'rb') as data:
+            file.upload(data)
+        return file.get_remote_url()
+
+    def run_format(self, url: str, job_id: str) -> bool:
+        from src.osw_format import OSWFormat
+        from src.worker_pool import WorkerPool
+        if self.workers > 0 and self.worker_pool is None:
+            self.worker_pool = WorkerPool(size=self.workers)
+        formatter = OSWFormat(file_path=url, storage_client=self.storage, prefix=job_id, worker_pool=self.worker_pool)
+        try:
+            result = formatter.format()
+            return bool(result and result.status and result.error is None)
+        finally:
+            OSWFormat.clean_up(os.path.join(formatter.download_dir, job_id))
+
+    def start_service(self):
+        self.service, self.responses = start_service(self.core, self.workers, tracing_exporter='memory')
+        self.exporter = get_tracer().exporter
+
+    def run_service(self, url: str, job_id: str) -> bool:
+        if self.service is None:
+            self.start_service()
+        self.core.get_topic(self.service._settings.event_bus.validation_topic).publish(format_message(job_id, url))
+        return bool(self.responses.wait(job_id, self.timeout).data.get('success'))
+
+    def run(self, mode: str, url: str) -> dict:
+        job_id = f'benchmark-{uuid.uuid4().hex[:12]}'
+        with get_tracer().span('benchmark', mode=mode, job_id=job_id) as root:
+            start_time = time.perf_counter()
+            try:
+                success = self.run_format(url, job_id) if mode == 'format' else self.run_service(url, job_id)
+                error = None
+            except Exception as e:
+                success, error = False, f'{type(e).__name__}: {e}'
+            wall_time = time.perf_counter() - start_time
+        spans = self.exporter.get_finished_spans()
+        trace_id = root.trace_id
+        if mode == 'service':
+            # The service ends its job span after publishing the response
+            deadline = time.monotonic() + JOB_SPAN_WAIT
+            while job_trace_id(spans, job_id) is None and time.monotonic() < deadline:
+                time.sleep(0.01)
+                spans = self.exporter.get_finished_spans()
+            trace_id = job_trace_id(spans, job_id)
+        self.exporter.clear()
+        return {
+            'wall_time': wall_time,
+            'stages': trace_stages(spans, trace_id),
+            'peak_rss': worker_peak_rss(spans, trace_id) or process_peak_rss(),
+            'success': success,
+            'error': error,
+        }
+
+    def close(self):
+        if self.service is not None:
+            self.service.stop_listening()
+        if self.worker_pool is not None:
+            self.worker_pool.shutdown()
+        self.core.close()
+
+
+def summarize(name: str, mode: str, input_format: str, nodes: int, input_size: int, runs: list) -> dict:
+    """Medians of the runs of one input and mode, the peak RSS is the highest of the runs."""
+    stage_names = sorted({stage for run in runs for stage in run['stages']})
+    return {
+        'name': name,
+        'mode': mode,
+        'format': input_format,
+        'nodes': nodes,
+        'input_size': input_size,
+        'wall_time': statistics.median(run['wall_time'] for run in runs),
+        'stages': {stage: statistics.median(run['stages'].get(stage, 0.0) for run in runs) for stage in stage_names},
+        'peak_rss': max(run['peak_rss'] for run in runs),
+        'success': all(run['success'] for run in runs),
+        'errors': sorted({run['error'] for run in runs if run['error']}),
+        'runs': runs,
+    }
+
+
+def find_regressions(report: dict, baseline: dict, max_regression: float) -> list:
+    """Descriptions of the results of `report` that are worse than the same results of `baseline`."""
+    baseline_results = {result['name']: result for result in baseline.get('results', [])}
+    regressions = []
+    for result in report['results']:
+        previous = baseline_results.get(result['name'])
+        if previous is None:
+            continue
+        if previous['success'] and not result['success']:
+            regressions.append(f'{result["name"]}: failed, the baseline succeeded')
+            continue
+        for metric in ('wall_time', 'peak_rss'):
+            current, reference = result.get(metric), previous.get(metric)
+            if current and reference and current > reference * (1 + max_regression):
+                regressions.append(f'{result["name"]}: {metric} {current:g} is {current / reference - 1:.0%}'
+                                   f' above the baseline {reference:g}')
+    return regressions
+
+
+def environment() -> dict:
+    import osm_osw_reformatter
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'python-ms-core': Core.__version__,
+        'osm-osw-reformatter': osm_osw_reformatter.__version__,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000], help='nodes per input')
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=FORMATS)
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=1, help='worker processes, 0 converts inline')
+    parser.add_argument('--timeout', type=float, default=3600, help='seconds to wait for a response of the service')
+    parser.add_argument('--report', help='path of the JSON report')
+    parser.add_argument('--baseline', help='report of an earlier run to compare with')
+    parser.add_argument('--max-regression', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix='osw-formatter-benchmark-')
+    benchmark = Benchmark(work_dir, args.workers, args.timeout)
+    results = []
+    print(f'{"input":<22}{"mode":<9}{"size KB":>10}{"wall s":>9}{"peak RSS MB":>13}  stages')
+    try:
+        for nodes in args.sizes:
+            for input_format in args.formats:
+                path = WRITERS[input_format](os.path.join(work_dir, f'grid-{nodes}.{input_format}'), nodes)
+                url = benchmark.upload(path)
+                for mode in args.modes:
+                    runs = [benchmark.run(mode, url) for _ in range(args.repeat)]
+                    result = summarize(f'{mode}/{input_format}/{nodes}', mode, input_format, nodes,
+                                       os.path.getsize(path), runs)
+                    results.append(result)
+                    stages = ', '.join(f'{stage} {seconds:.2f}s' for stage, seconds in result['stages'].items())
+                    status = '' if result['success'] else f' FAILED {"; ".join(result["errors"])}'
+                    print(f'{os.path.basename(path):<22}{mode:<9}{result["input_size"] / 1024:>10.0f}'
+                          f'{result["wall_time"]:>9.2f}{result["peak_rss"] / 1024 / 1024:>13.0f}  {stages}{status}')
+    finally:
+        benchmark.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'environment': environment(),
+        'options': {'repeat': args.repeat, 'workers': args.workers},
+        'results': results,
+    }
+    if args.baseline:
+        with open(args.baseline) as file:
+            report['regressions'] = find_regressions(report, json.load(file), args.max_regression)
+        for regression in report['regressions']:
+            print(f'Regression {regression}')
+    if args.report:
+        with open(args.report, 'w') as file:
+            json.dump(report, file, indent=2)
+    return 1 if report.get('regressions') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
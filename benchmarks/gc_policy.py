@@ -0,0 +1,86 @@
+"""
+Compares per-message latency of the former garbage collection behaviour, a full
+gc.collect() at every step of a message, with the RSS-threshold policy.
+
+    python -m benchmarks.gc_policy [--messages N] [--features N] [--retained N]
+
+Each message builds and drops a GeoJSON-like object graph of `--features` features,
+while `--retained` long-lived objects stand in for modules, clients and caches that
+every full collection has to scan again.
+"""
+import gc
+import sys
+import time
+import argparse
+import statistics
+from src.memory_policy import MemoryPolicy, GCMonitor
+
+# gc.collect() calls per message before the policy: OSWFormat.clean_up, the end of
+# format (or process_on_demand_format) and send_status (or send_on_demand_response)
+COLLECTS_PER_MESSAGE = 3
+
+
+def build_retained(count):
+    return [{'id': i, 'tags': {'highway': 'footway'}, 'nodes': [i, i + 1]} for i in range(count)]
+
+
+def convert(features):
+    collection = {'type': 'FeatureCollection', 'features': []}
+    for i in range(features):
+        feature = {
+            'type': 'Feature',
+            'properties': {'_id': str(i), 'highway': 'footway', 'collection': collection},
+            'geometry': {'type': 'LineString', 'coordinates': [[i * 0.1, i * 0.2], [i * 0.3, i * 0.4]]},
+        }
+        collection['features'].append(feature)
+    # The back reference makes the graph cyclic, like the converter's node and way indexes
+    return len(collection['features'])
+
+
+def run(mode, messages, features, policy):
+    monitor = GCMonitor()
+    monitor.install()
+    latencies = []
+    try:
+        for _ in range(messages):
+            start_time = time.perf_counter()
+            convert(features)
+            if mode == 'collect':
+                for _ in range(COLLECTS_PER_MESSAGE):
+                    gc.collect()
+            else:
+                policy.after_job()
+            latencies.append(time.perf_counter() - start_time)
+    finally:
+        monitor.uninstall()
+    return latencies, monitor.stats()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=50)
+    parser.add_argument('--features', type=int, default=20000)
+    parser.add_argument('--retained', type=int, default=1000000)
+    parser.add_argument('--rss-threshold', type=int, default=1024 * 1024 * 1024)
+    args = parser.parse_args(argv)
+
+    retained = build_retained(args.retained)
+    print(f'{args.messages} messages of {args.features} features, {len(retained)} retained objects')
+    print(f'{"mode":<10}{"mean ms":>10}{"p50 ms":>10}{"p95 ms":>10}{"gc runs":>9}{"gc pause s":>12}{"max pause ms":>14}')
+    modes = [('collect', None),
+             ('policy', MemoryPolicy(rss_threshold=args.rss_threshold, freeze=False)),
+             ('freeze', MemoryPolicy(rss_threshold=args.rss_threshold, freeze=True))]
+    for mode, policy in modes:
+        if policy is not None and policy.freeze:
+            policy.start()
+            policy.stop()
+        latencies, stats = run(mode, args.messages, args.features, policy)
+        latencies = sorted(latency * 1000 for latency in latencies)
+        p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+        print(f'{mode:<10}{statistics.mean(latencies):>10.1f}{statistics.median(latencies):>10.1f}{p95:>10.1f}'
+              f'{sum(stats["collections"]):>9}{stats["pause_time"]:>12.3f}{stats["max_pause"] * 1000:>14.1f}')
+    gc.unfreeze()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,230 @@
+"""
+Soak test of the service for memory retained across jobs.
+
+    python -m benchmarks.soak [--jobs N] [--nodes N] [--kinds format on_demand] [--formats osm zip]
+                              [--workers N] [--in-flight N] [--warmup N] [--snapshot-every N]
+                              [--max-growth-per-job BYTES] [--report soak.json]
+
+Runs `--jobs` small conversions, alternating between the given kinds and input formats,
+through OSWFomatterService on the local backend: queue messages for `format` and on-demand
+requests for `process_on_demand_format`. After `--warmup` jobs, and then every
+`--snapshot-every` jobs, the service is drained, a full collection runs and a tracemalloc
+snapshot is taken, so only memory that is still referenced counts.
+
+Retained memory per job is the slope of the traced memory over the completed jobs. The report
+lists it with the RSS per job and the call sites that allocated most of the growth; the exit
+status is 1 when the growth per job is above `--max-growth-per-job`. Only the service process
+is traced, conversions in worker processes are not (`--workers 0` converts in the service).
+"""
+import gc
+import os
+import sys
+import json
+import uuid
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+from collections import deque
+from datetime import datetime, timezone
+from benchmarks.end_to_end import WRITERS, format_message, start_service, environment
+from python_ms_core.core.queue.models.queue_message import QueueMessage
+from src.local_backend import LocalCore
+from src.memory_policy import current_rss
+
+KINDS = ['format', 'on_demand']
+# Allocations of the import system and of tracemalloc itself are not retained by jobs
+IGNORED_FILES = ('<frozen importlib._bootstrap>', '<frozen importlib._bootstrap_external>', '<unknown>',
+                 tracemalloc.__file__)
+
+
+def slope(points) -> float:
+    """Least squares slope of (x, y) points, 0 for fewer than two distinct x."""
+    if len(points) < 2:
+        return 0.0
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if not variance:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+
+class LeakDetector:
+    """
+    Takes tracemalloc snapshots as jobs complete. The first snapshot is the baseline, growth
+    per job is the slope of the traced memory over all of them, and the call sites that grew
+    most are found by comparing the last snapshot with the baseline.
+    """
+
+    def __init__(self, frames: int = 10):
+        self.frames = frames
+        self.samples = []
+        self.baseline = None
+        self.last = None
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+    def stop(self):
+        tracemalloc.stop()
+
+    def snapshot(self, jobs: int):
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, filename) for filename in IGNORED_FILES]
+        )
+        traced = sum(stat.size for stat in snapshot.statistics('filename'))
+        self.samples.append({'jobs': jobs, 'traced': traced, 'rss': current_rss()})
+        if self.baseline is None:
+            self.baseline = snapshot
+        self.last = snapshot
+
+    def growth_per_job(self) -> float:
+        return slope([(sample['jobs'], sample['traced']) for sample in self.samples])
+
+    def rss_per_job(self) -> float:
+        return slope([(sample['jobs'], sample['rss']) for sample in self.samples if sample['rss'] is not None])
+
+    def top(self, count: int = 10) -> list:
+        """Call sites whose retained memory grew most since the baseline."""
+        if self.baseline is None or self.last is self.baseline:
+            return []
+        jobs = self.samples[-1]['jobs'] - self.samples[0]['jobs']
+        sites = []
+        for stat in self.last.compare_to(self.baseline, 'traceback')[:count]:
+            if stat.size_diff <= 0:
+                break
+            sites.append({
+                'size_diff': stat.size_diff,
+                'count_diff': stat.count_diff,
+                'per_job': stat.size_diff / jobs if jobs else None,
+                'traceback': stat.traceback.format(limit=self.frames, most_recent_first=True),
+            })
+        return sites
+
+
+def on_demand_message(job_id: str, url: str, source: str) -> QueueMessage:
+    return QueueMessage.data_from({
+        'messageId': job_id,
+        'messageType': 'osw_formatter_on_demand',
+        'publishedDate': datetime.now(timezone.utc).isoformat(),
+        'data': {'sourceUrl': url, 'jobId': job_id, 'source': source, 'target': 'osm' if source == 'osw' else 'osw'}
+    })
+
+
+class Soak:
+    def __init__(self, work_dir: str, workers: int, in_flight: int, timeout: float):
+        self.in_flight = in_flight
+        self.timeout = timeout
+        self.core = LocalCore(root_dir=os.path.join(work_dir, 'storage'))
+        self.service, self.responses = start_service(self.core, workers, tracing_exporter='none')
+        self.requests = self.core.get_topic(self.service._settings.event_bus.validation_topic)
+        self.pending = deque()
+        self.completed = 0
+        self.failed = 0
+
+    def upload(self, path: str) -> str:
+        container = self.core.get_storage_client().get_container(self.service.container_name)
+        file = container.create_file(f'inputs/{os.path.basename(path)}')
+        with open(path, 'rb') as data:
+            file.upload(data)
+        return file.get_remote_url()
+
+    def submit(self, kind: str, url: str, source: str):
+        job_id = f'soak-{uuid.uuid4().hex[:12]}'
+        message = format_message(job_id, url) if kind == 'format' else on_demand_message(job_id, url, source)
+        self.requests.publish(message)
+        self.pending.append(job_id)
+        while len(self.pending) >= self.in_flight:
+            self.complete_one()
+
+    def complete_one(self):
+        response = self.responses.wait(self.pending.popleft(), self.timeout)
+        self.completed += 1
+        if not response.data.get('success'):
+            self.failed += 1
+
+    def drain(self):
+        while self.pending:
+            self.complete_one()
+
+    def close(self):
+        self.drain()
+        self.service.stop_listening()
+        self.core.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=2000)
+    parser.add_argument('--nodes', type=int, default=100, help='nodes per input')
+    parser.add_argument('--kinds', nargs='+', choices=KINDS, default=KINDS)
+    parser.add_argument('--formats', nargs='+', choices=list(WRITERS), default=['osm', 'zip'])
+    parser.add_argument('--workers', type=int, default=1, help='worker processes, 0 converts inline')
+    parser.add_argument('--in-flight', type=int, default=4, help='jobs queued or running at a time')
+    parser.add_argument('--warmup', type=int, default=100, help='jobs before the baseline snapshot')
+    parser.add_argument('--snapshot-every', type=int, default=250)
+    parser.add_argument('--max-growth-per-job', type=float, default=1024, help='bytes')
+    parser.add_argument('--frames', type=int, default=10, help='frames kept per allocation')
+    parser.add_argument('--timeout', type=float, default=600, help='seconds to wait for a response')
+    parser.add_argument('--report', help='path of the JSON report')
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix='osw-formatter-soak-')
+    detector = LeakDetector(frames=args.frames)
+    soak = None
+    try:
+        soak = Soak(work_dir, args.workers, args.in_flight, args.timeout)
+        inputs = []
+        for input_format in args.formats:
+            path = WRITERS[input_format](os.path.join(work_dir, f'soak.{input_format}'), args.nodes)
+            inputs.append((soak.upload(path), 'osw' if input_format == 'zip' else 'osm'))
+        jobs = [(kind, url, source) for kind in args.kinds for url, source in inputs]
+
+        detector.start()
+        print(f'{"jobs":>7}{"traced MB":>11}{"RSS MB":>9}{"failed":>8}')
+        for i in range(args.jobs):
+            soak.submit(*jobs[i % len(jobs)])
+            submitted = i + 1
+            if submitted >= args.warmup and (submitted - args.warmup) % args.snapshot_every == 0 \
+                    or submitted == args.jobs:
+                soak.drain()
+                detector.snapshot(soak.completed)
+                sample = detector.samples[-1]
+                print(f'{sample["jobs"]:>7}{sample["traced"] / 1024 / 1024:>11.2f}'
+                      f'{(sample["rss"] or 0) / 1024 / 1024:>9.0f}{soak.failed:>8}')
+    finally:
+        if soak is not None:
+            soak.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    growth = detector.growth_per_job()
+    top = detector.top()
+    detector.stop()
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'environment': environment(),
+        'options': vars(args),
+        'jobs': soak.completed,
+        'failed': soak.failed,
+        'samples': detector.samples,
+        'growth_per_job': growth,
+        'rss_per_job': detector.rss_per_job(),
+        'max_growth_per_job': args.max_growth_per_job,
+        'top': top,
+        'leak': growth > args.max_growth_per_job,
+    }
+    print(f'Retained {growth:.0f} bytes per job (bound {args.max_growth_per_job:g}),'
+          f' RSS {report["rss_per_job"]:.0f} bytes per job')
+    for site in top:
+        print(f'{site["size_diff"] / 1024:>10.1f} KB {site["count_diff"]:>+8} blocks  {site["traceback"][0].strip()}')
+    if args.report:
+        with open(args.report, 'w') as file:
+            json.dump(report, file, indent=2)
+    return 1 if report['leak'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
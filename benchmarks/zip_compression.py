@@ -0,0 +1,74 @@
+"""
+Compares zip compression ratio and wall time across deflate levels and worker counts.
+
+    python -m benchmarks.zip_compression [files or .zip archives ...]
+
+Archives are extracted first and their members benchmarked. Without arguments the
+OSW GeoJSON files in tests/unit_tests/test_files/osw.zip are used.
+"""
+import os
+import sys
+import time
+import shutil
+import zipfile
+import argparse
+import tempfile
+from src.zip_writer import write_zip, STORED, DEFLATED
+
+DEFAULT_INPUT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'tests', 'unit_tests', 'test_files', 'osw.zip')
+LEVELS = [1, 3, 6, 9]
+
+
+def collect_files(paths, work_dir):
+    files = []
+    for path in paths:
+        if zipfile.is_zipfile(path):
+            extract_dir = tempfile.mkdtemp(dir=work_dir)
+            with zipfile.ZipFile(path) as archive:
+                for member in archive.infolist():
+                    if member.is_dir() or member.filename.startswith('__MACOSX'):
+                        continue
+                    files.append(archive.extract(member, extract_dir))
+        else:
+            files.append(path)
+    return files
+
+
+def run(files, work_dir, compression, level, workers, repeat):
+    output = os.path.join(work_dir, 'benchmark.zip')
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        write_zip(output, files, compression=compression, level=level, workers=workers)
+        timings.append(time.perf_counter() - start_time)
+    size = os.path.getsize(output)
+    os.remove(output)
+    return size, min(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='*', default=[DEFAULT_INPUT])
+    parser.add_argument('--workers', type=int, nargs='+', default=sorted({1, os.cpu_count() or 1}))
+    parser.add_argument('--levels', type=int, nargs='+', default=LEVELS)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        files = collect_files(args.paths, work_dir)
+        total = sum(os.path.getsize(file) for file in files)
+        print(f'{len(files)} files, {total / 1024 / 1024:.1f} MB')
+        print(f'{"compression":<12}{"level":>6}{"workers":>8}{"size MB":>10}{"ratio":>8}{"seconds":>10}{"MB/s":>9}')
+        runs = [(STORED, 0, 1)] + [(DEFLATED, level, workers) for level in args.levels for workers in args.workers]
+        for compression, level, workers in runs:
+            size, seconds = run(files, work_dir, compression, level, workers, args.repeat)
+            print(f'{compression:<12}{level:>6}{workers:>8}{size / 1024 / 1024:>10.2f}{total / size:>8.2f}'
+                  f'{seconds:>10.3f}{total / 1024 / 1024 / seconds:>9.1f}')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
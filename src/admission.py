@@ -0,0 +1,164 @@
+import os
+import shutil
+import logging
+import threading
+from dataclasses import dataclass
+
+logger = logging.getLogger('osw-formatter')
+
+# Rough peak memory and disk needed per input byte, by input extension.
+# .pbf is densely compressed and expands the most, a .zip of OSW GeoJSON the least.
+MEMORY_FACTORS = {'.pbf': 12, '.osm': 3, '.xml': 3, '.zip': 4}
+DISK_FACTORS = {'.pbf': 15, '.osm': 3, '.xml': 3, '.zip': 6}
+DEFAULT_FACTOR = 10
+
+
+@dataclass
+class JobEstimate:
+    memory: int = 0
+    disk: int = 0
+
+
+def _meminfo(field: str):
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith(f'{field}:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def available_memory() -> int:
+    """Memory available to this container: MemAvailable, capped by the cgroup limit when one is set."""
+    available = _meminfo('MemAvailable')
+    cgroup_available = _cgroup_available_memory()
+    if cgroup_available is not None:
+        available = cgroup_available if available is None else min(available, cgroup_available)
+    return available
+
+
+def total_memory() -> int:
+    """Memory of this container: MemTotal, capped by the cgroup limit when one is set."""
+    total = _meminfo('MemTotal')
+    cgroup = _cgroup_memory()
+    if cgroup is not None:
+        total = cgroup[0] if total is None else min(total, cgroup[0])
+    return total
+
+
+def _cgroup_memory():
+    """(limit, usage) of the container's memory cgroup, None without a limit."""
+    for limit_path, usage_path in (
+        ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory.current'),
+        ('/sys/fs/cgroup/memory/memory.limit_in_bytes', '/sys/fs/cgroup/memory/memory.usage_in_bytes'),
+    ):
+        try:
+            with open(limit_path) as limit_file, open(usage_path) as usage_file:
+                limit = limit_file.read().strip()
+                usage = int(usage_file.read().strip())
+        except (OSError, ValueError):
+            continue
+        # cgroup v1 reports "no limit" as a huge number
+        if limit == 'max' or int(limit) >= 1 << 60:
+            return None
+        return int(limit), usage
+    return None
+
+
+def _cgroup_available_memory():
+    cgroup = _cgroup_memory()
+    if cgroup is None:
+        return None
+    limit, usage = cgroup
+    return max(limit - usage, 0)
+
+
+def available_disk(path: str) -> int:
+    return shutil.disk_usage(path).free
+
+
+def directory_size(path: str) -> int:
+    """Bytes of the job directories under `path`, the caches in its dot directories are left out."""
+    total = 0
+    for root, directories, files in os.walk(path):
+        directories[:] = [directory for directory in directories if not directory.startswith('.')]
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+
+class AdmissionController:
+    """
+    Decides how many jobs run at the same time from what they are expected to need.
+    A job is admitted when its estimated memory and disk fit in what is free, its estimate and
+    the reservations of running jobs fit in what jobs can use in all, both with a fixed
+    headroom, and fewer than `max_jobs` are running.
+    A job is always admitted when nothing else is running, so huge inputs run one at a time
+    instead of never.
+    """
+
+    def __init__(self, max_jobs: int, directory: str, memory_reserve: int = 0, disk_reserve: int = 0,
+                 poll_interval: float = 5):
+        self.max_jobs = max_jobs
+        self.directory = directory
+        self.memory_reserve = memory_reserve
+        self.disk_reserve = disk_reserve
+        self.poll_interval = poll_interval
+        self._condition = threading.Condition()
+        self._running = []
+
+    @staticmethod
+    def estimate(file_path: str, size) -> JobEstimate:
+        _, ext = os.path.splitext(file_path or '')
+        size = int(size or 0)
+        return JobEstimate(
+            memory=size * MEMORY_FACTORS.get(ext.lower(), DEFAULT_FACTOR),
+            disk=size * DISK_FACTORS.get(ext.lower(), DEFAULT_FACTOR)
+        )
+
+    @property
+    def running(self) -> int:
+        return len(self._running)
+
+    def acquire(self, estimate: JobEstimate) -> JobEstimate:
+        with self._condition:
+            waiting = False
+            while not self._fits(estimate):
+                if not waiting:
+                    logger.info(f' Waiting for resources, {self.running} jobs running, job needs {estimate}')
+                    waiting = True
+                # Also re-check on a timer, memory and disk are freed outside of this controller
+                self._condition.wait(self.poll_interval)
+            self._running.append(estimate)
+        return estimate
+
+    def release(self, estimate: JobEstimate):
+        with self._condition:
+            self._running.remove(estimate)
+            self._condition.notify_all()
+
+    def _fits(self, estimate: JobEstimate) -> bool:
+        if not self._running:
+            return True
+        if len(self._running) >= self.max_jobs:
+            return False
+        # What is free already excludes what running jobs use so far. The new job has to fit in
+        # what is free now, and all reservations together in what jobs could use at all: the
+        # memory of the container, and the free disk plus what the download directory holds.
+        memory = available_memory()
+        if memory is not None and estimate.memory + self.memory_reserve > memory:
+            return False
+        total = total_memory()
+        reserved_memory = sum(job.memory for job in self._running)
+        if total is not None and estimate.memory + reserved_memory + self.memory_reserve > total:
+            return False
+        disk = available_disk(self.directory)
+        if estimate.disk + self.disk_reserve > disk:
+            return False
+        reserved_disk = sum(job.disk for job in self._running)
+        return estimate.disk + reserved_disk + self.disk_reserve <= disk + directory_size(self.directory)
@@ -0,0 +1,87 @@
+import time
+import logging
+import threading
+
+logger = logging.getLogger('osw-formatter')
+
+
+class _Pending:
+    def __init__(self, data):
+        self.data = data
+        self.created = time.monotonic()
+        self.done = threading.Event()
+        self.error = None
+
+
+class BatchPublisher:
+    """
+    Collects messages published from many threads and hands them to `send_batch` together.
+    A batch is sent once it holds `max_batch_size` messages or its oldest message has waited
+    `max_delay` seconds; messages published while a batch is being sent go into the next one.
+    `publish` returns only after its batch was sent and raises if sending failed, so callers
+    keep the delivery guarantees of a direct publish. `close` sends everything still pending.
+    """
+
+    def __init__(self, send_batch, max_batch_size: int = 50, max_delay: float = 0.05):
+        self.send_batch = send_batch
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.batches_sent = 0
+        self.messages_sent = 0
+        self._pending = []
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def publish(self, data):
+        pending = _Pending(data)
+        with self._condition:
+            if self._closed:
+                pending = None
+            else:
+                self._pending.append(pending)
+                self._condition.notify_all()
+        if pending is None:
+            # Published after shutdown, send on its own rather than losing it
+            self.send_batch([data])
+            return
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                deadline = self._pending[0].created + self.max_delay
+                while len(self._pending) < self.max_batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = self._pending[:self.max_batch_size]
+                del self._pending[:self.max_batch_size]
+            self._send(batch)
+
+    def _send(self, batch):
+        try:
+            self.send_batch([pending.data for pending in batch])
+            self.batches_sent += 1
+            self.messages_sent += len(batch)
+        except Exception as e:
+            logger.error(f' Failed to publish a batch of {len(batch)} messages: {e}')
+            for pending in batch:
+                pending.error = e
+        finally:
+            for pending in batch:
+                pending.done.set()
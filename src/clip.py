@@ -0,0 +1,115 @@
+import osmium
+from shapely.geometry import Point, box, shape
+from shapely.ops import unary_union
+from shapely.prepared import prep
+from .tiling import RelationCollector, is_relevant_way
+
+
+def clip_area(polygon):
+    """
+    Geometry of a request's `polygon`: a GeoJSON geometry, Feature or FeatureCollection, or a
+    `[west, south, east, north]` bounding box. None when the request has no polygon.
+    """
+    if not polygon:
+        return None
+    if isinstance(polygon, (list, tuple)):
+        return box(*polygon)
+    if polygon.get('type') == 'FeatureCollection':
+        return unary_union([shape(feature['geometry']) for feature in polygon['features']])
+    if polygon.get('type') == 'Feature':
+        return shape(polygon['geometry'])
+    return shape(polygon)
+
+
+class _WaySelector(osmium.SimpleHandler):
+    """Ways with a node in the area, with the node references of those and of relation members."""
+
+    def __init__(self, inside, members):
+        super().__init__()
+        self.inside = inside
+        self.members = members
+        self.ways = set()
+        self.nodes = set()
+        self.member_refs = {}
+        self.member_inside = set()
+
+    def way(self, w):
+        relevant = is_relevant_way(w.tags)
+        member = w.id in self.members
+        if not relevant and not member:
+            return
+        refs = [node.ref for node in w.nodes]
+        inside = any(node.location.valid() and self.inside(node.location) for node in w.nodes)
+        if member:
+            self.member_refs[w.id] = refs
+            if inside:
+                self.member_inside.add(w.id)
+        if relevant and inside:
+            self.ways.add(w.id)
+            self.nodes.update(refs)
+
+
+class _ClipWriter(osmium.SimpleHandler):
+    def __init__(self, writer, inside, nodes, ways, relations):
+        super().__init__()
+        self.writer = writer
+        self.inside = inside
+        self.nodes = nodes
+        self.ways = ways
+        self.relations = relations
+        self.count = {'nodes': 0, 'ways': 0, 'relations': 0}
+
+    def node(self, n):
+        # Tagged nodes in the area become points or loose nodes
+        if n.id in self.nodes or len(n.tags) and n.location.valid() and self.inside(n.location):
+            self.writer.add_node(n)
+            self.count['nodes'] += 1
+
+    def way(self, w):
+        if w.id in self.ways:
+            self.writer.add_way(w)
+            self.count['ways'] += 1
+
+    def relation(self, r):
+        if r.id in self.relations:
+            self.writer.add_relation(r)
+            self.count['relations'] += 1
+
+
+def clip(file_path: str, output_path: str, area) -> dict:
+    """
+    Writes the part of an OSM file the conversion of `area` needs to `output_path`: relevant ways
+    with a node in the area and all their nodes, multipolygon relations with a member way in the
+    area and all their member ways, and tagged nodes in the area. Everything else is dropped, so
+    the conversion reads only the area of interest. Returns the number of elements written.
+    """
+    area = prep(area)
+
+    def inside(location) -> bool:
+        return area.intersects(Point(location.lon, location.lat))
+
+    relations = RelationCollector()
+    relations.apply_file(file_path)
+    selector = _WaySelector(inside, relations.members)
+    selector.apply_file(file_path, locations=True)
+
+    ways = selector.ways
+    nodes = selector.nodes
+    kept_relations = set()
+    for relation_id, members in relations.relations.items():
+        if not any(way_id in selector.member_inside for way_id in members):
+            continue
+        kept_relations.add(relation_id)
+        for way_id in members:
+            if way_id in selector.member_refs:
+                ways.add(way_id)
+                nodes.update(selector.member_refs[way_id])
+    del relations, selector
+
+    writer = osmium.SimpleWriter(output_path)
+    try:
+        clip_writer = _ClipWriter(writer, inside, nodes, ways, kept_relations)
+        clip_writer.apply_file(file_path)
+    finally:
+        writer.close()
+    return clip_writer.count
@@ -18,6 +18,60 @@ class Settings(BaseSettings):
     app_name: str = 'python-osw-formatter'
     event_bus = EventBusSettings()
     max_concurrent_messages: int = os.environ.get('MAX_CONCURRENT_MESSAGES', 2)
+    download_chunk_size: int = os.environ.get('DOWNLOAD_CHUNK_SIZE', 4 * 1024 * 1024)
+    download_retries: int = os.environ.get('DOWNLOAD_RETRIES', 3)
+    parallel_download_threshold: int = os.environ.get('PARALLEL_DOWNLOAD_THRESHOLD', 256 * 1024 * 1024)
+    parallel_download_workers: int = os.environ.get('PARALLEL_DOWNLOAD_WORKERS', 4)
+    upload_block_size: int = os.environ.get('UPLOAD_BLOCK_SIZE', 8 * 1024 * 1024)
+    upload_concurrency: int = os.environ.get('UPLOAD_CONCURRENCY', 4)
+    upload_max_in_flight: int = os.environ.get('UPLOAD_MAX_IN_FLIGHT', 64 * 1024 * 1024)
+    upload_retries: int = os.environ.get('UPLOAD_RETRIES', 3)
+    publish_batch_size: int = os.environ.get('PUBLISH_BATCH_SIZE', 50)
+    publish_batch_delay: float = os.environ.get('PUBLISH_BATCH_DELAY', 0.05)
+    handle_max_age: int = os.environ.get('HANDLE_MAX_AGE', 60 * 60)
+    download_cache_size: int = os.environ.get('DOWNLOAD_CACHE_SIZE', 0)
+    result_cache_enabled: bool = os.environ.get('RESULT_CACHE_ENABLED', False)
+    worker_pool_size: int = os.environ.get('WORKER_POOL_SIZE', os.environ.get('MAX_CONCURRENT_MESSAGES', 2))
+    worker_max_tasks_per_child: int = os.environ.get('WORKER_MAX_TASKS_PER_CHILD', 10)
+    job_memory_limit: int = os.environ.get('JOB_MEMORY_LIMIT', 0)
+    job_cpu_time_limit: int = os.environ.get('JOB_CPU_TIME_LIMIT', 0)
+    zip_compression: str = os.environ.get('ZIP_COMPRESSION', 'deflated')
+    zip_compression_level: int = os.environ.get('ZIP_COMPRESSION_LEVEL', 6)
+    zip_workers: int = os.environ.get('ZIP_WORKERS', 4)
+    zip_streaming: bool = os.environ.get('ZIP_STREAMING', True)
+    fast_lane_max_size: int = os.environ.get('FAST_LANE_MAX_SIZE', 64 * 1024 * 1024)
+    fast_lane_workers: int = os.environ.get('FAST_LANE_WORKERS', 2)
+    bulk_lane_workers: int = os.environ.get('BULK_LANE_WORKERS', 1)
+    conversion_timeout_base: float = os.environ.get('CONVERSION_TIMEOUT_BASE', 5 * 60)
+    conversion_seconds_per_mb_osm: float = os.environ.get('CONVERSION_SECONDS_PER_MB_OSM', 30)
+    conversion_seconds_per_mb_osw: float = os.environ.get('CONVERSION_SECONDS_PER_MB_OSW', 10)
+    conversion_timeout_max: float = os.environ.get('CONVERSION_TIMEOUT_MAX', 4 * 60 * 60)
+    progress_interval: float = os.environ.get('PROGRESS_INTERVAL', 0)
+    admission_control_enabled: bool = os.environ.get('ADMISSION_CONTROL_ENABLED', True)
+    admission_max_jobs: int = os.environ.get('ADMISSION_MAX_JOBS', 8)
+    admission_memory_reserve: int = os.environ.get('ADMISSION_MEMORY_RESERVE', 512 * 1024 * 1024)
+    admission_disk_reserve: int = os.environ.get('ADMISSION_DISK_RESERVE', 1024 * 1024 * 1024)
+    gc_rss_threshold: int = os.environ.get('GC_RSS_THRESHOLD', 1024 * 1024 * 1024)
+    gc_freeze: bool = os.environ.get('GC_FREEZE', True)
+    tracing_exporter: str = os.environ.get('TRACING_EXPORTER', 'none')
+    tracing_file: str = os.environ.get('TRACING_FILE', '')
+    clip_to_polygon: bool = os.environ.get('CLIP_TO_POLYGON', False)
+    tiled_conversion: bool = os.environ.get('TILED_CONVERSION', False)
+    tiled_conversion_threshold: int = os.environ.get('TILED_CONVERSION_THRESHOLD', 256 * 1024 * 1024)
+    tiled_conversion_tiles: int = os.environ.get('TILED_CONVERSION_TILES', 0)
+    profile_slow_jobs: bool = os.environ.get('PROFILE_SLOW_JOBS', False)
+    profile_threshold: float = os.environ.get('PROFILE_THRESHOLD', 5 * 60)
+    profile_interval: float = os.environ.get('PROFILE_INTERVAL', 0.01)
+    profile_directory: str = os.environ.get('PROFILE_DIRECTORY', '')
+    backend: str = os.environ.get('BACKEND', 'azure')
+    local_storage_directory: str = os.environ.get('LOCAL_STORAGE_DIRECTORY', '')
+    local_topic_latency: float = os.environ.get('LOCAL_TOPIC_LATENCY', 0)
+
+    def get_receive_window(self) -> int:
+        """Messages handled at a time: the admission controller's ceiling when it decides, else MAX_CONCURRENT_MESSAGES."""
+        if self.admission_control_enabled:
+            return self.admission_max_jobs
+        return self.max_concurrent_messages
 
     def get_root_directory(self) -> str:
         return os.path.dirname(os.path.abspath(__file__))
@@ -26,3 +80,24 @@ class Settings(BaseSettings):
         root_dir = self.get_root_directory()
         parent_dir = os.path.dirname(root_dir)
         return os.path.join(parent_dir, 'downloads')
+
+    def get_download_cache_directory(self) -> str:
+        return os.path.join(self.get_download_directory(), '.cache')
+
+    def get_result_cache_directory(self) -> str:
+        return os.path.join(self.get_download_directory(), '.results')
+
+    def get_profile_directory(self) -> str:
+        if self.profile_directory:
+            return self.profile_directory
+        return os.path.join(os.path.dirname(self.get_root_directory()), 'profiles')
+
+    def get_local_storage_directory(self) -> str:
+        if self.local_storage_directory:
+            return self.local_storage_directory
+        return os.path.join(os.path.dirname(self.get_root_directory()), 'local_storage')
+
+    def get_tracing_file(self) -> str:
+        if self.tracing_file:
+            return self.tracing_file
+        return os.path.join(os.path.dirname(self.get_root_directory()), 'traces', 'spans.jsonl')
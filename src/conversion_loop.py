@@ -0,0 +1,118 @@
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger('osw-formatter')
+
+
+class ConversionTimeout(Exception):
+    # A timed out step keeps running on its executor thread, a fresh worker process frees it
+    retire_worker = True
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        super().__init__(f'Conversion did not finish within {timeout:g}s')
+
+    def __reduce__(self):
+        return ConversionTimeout, (self.timeout,)
+
+
+class ConversionLoop:
+    """
+    Long lived event loop on a daemon thread that conversions are submitted to, instead of
+    creating and tearing down a loop per message. The loop's default executor, which runs
+    the blocking steps of the reformatter, is shared by all conversions.
+    A conversion is cancelled when it exceeds its timeout or its future is cancelled; its
+    blocking step still runs to the end on the executor thread, the steps after it do not.
+    """
+
+    def __init__(self, max_workers: int = None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='conversion')
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(self.executor)
+        self._futures = set()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='conversion-loop', daemon=True)
+        self._thread.start()
+
+    def submit(self, coroutine, timeout: float = None):
+        """Schedules `coroutine` on the loop, returns a concurrent future that can be cancelled."""
+        future = asyncio.run_coroutine_threadsafe(self._with_timeout(coroutine, timeout), self.loop)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._discard)
+        return future
+
+    def run(self, coroutine, timeout: float = None):
+        return self.submit(coroutine, timeout).result()
+
+    @property
+    def running(self) -> int:
+        with self._lock:
+            return len(self._futures)
+
+    def cancel_all(self):
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.cancel()
+        if futures:
+            logger.info(f' Cancelled {len(futures)} running conversions')
+
+    def close(self):
+        if self.loop.is_closed():
+            return
+        self.cancel_all()
+        asyncio.run_coroutine_threadsafe(self._cancel_tasks(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def _discard(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    @staticmethod
+    async def _with_timeout(coroutine, timeout):
+        try:
+            return await asyncio.wait_for(coroutine, timeout)
+        except asyncio.TimeoutError:
+            raise ConversionTimeout(timeout) from None
+
+    @staticmethod
+    async def _cancel_tasks():
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+_conversion_loop = None
+_conversion_loop_pid = None
+_conversion_loop_lock = threading.Lock()
+
+
+def get_conversion_loop() -> ConversionLoop:
+    """The conversion loop of this process, one per worker process and one for inline conversions."""
+    global _conversion_loop, _conversion_loop_pid
+    with _conversion_loop_lock:
+        # A forked child inherits the object but not the loop thread
+        if _conversion_loop is None or _conversion_loop_pid != os.getpid():
+            _conversion_loop = ConversionLoop()
+            _conversion_loop_pid = os.getpid()
+        return _conversion_loop
+
+
+def close_conversion_loop():
+    global _conversion_loop
+    with _conversion_loop_lock:
+        conversion_loop, _conversion_loop = _conversion_loop, None
+    if conversion_loop is not None and _conversion_loop_pid == os.getpid():
+        conversion_loop.close()
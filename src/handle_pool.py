@@ -0,0 +1,109 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from .metrics import HANDLES_CREATED, HANDLES_REUSED, HANDLES_RECYCLED
+
+logger = logging.getLogger('osw-formatter')
+
+
+class _Entry:
+    def __init__(self, handle):
+        self.handle = handle
+        self.created = time.monotonic()
+        self.lock = threading.Lock()
+        self.healthy = True
+
+
+class HandlePool:
+    """
+    Creates long lived clients (storage containers, topics) once per key and shares them
+    across worker threads. A handle is recycled, closed and created again, when it is older
+    than `max_age` seconds or when an operation on it failed. Keys are `(kind, name)` tuples,
+    the metrics count handles by kind.
+    """
+
+    def __init__(self, max_age: float = None):
+        self.max_age = max_age
+        self.created = 0
+        self.reused = 0
+        self.recycled = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, factory):
+        return self._get_entry(key, factory).handle
+
+    @contextmanager
+    def lease(self, key, factory, exclusive: bool = False):
+        """
+        Yields the handle for `key`. With `exclusive`, no other thread uses the handle meanwhile,
+        for clients that are not thread safe. The handle is recycled if the block raises.
+        """
+        entry = self._get_entry(key, factory)
+        if exclusive:
+            entry.lock.acquire()
+        try:
+            yield entry.handle
+        except Exception:
+            entry.healthy = False
+            raise
+        finally:
+            if exclusive:
+                entry.lock.release()
+
+    def invalidate(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                entry.healthy = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'created': self.created, 'reused': self.reused, 'recycled': self.recycled}
+
+    def close(self):
+        with self._lock:
+            entries, self._entries = list(self._entries.values()), {}
+        for entry in entries:
+            _close(entry.handle)
+
+    def _get_entry(self, key, factory) -> _Entry:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.healthy and not self._expired(entry):
+                self.reused += 1
+                HANDLES_REUSED.inc(kind=_kind(key))
+                return entry
+            if entry is not None:
+                self.recycled += 1
+                HANDLES_RECYCLED.inc(kind=_kind(key))
+                logger.info(f' Recycling {key} after {time.monotonic() - entry.created:.0f}s'
+                            f'{"" if entry.healthy else " (failed)"}')
+            entry, stale = _Entry(factory()), entry
+            self._entries[key] = entry
+            self.created += 1
+            HANDLES_CREATED.inc(kind=_kind(key))
+        if stale is not None:
+            # Wait for an exclusive user of the old handle to finish before closing it
+            with stale.lock:
+                _close(stale.handle)
+        return entry
+
+    def _expired(self, entry: _Entry) -> bool:
+        return self.max_age is not None and time.monotonic() - entry.created > self.max_age
+
+
+def _kind(key) -> str:
+    return str(key[0] if isinstance(key, tuple) else key)
+
+
+def _close(handle):
+    # Topics of python-ms-core hold a sender and a client, storage handles have nothing to close
+    for closeable in (handle, getattr(handle, 'publisher', None), getattr(handle, 'client', None)):
+        close = getattr(closeable, 'close', None)
+        if callable(close):
+            try:
+                close()
+            except Exception as e:
+                logger.warning(f' Unable to close {closeable}: {e}')
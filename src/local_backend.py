@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from python_ms_core.core.queue.models.queue_message import QueueMessage
+from src.storage import LocalStorageClient
+
+logger = logging.getLogger('osw-formatter')
+
+# Seconds a blocked subscription waits for a message before checking whether it was closed
+POLL_INTERVAL = 0.1
+# Deliveries of a message whose handling fails before it is dropped, the default of a Service Bus subscription
+MAX_DELIVERY_COUNT = 10
+
+
+class LocalBroker:
+    """
+    Topics and subscriptions of one process. Every subscription of a topic gets its own copy
+    of each message published to it. Messages published to a topic that has no subscription
+    yet are kept for its first one, like a Service Bus subscription created with the topic.
+    """
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._backlog = {}
+        self._lock = threading.Lock()
+
+    def publish(self, topic_name: str, message: QueueMessage):
+        # Serialized like a Service Bus message, the receiver never shares the sender's object
+        body = json.dumps(QueueMessage.to_dict(message))
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(topic_name, {}).values())
+            if not subscriptions:
+                self._backlog.setdefault(topic_name, []).append(body)
+        for subscription in subscriptions:
+            subscription.put(body)
+
+    def subscription(self, topic_name: str, subscription_name: str) -> queue.Queue:
+        with self._lock:
+            subscriptions = self._subscriptions.setdefault(topic_name, {})
+            if subscription_name not in subscriptions:
+                subscriptions[subscription_name] = queue.Queue()
+                for body in self._backlog.pop(topic_name, []):
+                    subscriptions[subscription_name].put(body)
+            return subscriptions[subscription_name]
+
+    def pending(self, topic_name: str) -> int:
+        """Messages of `topic_name` that no subscriber has received yet."""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(topic_name, {}).values())
+            return sum(subscription.qsize() for subscription in subscriptions) + len(self._backlog.get(topic_name, []))
+
+
+class InProcessTopic:
+    """
+    Topic of a `LocalBroker` with the interface of AzureTopic: `subscribe` blocks, handling up
+    to `max_concurrent_messages` messages at a time on its own threads. Each publish and each
+    delivery waits `latency` seconds, standing in for the round trip to the broker. A message
+    whose callback raises is handed back and delivered again, like an abandoned Service Bus
+    message, up to MAX_DELIVERY_COUNT times.
+    """
+
+    def __init__(self, broker: LocalBroker, topic_name: str, max_concurrent_messages: int = None, latency: float = 0):
+        self.broker = broker
+        self.topic_name = topic_name
+        self.max_concurrent_messages = max(int(max_concurrent_messages or os.cpu_count() or 1), 1)
+        self.latency = float(latency)
+        self._closed = threading.Event()
+
+    def publish(self, data: QueueMessage):
+        if self.latency:
+            time.sleep(self.latency)
+        self.broker.publish(self.topic_name, data)
+
+    def subscribe(self, subscription: str, callback):
+        messages = self.broker.subscription(self.topic_name, subscription)
+        slots = threading.BoundedSemaphore(self.max_concurrent_messages)
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_messages,
+                                thread_name_prefix=f'{self.topic_name}-{subscription}') as executor:
+            while not self._closed.is_set():
+                if not slots.acquire(timeout=POLL_INTERVAL):
+                    continue
+                try:
+                    body = messages.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    slots.release()
+                    continue
+                # Handed back messages carry their delivery count
+                body, deliveries = body if isinstance(body, tuple) else (body, 0)
+                executor.submit(self._receive, messages, body, deliveries + 1, callback) \
+                    .add_done_callback(lambda _: slots.release())
+
+    def close(self):
+        """Ends `subscribe` once the messages it has received are handled."""
+        self._closed.set()
+
+    def _receive(self, messages: queue.Queue, body: str, deliveries: int, callback):
+        if self.latency:
+            time.sleep(self.latency)
+        try:
+            callback(QueueMessage.data_from(body))
+        except Exception as e:
+            if deliveries < MAX_DELIVERY_COUNT:
+                logger.warning(f' Error in processing message of {self.topic_name}, delivering it again: {e}')
+                messages.put((body, deliveries))
+            else:
+                logger.error(f' Error in processing message of {self.topic_name}, dropped after '
+                             f'{deliveries} deliveries: {e}')
+
+
+class LocalCore:
+    """
+    Stand-in for python_ms_core.Core that needs no Azure account: containers are directories
+    under `root_dir` and topics are delivered within the process by `broker`.
+    """
+
+    def __init__(self, root_dir: str, latency: float = 0, broker: LocalBroker = None):
+        self.broker = broker or get_broker()
+        self.latency = latency
+        self.storage_client = LocalStorageClient(root_dir)
+        self._topics = []
+        self._lock = threading.Lock()
+
+    def get_topic(self, topic_name: str, max_concurrent_messages=None) -> InProcessTopic:
+        topic = InProcessTopic(self.broker, topic_name, max_concurrent_messages, self.latency)
+        with self._lock:
+            self._topics.append(topic)
+        return topic
+
+    def get_storage_client(self) -> LocalStorageClient:
+        return self.storage_client
+
+    def get_logger(self):
+        return logger
+
+    def close(self):
+        with self._lock:
+            topics, self._topics = self._topics, []
+        for topic in topics:
+            topic.close()
+
+
+_broker = LocalBroker()
+
+
+def get_broker() -> LocalBroker:
+    """The broker shared by every LocalCore of the process, so a load generator reaches the service's topics."""
+    return _broker
@@ -1,9 +1,10 @@
 import os
 import psutil
-from fastapi import FastAPI, APIRouter, Depends, status
+from fastapi import FastAPI, APIRouter, Depends, Response, status
 from functools import lru_cache
 from src.config import Settings
 from src.service.osw_formatter_service import OSWFomatterService
+from src.metrics import REGISTRY, CONTENT_TYPE
 
 app = FastAPI()
 app.formatter_service = None
@@ -64,4 +65,9 @@ def ping():
     return "I'm healthy !!"
 
 
+@app.get('/metrics', status_code=status.HTTP_200_OK)
+def metrics():
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
 app.include_router(prefix_router)
@@ -0,0 +1,109 @@
+import gc
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger('osw-formatter')
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes, 0 when it cannot be read."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class GCMonitor:
+    """Measures every collection of the process, automatic or explicit, through `gc.callbacks`."""
+
+    def __init__(self):
+        self.collections = [0, 0, 0]
+        self.pause_time = 0.0
+        self.max_pause = 0.0
+        self._lock = threading.Lock()
+        self._started = None
+
+    def install(self):
+        if self._callback not in gc.callbacks:
+            gc.callbacks.append(self._callback)
+
+    def uninstall(self):
+        if self._callback in gc.callbacks:
+            gc.callbacks.remove(self._callback)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'collections': list(self.collections), 'pause_time': self.pause_time, 'max_pause': self.max_pause}
+
+    def _callback(self, phase, info):
+        # Collections run with the GIL held, start and stop always come from the same thread
+        if phase == 'start':
+            self._started = time.perf_counter()
+        elif self._started is not None:
+            pause = time.perf_counter() - self._started
+            self._started = None
+            with self._lock:
+                self.collections[info['generation']] += 1
+                self.pause_time += pause
+                self.max_pause = max(self.max_pause, pause)
+
+
+class MemoryPolicy:
+    """
+    Decides when a finished job pays for a full collection. The converter's object graphs
+    are mostly freed by reference counting, a full collection only helps once cycles pile up,
+    so it runs when the process RSS reaches `rss_threshold` bytes (0 never collects explicitly).
+    With `freeze`, objects alive at startup (modules, settings, clients) are moved out of the
+    collector's reach so automatic collections stop scanning them.
+    """
+
+    def __init__(self, rss_threshold: int = 0, freeze: bool = True, monitor: GCMonitor = None):
+        self.rss_threshold = rss_threshold
+        self.freeze = freeze
+        self.monitor = monitor or GCMonitor()
+        self.collected = 0
+        self.skipped = 0
+        self.collect_time = 0.0
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.monitor.install()
+        if self.freeze:
+            gc.collect()
+            gc.freeze()
+            logger.info(f' Froze {gc.get_freeze_count()} startup objects out of garbage collection')
+
+    def stop(self):
+        self.monitor.uninstall()
+
+    def after_job(self) -> bool:
+        """Runs a full collection if the process is over the RSS threshold, returns whether it did."""
+        rss = current_rss()
+        if not self.rss_threshold or rss < self.rss_threshold:
+            with self._lock:
+                self.skipped += 1
+            return False
+        start_time = time.perf_counter()
+        collected = gc.collect()
+        pause = time.perf_counter() - start_time
+        with self._lock:
+            self.collected += 1
+            self.collect_time += pause
+        logger.info(f' RSS {rss / 1024 / 1024:.0f} MB over the threshold, collected {collected} objects'
+                    f' in {pause * 1000:.1f}ms')
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            average_pause = self.collect_time / self.collected if self.collected else 0.0
+            return {
+                'collected': self.collected,
+                'skipped': self.skipped,
+                'collect_time': self.collect_time,
+                # What the skipped collections would have cost at the measured average pause
+                'estimated_time_saved': self.skipped * average_pause,
+                'gc': self.monitor.stats(),
+            }
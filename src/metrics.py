@@ -0,0 +1,181 @@
+import math
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Seconds, from a fast publish to the longest conversions
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200, math.inf)
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, tuple(zip(self.labelnames, key)), value) for key, value in self._values.items()]
+
+    def collect(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for name, labels, value in self._samples():
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError('Counters can only increase')
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        if self.buckets[-1] != math.inf:
+            self.buckets += (math.inf,)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the duration of the block, also when it raises."""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            counts, _ = self._values.get(self._key(labels), ([0], 0.0))
+            return counts[-1]
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                labels = tuple(zip(self.labelnames, key))
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((f'{self.name}_bucket', labels + (('le', _format_value(bound)),), count))
+                samples.append((f'{self.name}_sum', labels, total))
+                samples.append((f'{self.name}_count', labels, counts[-1]))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric):
+        with self._lock:
+            if any(existing.name == metric.name for existing in self._metrics):
+                raise ValueError(f'Metric {metric.name} is already registered')
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics)
+        return '\n'.join(metric.collect() for metric in metrics) + '\n'
+
+
+def queue_lag(published_date) -> float:
+    """Seconds since `published_date` of a queue message, None when it is missing or not a date."""
+    if not published_date:
+        return None
+    try:
+        published = datetime.fromisoformat(str(published_date).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if published.tzinfo is None:
+        published = published.replace(tzinfo=timezone.utc)
+    return max((datetime.now(timezone.utc) - published).total_seconds(), 0.0)
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = Histogram('osw_formatter_stage_seconds', 'Duration of a job stage in seconds', ['stage'])
+DOWNLOADED_BYTES = Counter('osw_formatter_downloaded_bytes_total', 'Bytes of source files downloaded')
+UPLOADED_BYTES = Counter('osw_formatter_uploaded_bytes_total', 'Bytes of converted files uploaded')
+JOBS_IN_FLIGHT = Gauge('osw_formatter_jobs_in_flight', 'Jobs being processed', ['kind'])
+JOBS_TOTAL = Counter('osw_formatter_jobs_total', 'Finished jobs', ['kind', 'outcome'])
+QUEUE_LAG_SECONDS = Histogram('osw_formatter_queue_lag_seconds',
+                              'Seconds between a message being published and being received')
+HANDLES_CREATED = Counter('osw_formatter_handles_created_total', 'Shared clients created', ['kind'])
+HANDLES_REUSED = Counter('osw_formatter_handles_reused_total', 'Times a shared client was reused', ['kind'])
+HANDLES_RECYCLED = Counter('osw_formatter_handles_recycled_total', 'Shared clients closed and created again', ['kind'])
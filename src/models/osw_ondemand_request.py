@@ -1,6 +1,7 @@
 # Message containing on demand request for osw formatting
 
 from dataclasses import dataclass
+from typing import Optional, Union
 
 
 @dataclass
@@ -9,6 +10,9 @@ class RequestData:
     jobId: str
     source: str
     target: str
+    # GeoJSON geometry, Feature or FeatureCollection, or [west, south, east, north], to clip the input to
+    polygon: Optional[Union[dict, list]] = None
+
     # Type of job id is string
     def __post_init__(self):
         self.jobId = str(self.jobId)
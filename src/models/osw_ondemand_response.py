@@ -23,4 +23,7 @@ class OSWOnDemandResponse:
     data: ResponseData
 
     def __post_init__(self):
+        # Responses are built from the request data, the request's polygon is not echoed back
+        if isinstance(self.data, dict):
+            self.data = {key: value for key, value in self.data.items() if key != 'polygon'}
         self.data = ResponseData(**self.data)
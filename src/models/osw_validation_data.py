@@ -8,6 +8,7 @@ class OSWValidationData:
         self._file_upload_path = data.get('file_upload_path', '')
         self._source_url = data.get('file_upload_path', '')
         self._formatted_url = data.get('formatted_url', None)
+        self._polygon = data.get('polygon', None)
         self._success = data.get('success', False)
         self._message = data.get('message', '')
 
@@ -29,6 +30,12 @@ class OSWValidationData:
     @formatted_url.setter
     def formatted_url(self, value): self._formatted_url = value
 
+    @property
+    def polygon(self): return self._polygon
+
+    @polygon.setter
+    def polygon(self, value): self._polygon = value
+
     @property
     def success(self): return self._success
 
@@ -42,7 +49,8 @@ class OSWValidationData:
     def message(self, value): self._message = value
 
     def to_json(self):
-        return to_json(self.__dict__)
+        # The polygon is an input of the request, the status does not echo it back
+        return to_json({key: value for key, value in self.__dict__.items() if key != '_polygon'})
 
 
 def remove_underscore(string: str):
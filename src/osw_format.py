@@ -1,13 +1,30 @@
+import io
 import os
-import gc
+import json
 import time
+import hashlib
 import shutil
-import logging
-import zipfile
 import asyncio
+import logging
+import threading
 import traceback
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from .config import Settings
+from .storage import BlobReader, DownloadCache, download_to_file, file_digest
+from .result_cache import CachedResponse, OSM_TO_OSW, OSW_TO_OSM
+from .resource_limits import ResourceLimits, ResourceUsage, run_limited
+from .zip_writer import write_zip, rename_members, ZipStream
+from .conversion_loop import get_conversion_loop
+from .progress import ProgressReporter
+from .metrics import STAGE_SECONDS, DOWNLOADED_BYTES
+from .tracing import span
+from .profiler import ProfileOptions, SlowJobProfiler
+from . import tiling
+from .clip import clip, clip_area
 from osm_osw_reformatter import Formatter
+from osm_osw_reformatter.osm2osw.osm2osw import OSM2OSW
+from osm_osw_reformatter.helpers.response import Response
 import uuid
 
 logging.basicConfig()
@@ -15,14 +32,53 @@ logger = logging.getLogger('osw-formatter')
 logger.setLevel(logging.INFO)
 
 AVAILABLE_EXTENSIONS = ['.zip', '.pbf', '.xml', '.osm']
+# Seconds a worker process gets past the conversion timeout before it is killed
+WORKER_TIMEOUT_GRACE = 30
 
 
 async def async_format(formatter):
     return await formatter.osm2osw()
 
 
+async def async_osw2osm(formatter):
+    # osw2osm is synchronous, on the executor it gets the same timeout and cancellation as osm2osw
+    return await asyncio.get_running_loop().run_in_executor(None, formatter.osw2osm)
+
+
+def convert(file_path, workdir, prefix, timeout=None, profile: ProfileOptions = None):
+    """Converts a downloaded file, .zip (OSW) to OSM or OSM to OSW. Runs inline or in a worker process."""
+    formatter = Formatter(workdir=workdir, file_path=file_path, prefix=prefix)
+    _, ext = os.path.splitext(file_path)
+    with SlowJobProfiler(profile):
+        if ext.lower() == '.zip':
+            return get_conversion_loop().run(async_osw2osm(formatter), timeout=timeout)
+        return get_conversion_loop().run(async_format(formatter), timeout=timeout)
+
+
+def convert_tile(tile, workdir, timeout=None):
+    """Converts one tile of `tiling.split` and keeps the part of its output the tile owns."""
+    response = convert(tile['path'], workdir, 'tile', timeout)
+    if response.status and response.generated_files:
+        tiling.keep_owned(response.generated_files, tile['ownership'])
+    return response
+
+
 class OSWFormat:
-    def __init__(self, file_path=None, storage_client=None, prefix=None):
+    _settings = Settings()
+    _download_cache = None
+    _download_cache_lock = threading.Lock()
+    result_cache = None
+    result_key = None
+    worker_pool = None
+    resource_usage = None
+    progress_callback = None
+    profile_path = None
+    polygon = None
+    source_file = None
+    downloaded_file_path = None
+
+    def __init__(self, file_path=None, storage_client=None, prefix=None, result_cache=None, worker_pool=None,
+                 progress_callback=None, polygon=None):
         settings = Settings()
         self.download_dir = settings.get_download_directory()
         is_exists = os.path.exists(self.download_dir)
@@ -33,62 +89,309 @@ class OSWFormat:
         self.storage_client = storage_client
         self.file_path = file_path
         self.file_relative_path = file_path.split('/')[-1]
-        self.client = self.storage_client.get_container(container_name=self.container_name)
         if prefix:
             self.prefix = prefix
         else:
             self.prefix = self.get_unique_id()
+        self.result_cache = result_cache
+        self.worker_pool = worker_pool
+        self.progress_callback = progress_callback
+        self.polygon = polygon
 
     def format(self):
         start_time = time.time()
         root, ext = os.path.splitext(self.file_relative_path)
         if ext and ext.lower() in AVAILABLE_EXTENSIONS:
-            downloaded_file_path = self.download_single_file(self.file_path)
+            with STAGE_SECONDS.time(stage='download'), span('download', file_path=self.file_path):
+                downloaded_file_path = self.download_single_file(self.file_path)
             if downloaded_file_path is None:
                 logger.error(f' Failed to download file from path: {self.file_path}')
                 raise Exception('Failed to download file')
-
-            # get the parent folder for downloaded_file_path
-            unique_download_path = os.path.dirname(downloaded_file_path)
+            self.downloaded_file_path = downloaded_file_path
+            logger.info(f' Downloaded file path: {os.path.dirname(downloaded_file_path)}')
             try:
-                logger.info(f' Downloaded file path: {unique_download_path}')
-                formatter = Formatter(workdir=unique_download_path, file_path=downloaded_file_path, prefix=self.prefix)
-                if ext.lower() == '.zip':
-                    formatter_response = formatter.osw2osm()
-                else:
-                    formatter_response = asyncio.run(asyncio.wait_for(async_format(formatter), timeout=60 * 60))
-                end_time = time.time()
-                logger.info(f' Time taken to format: {end_time - start_time}')
-                return formatter_response
+                cached_response = self.get_cached_result(downloaded_file_path, ext)
             except Exception as err:
                 traceback.print_exc()
                 logger.error(f' Error While Formatting File: {str(err)}')
                 raise err
+            if cached_response:
+                return cached_response
+            return self.format_downloaded(start_time)
         else:
             logger.error(f' Failed to format because unknown file format')
             raise Exception('Unknown file format')
 
-    def download_single_file(self, file_upload_path=None) -> str:
-        file = self.storage_client.get_file_from_url(self.container_name, file_upload_path)
+    def format_downloaded(self, start_time=None):
+        """
+        Converts the file downloaded by `format`, without looking it up in the result cache. Used
+        as well when a cached result turns out to be unusable, the file is not downloaded again.
+        """
+        start_time = start_time or time.time()
+        _, ext = os.path.splitext(self.file_relative_path)
+        downloaded_file_path = self.downloaded_file_path
+        # get the parent folder for downloaded_file_path
+        unique_download_path = os.path.dirname(downloaded_file_path)
         try:
-            if file.file_path:
-                file_path = os.path.basename(file.file_path)
-                unique_directory = os.path.join(self.download_dir, self.prefix)
-                if not os.path.exists(unique_directory):
-                    os.makedirs(unique_directory)
-                local_download_path = os.path.join(unique_directory, file_path)
-
-                with open(local_download_path, 'wb') as blob:
-                    blob.write(file.get_stream())
-
-                logger.info(f' File downloaded to location: {local_download_path}')
-                return local_download_path
+            downloaded_file_path = self.clip_input(downloaded_file_path, unique_download_path, ext)
+            timeout = self.get_conversion_timeout(os.path.getsize(downloaded_file_path), ext)
+            profile = self.get_profile_options()
+            with STAGE_SECONDS.time(stage='conversion'), \
+                    span('conversion', direction=OSW_TO_OSM if ext.lower() == '.zip' else OSM_TO_OSW,
+                         input_size=os.path.getsize(downloaded_file_path), timeout=timeout) as conversion_span, \
+                    ProgressReporter(self.progress_callback, self._settings.progress_interval,
+                                     downloaded_file_path, unique_download_path, timeout):
+                try:
+                    if self.worker_pool:
+                        formatter_response = None
+                        if self.use_tiles(os.path.getsize(downloaded_file_path), ext):
+                            formatter_response = self.convert_tiled(downloaded_file_path, unique_download_path,
+                                                                    timeout)
+                        if formatter_response is None:
+                            # The worker times out the conversion itself, the pool kills it if it cannot
+                            formatter_response, self.resource_usage = self.worker_pool.run_with_timeout(
+                                timeout + WORKER_TIMEOUT_GRACE, run_limited, self.get_resource_limits(), convert,
+                                downloaded_file_path, unique_download_path, self.prefix, timeout, profile
+                            )
+                        logger.info(f' Conversion resource usage: {self.resource_usage}')
+                        conversion_span.set_attribute('peak_rss', self.resource_usage.peak_rss)
+                        conversion_span.set_attribute('cpu_time', self.resource_usage.cpu_time)
+                    else:
+                        formatter_response = convert(downloaded_file_path, unique_download_path, self.prefix,
+                                                     timeout, profile)
+                finally:
+                    # Written by whichever process ran the conversion, only when it was slow
+                    if profile is not None and os.path.exists(profile.path):
+                        self.profile_path = profile.path
+                        conversion_span.set_attribute('profile', profile.path)
+            end_time = time.time()
+            logger.info(f' Time taken to format: {end_time - start_time}')
+            return formatter_response
+        except Exception as err:
+            traceback.print_exc()
+            logger.error(f' Error While Formatting File: {str(err)}')
+            raise err
+
+    def clip_input(self, file_path, workdir, ext) -> str:
+        """Clips an OSM input to the request's polygon and returns the path of the file to convert."""
+        area = clip_area(self.polygon) if self._settings.clip_to_polygon else None
+        if area is None or ext.lower() == '.zip':
+            return file_path
+        # Same file name, the names of the converted files follow it
+        clipped_path = os.path.join(workdir, 'clipped', os.path.basename(file_path))
+        os.makedirs(os.path.dirname(clipped_path), exist_ok=True)
+        input_size = os.path.getsize(file_path)
+        timeout = self.get_conversion_timeout(input_size, ext)
+        with STAGE_SECONDS.time(stage='clip'), span('clip', input_size=input_size) as clip_span:
+            if self.worker_pool:
+                count, _ = self.worker_pool.run_with_timeout(
+                    timeout + WORKER_TIMEOUT_GRACE, run_limited, self.get_resource_limits(), clip, file_path,
+                    clipped_path, area
+                )
             else:
-                logger.info(' File not found!')
+                count = clip(file_path, clipped_path, area)
+            clip_span.set_attribute('output_size', os.path.getsize(clipped_path))
+        logger.info(f' Clipped {file_path} to the request polygon, kept {count}')
+        return clipped_path
+
+    def use_tiles(self, size, ext) -> bool:
+        return self._settings.tiled_conversion and ext.lower() != '.zip' \
+            and size >= self._settings.tiled_conversion_threshold
+
+    def convert_tiled(self, file_path, workdir, timeout):
+        """
+        Converts an OSM file as spatial tiles in parallel on the worker pool and merges them into
+        the files a single conversion writes. Returns None when the file cannot be split.
+        """
+        limits = self.get_resource_limits()
+        tiles_dir = os.path.join(workdir, 'tiles')
+        tiles = self._settings.tiled_conversion_tiles or self.worker_pool.size
+        usages = []
+        try:
+            with span('split', tiles=tiles):
+                split_tiles, usage = self.worker_pool.run_with_timeout(
+                    timeout + WORKER_TIMEOUT_GRACE, run_limited, limits, tiling.split, file_path, tiles_dir, tiles
+                )
+            usages.append(usage)
+            if not split_tiles or len(split_tiles) < 2:
+                return None
+            logger.info(f' Converting {file_path} as {len(split_tiles)} tiles')
+
+            def run_tile(index):
+                return self.worker_pool.run_with_timeout(
+                    timeout + WORKER_TIMEOUT_GRACE, run_limited, limits, convert_tile, split_tiles[index],
+                    os.path.join(tiles_dir, str(index)), timeout
+                )
+
+            with ThreadPoolExecutor(max_workers=len(split_tiles)) as executor:
+                results = list(executor.map(run_tile, range(len(split_tiles))))
+            tile_files = []
+            for response, usage in results:
+                usages.append(usage)
+                if not response.status:
+                    return response
+                tile_files.append(response.generated_files or [])
+
+            filename = OSM2OSW(prefix=self.prefix, osm_file=file_path, workdir=workdir).filename
+            with span('merge'):
+                generated_files, usage = self.worker_pool.run_with_timeout(
+                    timeout + WORKER_TIMEOUT_GRACE, run_limited, limits, tiling.merge, tile_files, workdir, filename
+                )
+            usages.append(usage)
+            return Response(status=True, generated_files=generated_files)
+        finally:
+            self.resource_usage = ResourceUsage(
+                peak_rss=max((usage.peak_rss for usage in usages), default=0),
+                cpu_time=sum(usage.cpu_time for usage in usages)
+            )
+            shutil.rmtree(tiles_dir, ignore_errors=True)
+
+    @classmethod
+    def get_resource_limits(cls) -> ResourceLimits:
+        return ResourceLimits(memory=cls._settings.job_memory_limit, cpu_time=cls._settings.job_cpu_time_limit)
+
+    def get_profile_options(self) -> ProfileOptions:
+        if not self._settings.profile_slow_jobs:
+            return None
+        return ProfileOptions(
+            path=os.path.join(self._settings.get_profile_directory(), f'{self.prefix}-{int(time.time())}.folded'),
+            threshold=self._settings.profile_threshold,
+            interval=self._settings.profile_interval
+        )
+
+    @classmethod
+    def get_conversion_timeout(cls, size, ext) -> float:
+        """A base allowance plus seconds per MB of input for the conversion direction, capped."""
+        if size is None:
+            return cls._settings.conversion_timeout_max
+        if ext.lower() == '.zip':
+            seconds_per_mb = cls._settings.conversion_seconds_per_mb_osw
+        else:
+            seconds_per_mb = cls._settings.conversion_seconds_per_mb_osm
+        timeout = cls._settings.conversion_timeout_base + int(size) / 1024 / 1024 * seconds_per_mb
+        return min(timeout, cls._settings.conversion_timeout_max)
+
+    def get_cached_result(self, downloaded_file_path, ext):
+        if self.result_cache is None:
+            return None
+        direction = OSW_TO_OSM if ext.lower() == '.zip' else OSM_TO_OSW
+        input_hash = file_digest(downloaded_file_path, algorithm='sha256').hex()
+        if self.polygon and self._settings.clip_to_polygon and direction == OSM_TO_OSW:
+            # A clipped conversion is a different result of the same input
+            polygon = json.dumps(self.polygon, sort_keys=True)
+            input_hash = hashlib.sha256(f'{input_hash}\n{polygon}'.encode('utf-8')).hexdigest()
+        self.result_key = self.result_cache.get_key(input_hash, direction)
+        entry = self.result_cache.get_entry(self.result_key)
+        if entry:
+            return CachedResponse(status=True, remote_url=entry['remote_url'], cache_key=self.result_key,
+                                  prefix=entry.get('prefix'))
+        return None
+
+    def rename_cached_result(self, cached: CachedResponse) -> str:
+        """
+        Downloads a cached output and renames its members from the prefix of the job that produced
+        it to this job's, returns the path of the renamed archive.
+        """
+        if not cached.prefix:
+            raise ValueError(f'Cached result {cached.remote_url} does not record its prefix')
+        file = self.get_file(cached.remote_url)
+        if file is None:
+            raise FileNotFoundError(f'Cached result {cached.remote_url} not found')
+        directory = os.path.join(self.download_dir, self.prefix, 'cached')
+        os.makedirs(directory, exist_ok=True)
+        _, extension = os.path.splitext(file.file_path)
+        cached_path = os.path.join(directory, f'{cached.prefix}{extension}')
+        renamed_path = os.path.join(directory, f'{self.prefix}{extension}')
+        with STAGE_SECONDS.time(stage='download'), span('download', file_path=cached.remote_url):
+            self.download(file, cached_path)
+        old_prefix = f'{cached.prefix}.'
+        rename_members(cached_path, renamed_path, lambda name: f'{self.prefix}.{name[len(old_prefix):]}'
+                       if name.startswith(old_prefix) else name)
+        os.remove(cached_path)
+        return renamed_path
+
+    def get_file(self, file_upload_path: str):
+        """
+        Storage entity of `file_upload_path`, None when the storage has no such file. The entity
+        of the source file is kept for the size and the download, on Azure every lookup lists
+        the whole container.
+        """
+        if file_upload_path == self.file_path and self.source_file is not None:
+            return self.source_file
+        file = self.storage_client.get_file_from_url(self.container_name, file_upload_path)
+        # The Azure client returns the entity class itself when no blob matches
+        if file is None or isinstance(file, type) or not file.file_path:
+            return None
+        if file_upload_path == self.file_path:
+            self.source_file = file
+        return file
+
+    def get_input_size(self):
+        """Size in bytes of the source file, or None when the storage does not report it."""
+        try:
+            file = self.get_file(self.file_path)
+            if file is None:
+                logger.warning(f' Unable to get the size of {self.file_path}: file not found')
+                return None
+            reader = BlobReader(file)
+            return reader.size if reader.supports_ranges else None
+        except Exception as e:
+            logger.warning(f' Unable to get the size of {self.file_path}: {e}')
+            return None
+
+    def download_single_file(self, file_upload_path=None) -> str:
+        file = self.get_file(file_upload_path)
+        if file is None:
+            logger.info(' File not found!')
+            return None
+        try:
+            file_path = os.path.basename(file.file_path)
+            unique_directory = os.path.join(self.download_dir, self.prefix)
+            if not os.path.exists(unique_directory):
+                os.makedirs(unique_directory)
+            local_download_path = os.path.join(unique_directory, file_path)
+
+            cache = self.get_download_cache()
+            cache_key = None
+            if cache:
+                etag = BlobReader(file).etag
+                if etag:
+                    cache_key = cache.get_key(f'{self.container_name}/{file.file_path}', etag)
+
+            if cache_key is None or not cache.fetch(cache_key, local_download_path):
+                self.download(file, local_download_path)
+                if cache_key:
+                    cache.store(cache_key, local_download_path)
+
+            logger.info(f' File downloaded to location: {local_download_path}')
+            return local_download_path
         except Exception as e:
             traceback.print_exc()
             logger.error(e)
 
+    def download(self, file, local_download_path: str):
+        download_to_file(
+            file,
+            local_download_path,
+            chunk_size=self._settings.download_chunk_size,
+            max_workers=self._settings.parallel_download_workers,
+            parallel_threshold=self._settings.parallel_download_threshold,
+            retries=self._settings.download_retries
+        )
+        DOWNLOADED_BYTES.inc(os.path.getsize(local_download_path))
+
+    @classmethod
+    def get_download_cache(cls):
+        if cls._settings.download_cache_size <= 0:
+            return None
+        with cls._download_cache_lock:
+            if cls._download_cache is None:
+                cls._download_cache = DownloadCache(
+                    cache_dir=cls._settings.get_download_cache_directory(),
+                    max_size=cls._settings.download_cache_size
+                )
+        return cls._download_cache
+
     @staticmethod
     def clean_up(path, download_dir=None):
         if os.path.isfile(path):
@@ -97,19 +400,35 @@ class OSWFormat:
         else:
             logger.info(f' Removing Folder: {path}')
             shutil.rmtree(path, ignore_errors=True)
-        gc.collect()
 
     def create_zip(self, files):
         dir_path = os.path.join(self.download_dir, self.prefix)
         zip_filename = os.path.join(dir_path, f'{self.prefix}.zip')
-        with zipfile.ZipFile(zip_filename, 'w') as zip_file:
-            for file in files:
-                # Add each file to the zip file
-                zip_file.write(file, os.path.basename(file))
+        write_zip(
+            zip_filename,
+            files,
+            compression=self._settings.zip_compression,
+            level=self._settings.zip_compression_level,
+            workers=self._settings.zip_workers
+        )
 
         for file in files:
             os.remove(file)
         return zip_filename
 
+    def stream_zip(self, files) -> io.BufferedReader:
+        """Like `create_zip`, but returns the archive as a stream produced while it is read, nothing is written to disk."""
+        zip_filename = os.path.join(self.download_dir, self.prefix, f'{self.prefix}.zip')
+        return io.BufferedReader(ZipStream(
+            files,
+            name=zip_filename,
+            # Compressing overlaps the upload, the zip stage counts only the time spent compressing
+            trace=partial(span, 'zip', files=len(files), streaming=True),
+            observe=partial(STAGE_SECONDS.observe, stage='zip'),
+            compression=self._settings.zip_compression,
+            level=self._settings.zip_compression_level,
+            workers=self._settings.zip_workers
+        ))
+
     def get_unique_id(self) -> str:
         return uuid.uuid1().hex[0:24]
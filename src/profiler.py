@@ -0,0 +1,124 @@
+import os
+import sys
+import time
+import logging
+import threading
+from typing import Optional
+from collections import Counter
+from dataclasses import dataclass
+
+logger = logging.getLogger('osw-formatter')
+
+# Samples whose innermost frame is in these modules are threads waiting for work, not doing it
+IDLE_MODULES = ('threading.py', 'queue.py', 'selectors.py', 'connection.py')
+
+
+@dataclass
+class ProfileOptions:
+    """Picklable settings of a slow job profile, so workers can profile the conversion they run."""
+    path: str
+    threshold: float
+    interval: float = 0.01
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler: a thread records the stack of every other thread of the process each
+    `interval` seconds. Stacks are counted in the folded format of flamegraph.pl and speedscope,
+    one `outer;...;inner count` line per distinct stack.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def write(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f'{stack} {count}\n')
+
+    def top(self, count: int = 5) -> list:
+        """The innermost frames seen most often, with their share of the samples."""
+        leaves = Counter()
+        for stack, samples in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += samples
+        total = sum(leaves.values()) or 1
+        return [(name, samples / total) for name, samples in leaves.most_common(count)]
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or frame.f_code.co_filename.endswith(IDLE_MODULES):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+
+class SlowJobProfiler:
+    """
+    Context manager that starts sampling once the block has run for `threshold` seconds and
+    writes the profile to `path` when the block ends, also when it raises. Jobs faster than
+    the threshold are not sampled at all.
+    """
+
+    def __init__(self, options: Optional[ProfileOptions]):
+        self.options = options
+        self.profiler = None
+        self._timer = None
+        self._lock = threading.Lock()
+        self._done = False
+
+    def __enter__(self):
+        if self.options is not None:
+            self._timer = threading.Timer(self.options.threshold, self._start)
+            self._timer.daemon = True
+            self._timer.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._timer is None:
+            return False
+        self._timer.cancel()
+        with self._lock:
+            self._done = True
+            profiler = self.profiler
+        if profiler is not None:
+            profiler.stop()
+            try:
+                profiler.write(self.options.path)
+                top = ', '.join(f'{name} {share:.0%}' for name, share in profiler.top())
+                logger.info(f' Job ran over {self.options.threshold:g}s, profile of {profiler.samples} samples'
+                            f' written to {self.options.path}. Top frames: {top}')
+            except OSError as e:
+                logger.warning(f' Unable to write profile to {self.options.path}: {e}')
+        return False
+
+    def _start(self):
+        with self._lock:
+            if self._done:
+                return
+            self.profiler = SamplingProfiler(self.options.interval)
+            self.profiler.start()
@@ -0,0 +1,169 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+import multiprocessing
+from typing import Optional
+from dataclasses import dataclass, asdict
+
+logger = logging.getLogger('osw-formatter')
+
+
+@dataclass
+class ConversionProgress:
+    elapsed: float
+    timeout: Optional[float]
+    input_size: int
+    # Offset of the converter in the input file, None once the input is parsed and closed
+    input_bytes_read: Optional[int]
+    output_bytes: int
+    # Features in the output files written so far
+    features_emitted: int = 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def input_position(path: str) -> Optional[int]:
+    """Read offset of `path` in this process or a worker process, None when no process has it open."""
+    path = os.path.realpath(path)
+    positions = []
+    for pid in [os.getpid()] + [child.pid for child in multiprocessing.active_children()]:
+        try:
+            fds = os.listdir(f'/proc/{pid}/fd')
+        except OSError:
+            continue
+        for fd in fds:
+            try:
+                if os.readlink(f'/proc/{pid}/fd/{fd}') != path:
+                    continue
+                with open(f'/proc/{pid}/fdinfo/{fd}') as fdinfo:
+                    positions.append(int(fdinfo.readline().split()[1]))
+            except (OSError, ValueError, IndexError):
+                continue
+    return max(positions) if positions else None
+
+
+def output_bytes(directory: str, exclude: str = None) -> int:
+    exclude = os.path.abspath(exclude) if exclude else None
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.abspath(os.path.join(root, name))
+            if path == exclude:
+                continue
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                continue
+    return total
+
+
+# Bytes that start one feature of an output file: a GeoJSON feature as the reformatter writes
+# it (json.dump with indent), or an element of OSM XML
+FEATURE_PATTERNS = {
+    '.geojson': (b'"type": "Feature"',),
+    '.xml': (b'<node ', b'<way ', b'<relation '),
+}
+
+
+class FeatureCounter:
+    """
+    Counts the features in the output files with `extension` at the top of `directory`, tile
+    outputs in sub directories are left out. Each file is read once, every count only reads
+    what was written since the previous one.
+    """
+
+    def __init__(self, directory: str, extension: str, exclude: str = None, chunk_size: int = 1024 * 1024):
+        self.directory = directory
+        self.extension = extension
+        self.patterns = FEATURE_PATTERNS[extension]
+        self.exclude = os.path.abspath(exclude) if exclude else None
+        self.chunk_size = chunk_size
+        # Path to (bytes read, features, last bytes read, which may hold the start of a pattern)
+        self._files = {}
+
+    def count(self) -> int:
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return sum(features for _, features, _ in self._files.values())
+        for name in names:
+            path = os.path.abspath(os.path.join(self.directory, name))
+            if path != self.exclude and name.lower().endswith(self.extension) and os.path.isfile(path):
+                self._count_file(path)
+        return sum(features for _, features, _ in self._files.values())
+
+    def _count_file(self, path: str):
+        offset, features, tail = self._files.get(path, (0, 0, b''))
+        try:
+            if os.path.getsize(path) < offset:
+                # Written again from the start
+                offset, features, tail = 0, 0, b''
+            with open(path, 'rb') as output_file:
+                output_file.seek(offset)
+                for chunk in iter(lambda: output_file.read(self.chunk_size), b''):
+                    data = tail + chunk
+                    # A pattern is longer than the tail, so none is counted twice
+                    features += sum(data.count(pattern) for pattern in self.patterns)
+                    tail = data[-(max(len(pattern) for pattern in self.patterns) - 1):]
+                    offset += len(chunk)
+        except OSError:
+            pass
+        self._files[path] = (offset, features, tail)
+
+
+class ProgressReporter:
+    """
+    Context manager that calls `callback(ConversionProgress)` every `interval` seconds while
+    a conversion of `input_path` into `output_dir` runs, so a slow conversion can be told apart
+    from a stuck one. Nothing is reported for conversions shorter than `interval`, and errors
+    of the callback are logged, never raised into the conversion.
+    """
+
+    def __init__(self, callback, interval: float, input_path: str, output_dir: str, timeout: float = None):
+        self.callback = callback
+        self.interval = interval
+        self.input_path = input_path
+        self.output_dir = output_dir
+        self.timeout = timeout
+        self.input_size = os.path.getsize(input_path) if os.path.exists(input_path) else 0
+        # An OSW zip is converted to OSM XML, anything else to OSW GeoJSON
+        self.features = FeatureCounter(output_dir, '.xml' if input_path.lower().endswith('.zip') else '.geojson',
+                                       exclude=input_path)
+        self._started = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._started = time.monotonic()
+        if self.callback is not None and self.interval and self.interval > 0:
+            # Reports run in the context of the conversion, so what they publish joins its trace
+            context = contextvars.copy_context()
+            self._thread = threading.Thread(target=context.run, args=(self._run,), daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        return False
+
+    def snapshot(self) -> ConversionProgress:
+        return ConversionProgress(
+            elapsed=round(time.monotonic() - self._started, 1),
+            timeout=self.timeout,
+            input_size=self.input_size,
+            input_bytes_read=input_position(self.input_path),
+            output_bytes=output_bytes(self.output_dir, exclude=self.input_path),
+            features_emitted=self.features.count()
+        )
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.callback(self.snapshot())
+            except Exception as e:
+                logger.warning(f' Unable to report conversion progress: {e}')
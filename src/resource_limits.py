@@ -0,0 +1,130 @@
+import math
+import signal
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+logger = logging.getLogger('osw-formatter')
+
+MB = 1024 * 1024
+
+
+@dataclass
+class ResourceLimits:
+    # Address space limit of the worker process in bytes, 0 for no limit
+    memory: int = 0
+    # CPU time limit of a single job in seconds, 0 for no limit
+    cpu_time: int = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.memory or self.cpu_time)
+
+
+@dataclass
+class ResourceUsage:
+    peak_rss: int = 0
+    cpu_time: float = 0.0
+
+    def __str__(self):
+        return f'peak RSS {self.peak_rss / MB:.0f} MB, CPU time {self.cpu_time:.1f}s'
+
+
+class ResourceLimitExceeded(Exception):
+    # The worker that ran the job is replaced, its heap and CPU time limit are not reusable
+    retire_worker = True
+
+    def __init__(self, limit: str, usage: ResourceUsage):
+        super().__init__(f'Conversion exceeded the {limit} limit ({usage})')
+        self.limit = limit
+        self.usage = usage
+
+    def __reduce__(self):
+        return type(self), (self.limit, self.usage)
+
+
+class _CPUTimeExceeded(BaseException):
+    pass
+
+
+def run_limited(limits: ResourceLimits, fn, *args, **kwargs):
+    """
+    Runs `fn` in the current (worker) process under `limits` and returns `(result, ResourceUsage)`.
+    A job that goes over a limit raises ResourceLimitExceeded with the usage measured so far.
+    """
+    if resource is None:
+        return fn(*args, **kwargs), ResourceUsage()
+
+    _reset_peak_rss()
+    cpu_start = _cpu_time()
+    previous_memory = resource.getrlimit(resource.RLIMIT_AS)
+    previous_cpu = resource.getrlimit(resource.RLIMIT_CPU)
+    previous_handler = signal.getsignal(signal.SIGXCPU)
+    try:
+        if limits.memory:
+            resource.setrlimit(resource.RLIMIT_AS, (_soft_limit(limits.memory, previous_memory), previous_memory[1]))
+        if limits.cpu_time:
+            signal.signal(signal.SIGXCPU, _raise_cpu_time_exceeded)
+            soft = _soft_limit(math.ceil(cpu_start + limits.cpu_time), previous_cpu)
+            resource.setrlimit(resource.RLIMIT_CPU, (soft, previous_cpu[1]))
+        try:
+            result = fn(*args, **kwargs)
+        except MemoryError:
+            if not limits.memory:
+                raise
+            limit = f'memory ({limits.memory / MB:.0f} MB)'
+        except _CPUTimeExceeded:
+            limit = f'CPU time ({limits.cpu_time}s)'
+        else:
+            return result, _usage(cpu_start)
+    finally:
+        resource.setrlimit(resource.RLIMIT_AS, previous_memory)
+        resource.setrlimit(resource.RLIMIT_CPU, previous_cpu)
+        signal.signal(signal.SIGXCPU, previous_handler)
+    usage = _usage(cpu_start)
+    logger.error(f' Conversion exceeded the {limit} limit ({usage})')
+    raise ResourceLimitExceeded(limit, usage)
+
+
+def _soft_limit(value: int, current: tuple) -> int:
+    hard = current[1]
+    return value if hard == resource.RLIM_INFINITY else min(value, hard)
+
+
+def _raise_cpu_time_exceeded(signum, frame):
+    raise _CPUTimeExceeded()
+
+
+def _cpu_time() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _reset_peak_rss():
+    # Resets VmHWM so that the peak covers this job only, not the whole life of the worker
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss() -> int:
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _usage(cpu_start: float) -> ResourceUsage:
+    return ResourceUsage(peak_rss=_peak_rss(), cpu_time=_cpu_time() - cpu_start)
@@ -0,0 +1,95 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Optional
+import osm_osw_reformatter
+from osm_osw_reformatter.helpers.response import Response
+
+logger = logging.getLogger('osw-formatter')
+
+OSM_TO_OSW = 'osm2osw'
+OSW_TO_OSM = 'osw2osm'
+
+
+@dataclass
+class CachedResponse(Response):
+    # Output of an earlier conversion of the same input, already uploaded to storage
+    remote_url: str = None
+    cache_key: str = None
+    # Prefix of the job that produced the output, its member names start with it
+    prefix: str = None
+
+
+class ResultCache:
+    """
+    Remembers where the output of a conversion was uploaded, keyed by
+    (input content hash, direction, osm-osw-reformatter version).
+    Each entry is a small JSON document in `cache_dir`.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def get_key(input_hash: str, direction: str, version: str = osm_osw_reformatter.__version__) -> str:
+        return hashlib.sha256(f'{input_hash}\n{direction}\n{version}'.encode('utf-8')).hexdigest()
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f'{key}.json')
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the remote url of the cached output, or None on a miss."""
+        entry = self.get_entry(key)
+        return entry['remote_url'] if entry else None
+
+    def get_entry(self, key: str) -> Optional[dict]:
+        """Returns the cache entry, with the remote url and the prefix of the output, or None on a miss."""
+        try:
+            with open(self.get_path(key)) as file:
+                entry = json.load(file)
+            if not entry['remote_url']:
+                entry = None
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            entry = None
+        with self._lock:
+            if entry:
+                self.hits += 1
+            else:
+                self.misses += 1
+        logger.info(f' Result cache {"hit" if entry else "miss"} for {key} ({self.hits} hits, {self.misses} misses)')
+        return entry
+
+    def put(self, key: str, remote_url: str, prefix: str = None):
+        temp_path = f'{self.get_path(key)}.{uuid.uuid4().hex}.tmp'
+        with open(temp_path, 'w') as entry:
+            json.dump({
+                'remote_url': remote_url,
+                'prefix': prefix,
+                'reformatter_version': osm_osw_reformatter.__version__,
+                'created': int(time.time())
+            }, entry)
+        os.replace(temp_path, self.get_path(key))
+
+    def invalidate(self, key: str):
+        try:
+            os.remove(self.get_path(key))
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0
+            }
@@ -0,0 +1,77 @@
+import time
+import logging
+import threading
+from typing import Optional
+from dataclasses import dataclass
+from .admission import JobEstimate
+from .metrics import Gauge
+
+logger = logging.getLogger('osw-formatter')
+
+FAST_LANE = 'fast'
+BULK_LANE = 'bulk'
+
+LANE_JOBS = Gauge('osw_formatter_lane_jobs', 'Jobs running or waiting in a lane', ['lane', 'state'])
+
+
+@dataclass
+class JobTicket:
+    lane: Optional[str] = None
+    estimate: Optional[JobEstimate] = None
+
+
+class LaneScheduler:
+    """
+    Routes jobs into a fast lane for inputs of at most `fast_max_size` bytes and a bulk lane
+    for everything else, including inputs of unknown size. Each lane has its own worker budget,
+    so small jobs never wait for a slot held by a long conversion.
+
+    A job waits for its lane in the process, holding the message it came with, so both lanes
+    together never run more jobs than the `max_jobs` messages received at a time: budgets
+    that would are cut down, keeping at least one slot per lane.
+    """
+
+    def __init__(self, fast_workers: int, bulk_workers: int, fast_max_size: int, max_jobs: int = None):
+        self.fast_max_size = fast_max_size
+        if max_jobs is not None and fast_workers + bulk_workers > max_jobs:
+            bulk = max(1, min(bulk_workers, max_jobs - 1))
+            fast = max(1, min(fast_workers, max_jobs - bulk))
+            logger.warning(f' Lane budgets of {fast_workers} fast and {bulk_workers} bulk jobs exceed the '
+                           f'{max_jobs} messages received at a time, using {fast} and {bulk}')
+            fast_workers, bulk_workers = fast, bulk
+        self.budgets = {FAST_LANE: fast_workers, BULK_LANE: bulk_workers}
+        self.running = {FAST_LANE: 0, BULK_LANE: 0}
+        self.waiting = {FAST_LANE: 0, BULK_LANE: 0}
+        self._condition = threading.Condition()
+
+    def lane_for(self, size) -> str:
+        if size is not None and int(size) <= self.fast_max_size:
+            return FAST_LANE
+        return BULK_LANE
+
+    def acquire(self, size) -> str:
+        """Blocks until the lane for a job of `size` bytes has a free slot, returns the lane."""
+        lane = self.lane_for(size)
+        start_time = time.time()
+        with self._condition:
+            self.waiting[lane] += 1
+            self._report(lane)
+            try:
+                while self.running[lane] >= self.budgets[lane]:
+                    self._condition.wait()
+            finally:
+                self.waiting[lane] -= 1
+            self.running[lane] += 1
+            self._report(lane)
+        logger.info(f' Job of {size} bytes started in the {lane} lane after {time.time() - start_time:.2f}s')
+        return lane
+
+    def release(self, lane: str):
+        with self._condition:
+            self.running[lane] -= 1
+            self._report(lane)
+            self._condition.notify_all()
+
+    def _report(self, lane: str):
+        LANE_JOBS.set(self.running[lane], lane=lane, state='running')
+        LANE_JOBS.set(self.waiting[lane], lane=lane, state='waiting')
@@ -1,5 +1,5 @@
-import gc
 import os
+import json
 import time
 import logging
 import traceback
@@ -8,6 +8,20 @@ from datetime import datetime
 from src.config import Settings
 from python_ms_core import Core
 from src.osw_format import OSWFormat
+from src.result_cache import ResultCache, CachedResponse
+from src.storage import wait_for_copy, get_blob_client, upload_blocks
+from src.worker_pool import WorkerPool
+from src.admission import AdmissionController
+from src.scheduler import LaneScheduler, JobTicket
+from src.handle_pool import HandlePool
+from src.batch_publisher import BatchPublisher
+from src.memory_policy import MemoryPolicy
+from src.conversion_loop import close_conversion_loop
+from src.local_backend import LocalCore
+from src.progress import ConversionProgress
+from src.tracing import get_tracer, configure_tracing, span
+from src.metrics import STAGE_SECONDS, UPLOADED_BYTES, JOBS_IN_FLIGHT, JOBS_TOTAL, QUEUE_LAG_SECONDS, queue_lag
+from functools import partial
 from dataclasses import asdict
 from src.models import (
     OSWValidationMessage,
@@ -16,6 +30,8 @@ from src.models import (
     OSWOnDemandResponse,
 )
 from python_ms_core.core.queue.models.queue_message import QueueMessage
+from python_ms_core.core.topic.azure_topic import AzureTopic
+from azure.servicebus import ServiceBusMessage
 import threading
 import osm_osw_reformatter
 
@@ -26,27 +42,81 @@ logger.setLevel(logging.INFO)
 
 class OSWFomatterService:
     _settings = Settings()
+    result_cache = None
+    worker_pool = None
+    scheduler = None
+    admission = None
+    publisher = None
+    memory_policy = None
+    _handles = None
+    _handles_lock = threading.Lock()
 
     def __init__(self):
-        self.core = Core()
+        self.core = self.create_core()
         listening_topic_name = self._settings.event_bus.validation_topic or ""
         self.subscription_name = self._settings.event_bus.validation_subscription or ""
         self.listening_topic = self.core.get_topic(topic_name=listening_topic_name,
-                                                   max_concurrent_messages=self._settings.max_concurrent_messages)
+                                                   max_concurrent_messages=self._settings.get_receive_window())
         self.logger = self.core.get_logger()
         self.storage_client = self.core.get_storage_client()
         self.container_name = self._settings.event_bus.container_name
         self.listening_thread = threading.Thread(target=self.start_listening)
-        self.listening_thread.start()
         self.download_dir = self._settings.get_download_directory()
         is_exists = os.path.exists(self.download_dir)
         if not is_exists:
             os.makedirs(self.download_dir)
+        if self._settings.result_cache_enabled:
+            self.result_cache = ResultCache(cache_dir=self._settings.get_result_cache_directory())
+        if self._settings.worker_pool_size > 0:
+            self.worker_pool = WorkerPool(
+                size=self._settings.worker_pool_size,
+                max_tasks_per_child=self._settings.worker_max_tasks_per_child
+            )
+        self.memory_policy = MemoryPolicy(
+            rss_threshold=self._settings.gc_rss_threshold,
+            freeze=self._settings.gc_freeze
+        )
+        self.memory_policy.start()
+        configure_tracing(self._settings.tracing_exporter, self._settings.get_tracing_file())
+        if self._settings.publish_batch_size > 1:
+            self.publisher = BatchPublisher(
+                send_batch=self.send_batch,
+                max_batch_size=self._settings.publish_batch_size,
+                max_delay=self._settings.publish_batch_delay
+            )
+        self.scheduler = LaneScheduler(
+            fast_workers=self._settings.fast_lane_workers,
+            bulk_workers=self._settings.bulk_lane_workers,
+            fast_max_size=self._settings.fast_lane_max_size,
+            max_jobs=self._settings.get_receive_window()
+        )
+        if self._settings.admission_control_enabled:
+            self.admission = AdmissionController(
+                max_jobs=self._settings.admission_max_jobs,
+                directory=self.download_dir,
+                memory_reserve=self._settings.admission_memory_reserve,
+                disk_reserve=self._settings.admission_disk_reserve
+            )
+        # Last, messages are handled on this thread with everything above in place
+        self.listening_thread.start()
+
+    def create_core(self):
+        """Core of the configured `BACKEND`: Azure, or the local directory and in-process topics."""
+        if self._settings.backend.lower() == 'local':
+            logger.info(f'Using the local backend in {self._settings.get_local_storage_directory()}')
+            return LocalCore(
+                root_dir=self._settings.get_local_storage_directory(),
+                latency=self._settings.local_topic_latency
+            )
+        return Core()
 
     def start_listening(self):
         def process(message: QueueMessage) -> None:
             try:
                 if message is not None:
+                    lag = queue_lag(message.publishedDate)
+                    if lag is not None:
+                        QUEUE_LAG_SECONDS.observe(lag)
                     queue_message = QueueMessage.to_dict(message)
                     messageType = message.messageType.lower()
                     if 'on_demand' in messageType:
@@ -88,6 +158,10 @@ class OSWFomatterService:
 
     def format(self, received_message: OSWValidationMessage):
         tdei_record_id: str = ""
+        admitted = None
+        JOBS_IN_FLIGHT.inc(kind='format')
+        job_span = get_tracer().start_span('format', message_id=received_message.message_id,
+                                           job_id=received_message.message_id)
         try:
             tdei_record_id = received_message.message_id
 
@@ -106,9 +180,31 @@ class OSWFomatterService:
                     file_path=file_upload_path,
                     storage_client=self.storage_client,
                     prefix=tdei_record_id,
+                    result_cache=self.result_cache,
+                    worker_pool=self.worker_pool,
+                    progress_callback=partial(self.send_progress, received_message.message_id,
+                                              received_message.message_type, tdei_record_id),
+                    polygon=received_message.data.polygon,
                 )
+                admitted = self.admit(formatter)
                 result = formatter.format()
                 formatter_result = ValidationResult()
+                if isinstance(result, CachedResponse):
+                    upload_path = self.copy_cached_result(
+                        formatter=formatter,
+                        cached=result,
+                        remote_path=self.get_upload_path(
+                            file_path=self._cached_file_name(formatter, result),
+                            project_group_id=received_message.data.tdei_project_group_id,
+                            record_id=tdei_record_id
+                        )
+                    )
+                    if upload_path:
+                        formatter_result.is_valid = True
+                        formatter_result.validation_message = 'Formatting Successful!'
+                        self.send_status(result=formatter_result, upload_message=received_message, upload_url=upload_path)
+                        return
+                    result = formatter.format_downloaded()
                 if result and result.status and result.error is None and result.generated_files is not None:
                     # Generated files can be .xml or a bunch of geojson
                     converted_file = self._prepare_upload_file(
@@ -120,6 +216,7 @@ class OSWFomatterService:
                         project_group_id=received_message.data.tdei_project_group_id,
                         record_id=tdei_record_id
                     )
+                    self._store_result(formatter=formatter, remote_url=upload_path)
                     formatter_result.is_valid = True
                     formatter_result.validation_message = 'Formatting Successful!'
 
@@ -145,32 +242,43 @@ class OSWFomatterService:
             result.validation_message = f'Error occurred while formatting OSW request {e}'
             self.send_status(result=result, upload_message=received_message)
             traceback.print_exc()
+            job_span.end(error=e)
         finally:
+            job_span.end()
             OSWFormat.clean_up(f'{self.download_dir}/{received_message.message_id}')
-            gc.collect()
+            self.release(admitted)
+            JOBS_IN_FLIGHT.dec(kind='format')
+            if self.memory_policy is not None:
+                self.memory_policy.after_job()
 
     def upload_to_azure(self, file_path=None, project_group_id=None, record_id=None):
         try:
-            unix_timestamp = int(time.time())
-            now = datetime.now()
-            year_month_str = now.strftime("%Y/%B").upper()
-            filename = f"{year_month_str}"
-
-            base_filename, file_extension = os.path.splitext(os.path.basename(file_path))
-            updated_filename = f'{base_filename}_{unix_timestamp}{file_extension}'
-
-            if project_group_id:
-                filename = f"{filename}/{project_group_id}"
-            if record_id:
-                filename = f"{filename}/{record_id}"
-            filename = f'{filename}/{updated_filename}'
+            filename = self.get_upload_path(file_path=self._source_name(file_path), project_group_id=project_group_id,
+                                            record_id=record_id)
             return self.upload_to_azure_on_demand(remote_path=filename, local_url=file_path)
         except Exception as e:
             logger.error(e)
             return None
 
+    @staticmethod
+    def get_upload_path(file_path, project_group_id=None, record_id=None):
+        unix_timestamp = int(time.time())
+        now = datetime.now()
+        year_month_str = now.strftime("%Y/%B").upper()
+        filename = f"{year_month_str}"
+
+        base_filename, file_extension = os.path.splitext(os.path.basename(file_path))
+        updated_filename = f'{base_filename}_{unix_timestamp}{file_extension}'
+
+        if project_group_id:
+            filename = f"{filename}/{project_group_id}"
+        if record_id:
+            filename = f"{filename}/{record_id}"
+        return f'{filename}/{updated_filename}'
+
     def send_status(self, result: ValidationResult, upload_message: OSWValidationMessage, upload_url=None):
         upload_message.data.success = result.is_valid
+        JOBS_TOTAL.inc(kind='format', outcome='success' if result.is_valid else 'failure')
         upload_message.data.message = result.validation_message
         if upload_url:
             upload_message.data.formatted_url = upload_url
@@ -189,43 +297,71 @@ class OSWFomatterService:
             }
         )
         try:
-            publishing_topic_name = self._settings.event_bus.formatter_topic or ""
-            publishing_topic = self.core.get_topic(topic_name=publishing_topic_name)
-            publishing_topic.publish(data=data)
+            self.publish(data=data)
             logger.info(f"Publishing message for : {upload_message.message_id}")
         except Exception as e:
             logger.error(f"Failed to publishing message for : {upload_message.message_id} reason : {e}")
-        finally:
-            gc.collect()
+
+    def send_progress(self, message_id, message_type, job_id, progress: ConversionProgress):
+        # Heartbeats have their own message type, consumers of final responses are not affected
+        data = QueueMessage.data_from(
+            {
+                'messageId': message_id,
+                'messageType': f'{message_type}-progress',
+                'data': {'jobId': job_id, 'status': 'running', 'progress': progress.to_dict()}
+            }
+        )
+        self.publish(data=data)
+        logger.info(f'Progress of {job_id}: {progress}')
 
     def process_on_demand_format(self, request: OSWOnDemandRequest):
+        admitted = None
+        JOBS_IN_FLIGHT.inc(kind='on_demand')
+        job_span = get_tracer().start_span('on_demand_format', message_id=request.messageId, job_id=request.data.jobId)
         try:
             # Format the file
             formatter = OSWFormat(
                 file_path=request.data.sourceUrl,
                 storage_client=self.storage_client,
-                prefix=request.data.jobId
+                prefix=request.data.jobId,
+                result_cache=self.result_cache,
+                worker_pool=self.worker_pool,
+                progress_callback=partial(self.send_progress, request.messageId, request.messageType,
+                                          request.data.jobId),
+                polygon=request.data.polygon
             )
+            admitted = self.admit(formatter)
             result = formatter.format()
             osw_response = asdict(request.data)
+            target_directory = f'jobs/{request.data.jobId}/{request.data.target}'
+            new_file_remote_url = None
+            if isinstance(result, CachedResponse):
+                new_file_remote_url = self.copy_cached_result(
+                    formatter=formatter,
+                    cached=result,
+                    remote_path=f'{target_directory}/{self._cached_file_name(formatter, result)}'
+                )
+                if new_file_remote_url is None:
+                    result = formatter.format_downloaded()
             # Create remote path
-            if result and result.status and result.error is None and result.generated_files is not None:
+            if new_file_remote_url is None and result and result.status and result.error is None and result.generated_files is not None:
                 logger.info('Formatting complete')
                 converted_file = self._prepare_upload_file(
                     formatter=formatter,
                     generated_files=result.generated_files,
                 )
 
-                target_directory = f'jobs/{request.data.jobId}/{request.data.target}'
-                target_file_remote_path = f'{target_directory}/{os.path.basename(converted_file)}'
+                target_file_remote_path = f'{target_directory}/{os.path.basename(self._source_name(converted_file))}'
 
                 new_file_remote_url = self.upload_to_azure_on_demand(
                     remote_path=target_file_remote_path,
                     local_url=converted_file
                 )
+                self._store_result(formatter=formatter, remote_url=new_file_remote_url)
 
                 logger.info(f'File to be uploaded to: {target_file_remote_path}')
 
+            if isinstance(result, CachedResponse) or (result and result.status and result.error is None and result.generated_files is not None):
                 osw_response['status'] = 'completed'
                 osw_response['formattedUrl'] = new_file_remote_url
                 osw_response['message'] = 'OK'
@@ -254,12 +390,18 @@ class OSWFomatterService:
                     }
                 )
             )
+            job_span.end(error=e)
         finally:
+            job_span.end()
             OSWFormat.clean_up(f'{self.download_dir}/{request.data.jobId}')
-            gc.collect()
+            self.release(admitted)
+            JOBS_IN_FLIGHT.dec(kind='on_demand')
+            if self.memory_policy is not None:
+                self.memory_policy.after_job()
 
     def send_on_demand_response(self, response: OSWOnDemandResponse):
         logger.info(f"Sending response for {response.data.jobId}")
+        JOBS_TOTAL.inc(kind='on_demand', outcome='success' if response.data.success else 'failure')
         resp_data = asdict(response.data)
         resp_data['package'] = {
             'python-ms-core': Core.__version__,
@@ -272,31 +414,164 @@ class OSWFomatterService:
             "messageType": response.messageType,
             'data': resp_data
         })
-        publishing_topic_name = self._settings.event_bus.formatter_topic or ""
-        publishing_topic = self.core.get_topic(topic_name=publishing_topic_name)
-        publishing_topic.publish(data=data)
+        self.publish(data=data)
         logger.info(f'Finished sending response for {response.data.jobId}')
-        gc.collect()
         # ret
 
-    def upload_to_azure_on_demand(self, remote_path: str, local_url: str):
-        container = self.storage_client.get_container(
-            container_name=self.container_name
+    def publish(self, data: QueueMessage):
+        with span('publish', message_type=data.messageType):
+            if self.publisher is None:
+                self.send_batch([data])
+            else:
+                self.publisher.publish(data)
+
+    def send_batch(self, messages):
+        publishing_topic_name = self._settings.event_bus.formatter_topic or ""
+        # Service Bus senders are not thread safe, each send holds the topic for itself
+        with STAGE_SECONDS.time(stage='publish'), self.handles.lease(
+            ('topic', publishing_topic_name),
+            lambda: self.core.get_topic(topic_name=publishing_topic_name),
+            exclusive=True
+        ) as publishing_topic:
+            if not isinstance(publishing_topic, AzureTopic):
+                for message in messages:
+                    publishing_topic.publish(data=message)
+                return
+            batch = publishing_topic.publisher.create_message_batch()
+            for message in messages:
+                service_bus_message = ServiceBusMessage(json.dumps(QueueMessage.to_dict(message)))
+                try:
+                    batch.add_message(service_bus_message)
+                except ValueError:
+                    # The batch reached the maximum message size of the namespace
+                    publishing_topic.publisher.send_messages(batch)
+                    batch = publishing_topic.publisher.create_message_batch()
+                    batch.add_message(service_bus_message)
+            publishing_topic.publisher.send_messages(batch)
+
+    def get_container(self):
+        return self.handles.get(
+            ('container', self.container_name),
+            lambda: self.storage_client.get_container(container_name=self.container_name)
         )
+
+    @property
+    def handles(self) -> HandlePool:
+        with self._handles_lock:
+            if self._handles is None:
+                self._handles = HandlePool(max_age=self._settings.handle_max_age)
+        return self._handles
+
+    def upload_to_azure_on_demand(self, remote_path: str, local_url):
+        # local_url is a local file path or a readable stream, such as OSWFormat.stream_zip.
+        # A streamed zip is compressed while it is uploaded, its zip time is part of the upload.
+        container = self.get_container()
         file = container.create_file(remote_path)
-        with open(local_url, "rb") as data:
-            file.upload(data)
-        return file.get_remote_url()
+        blob_client = get_blob_client(file)
+        with STAGE_SECONDS.time(stage='upload'), span('upload', remote_path=remote_path) as upload_span, \
+                open(local_url, "rb") if isinstance(local_url, str) else local_url as data:
+            if blob_client is None:
+                file.upload(data)
+                if isinstance(local_url, str) and os.path.isfile(local_url):
+                    UPLOADED_BYTES.inc(os.path.getsize(local_url))
+                return file.get_remote_url()
+            uploaded = upload_blocks(
+                blob_client,
+                data,
+                block_size=self._settings.upload_block_size,
+                max_concurrency=self._settings.upload_concurrency,
+                max_in_flight=self._settings.upload_max_in_flight,
+                retries=self._settings.upload_retries
+            )
+            upload_span.set_attribute('bytes', uploaded)
+        UPLOADED_BYTES.inc(uploaded)
+        return blob_client.url
+
+    def admit(self, formatter: OSWFormat) -> JobTicket:
+        """Blocks until the job has a slot in its lane and the admission controller has room for it."""
+        if self.scheduler is None and self.admission is None:
+            return None
+        size = formatter.get_input_size()
+        with STAGE_SECONDS.time(stage='admission'), span('admission', input_size=size) as admission_span:
+            ticket = JobTicket(lane=self.scheduler.acquire(size) if self.scheduler is not None else None)
+            if self.admission is not None:
+                try:
+                    ticket.estimate = self.admission.acquire(self.admission.estimate(formatter.file_path, size))
+                except BaseException:
+                    # The caller never gets the ticket to release
+                    self.release(ticket)
+                    raise
+            admission_span.set_attribute('lane', ticket.lane)
+        return ticket
+
+    def release(self, ticket: JobTicket):
+        if ticket is None:
+            return
+        if ticket.estimate is not None:
+            self.admission.release(ticket.estimate)
+        if ticket.lane is not None:
+            self.scheduler.release(ticket.lane)
+
+    def copy_cached_result(self, formatter: OSWFormat, cached: CachedResponse, remote_path: str):
+        """
+        Copies a previously uploaded conversion output to `remote_path`. The output of another
+        record is downloaded and uploaded again with its members renamed to this record's prefix.
+        Returns None, and drops the cache entry, when the output can no longer be copied.
+        """
+        try:
+            if cached.prefix == formatter.prefix:
+                destination = self.storage_client.clone_file(cached.remote_url, self.container_name, remote_path)
+                wait_for_copy(destination)
+                url = destination.url
+            else:
+                url = self.upload_to_azure_on_demand(remote_path=remote_path,
+                                                     local_url=formatter.rename_cached_result(cached))
+            logger.info(f'Reused cached result {cached.remote_url} for {remote_path}')
+            return url
+        except Exception as e:
+            logger.warning(f'Unable to reuse cached result {cached.remote_url}, formatting again: {e}')
+            self.result_cache.invalidate(cached.cache_key)
+            return None
+
+    def _store_result(self, formatter: OSWFormat, remote_url: str):
+        if self.result_cache is not None and formatter.result_key and remote_url:
+            self.result_cache.put(formatter.result_key, remote_url, prefix=formatter.prefix)
+
+    @staticmethod
+    def _cached_file_name(formatter: OSWFormat, cached: CachedResponse):
+        _, extension = os.path.splitext(urllib.parse.urlparse(cached.remote_url).path)
+        return f'{formatter.prefix}{extension}'
 
     def _prepare_upload_file(self, formatter: OSWFormat, generated_files):
         if isinstance(generated_files, list):
-            return formatter.create_zip(generated_files)
+            return self._zip(formatter, generated_files)
         if isinstance(generated_files, str):
             _, extension = os.path.splitext(generated_files)
             if extension.lower() == ".xml":
-                return formatter.create_zip([generated_files])
+                return self._zip(formatter, [generated_files])
         return generated_files
 
+    def _zip(self, formatter: OSWFormat, files):
+        if self._settings.zip_streaming:
+            return formatter.stream_zip(files)
+        with STAGE_SECONDS.time(stage='zip'), span('zip', files=len(files)):
+            return formatter.create_zip(files)
+
+    @staticmethod
+    def _source_name(source):
+        return source if isinstance(source, str) else source.name
+
     def stop_listening(self):
+        if isinstance(self.core, LocalCore):
+            # Stops receiving, the Azure receiver has no such call
+            self.core.close()
         self.listening_thread.join(timeout=0)
+        if self.worker_pool is not None:
+            self.worker_pool.shutdown()
+        if self.publisher is not None:
+            self.publisher.close()
+        if self.memory_policy is not None:
+            self.memory_policy.stop()
+        close_conversion_loop()
+        self.handles.close()
         return
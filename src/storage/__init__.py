@@ -0,0 +1,3 @@
+from .local_storage import LocalStorageClient, LocalStorageContainer, LocalFileEntity
+from .blob_transfer import BlobReader, download_to_file, upload_blocks, get_blob_client, file_digest, wait_for_copy
+from .download_cache import DownloadCache
@@ -0,0 +1,278 @@
+import os
+import time
+import base64
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceModifiedError
+from azure.storage.blob import BlobBlock
+from python_ms_core.core.storage.providers.azure.azure_file_entity import AzureFileEntity
+from .local_storage import LocalFileEntity
+
+logger = logging.getLogger('osw-formatter')
+
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+DEFAULT_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 0.5
+DEFAULT_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+class DownloadVerificationError(IOError):
+    pass
+
+
+class BlobChangedError(DownloadVerificationError):
+    """The blob was overwritten during the download, its ranges no longer match the ETag read first."""
+
+
+def get_blob_client(file):
+    """
+    Returns the azure-storage-blob style client behind a file entity, or None when the
+    entity does not expose one (ranged reads are not possible in that case).
+    """
+    if not isinstance(file, (AzureFileEntity, LocalFileEntity)):
+        return None
+    blob_client = file.blob_client
+    # Entities created through `container.create_file` carry the container client
+    if hasattr(blob_client, 'get_blob_client'):
+        blob_client = blob_client.get_blob_client(file.file_path)
+    return blob_client
+
+
+class BlobReader:
+    """Reads a storage file entity in ranges so that no more than one range is held in memory."""
+
+    def __init__(self, file, retries: int = DEFAULT_RETRIES, retry_backoff: float = DEFAULT_RETRY_BACKOFF):
+        self.file = file
+        self.blob_client = get_blob_client(file)
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self._properties = None
+
+    @property
+    def supports_ranges(self) -> bool:
+        return self.blob_client is not None
+
+    @property
+    def properties(self):
+        if self._properties is None:
+            self._properties = self.blob_client.get_blob_properties()
+        return self._properties
+
+    @property
+    def size(self) -> int:
+        return self.properties.size
+
+    @property
+    def etag(self):
+        return self.properties.etag if self.supports_ranges else None
+
+    @property
+    def content_md5(self):
+        content_settings = getattr(self.properties, 'content_settings', None)
+        content_md5 = getattr(content_settings, 'content_md5', None)
+        return bytes(content_md5) if content_md5 else None
+
+    def read_range(self, offset: int, length: int) -> bytes:
+        attempt = 0
+        # Every range is read from the version of the blob whose properties were read first
+        condition = {'etag': self.etag, 'match_condition': MatchConditions.IfNotModified} if self.etag else {}
+        while True:
+            try:
+                chunk = self.blob_client.download_blob(offset=offset, length=length, **condition).readall()
+                if len(chunk) != length:
+                    raise IOError(f'Short read at offset {offset}: expected {length} bytes, got {len(chunk)}')
+                return chunk
+            except ResourceModifiedError as e:
+                raise BlobChangedError(f'Blob changed while reading range {offset}-{offset + length}: {e}') from e
+            except Exception as e:
+                if attempt >= self.retries:
+                    raise
+                delay = self.retry_backoff * (2 ** attempt)
+                attempt += 1
+                logger.warning(f' Retrying range {offset}-{offset + length} ({attempt}/{self.retries}) in {delay}s: {e}')
+                time.sleep(delay)
+
+    def iter_ranges(self, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        size = self.size
+        for offset in range(0, size, chunk_size):
+            yield offset, min(chunk_size, size - offset)
+
+    def iter_chunks(self, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        for offset, length in self.iter_ranges(chunk_size):
+            yield self.read_range(offset, length)
+
+
+def download_to_file(file, destination: str, chunk_size: int = DEFAULT_CHUNK_SIZE, max_workers: int = 1,
+                     parallel_threshold: int = None, retries: int = DEFAULT_RETRIES) -> str:
+    """
+    Streams a storage file entity to `destination`, one `chunk_size` range at a time.
+    Blobs of at least `parallel_threshold` bytes are fetched as `max_workers` concurrent ranges
+    written into a preallocated file. Every range is conditional on the ETag of the blob, a blob
+    overwritten meanwhile fails the download with BlobChangedError (HTTP 412). The result is
+    verified against the blob size and, when the storage provides one, its Content-MD5.
+    Entities without ranged read support are written from a single `get_stream()` call.
+    """
+    reader = BlobReader(file, retries=retries)
+    # Never write through an existing file, it may be linked to a download cache entry
+    if os.path.lexists(destination):
+        os.remove(destination)
+    if not reader.supports_ranges:
+        with open(destination, 'wb') as output:
+            output.write(file.get_stream())
+        return destination
+
+    if max_workers > 1 and parallel_threshold is not None and reader.size >= parallel_threshold:
+        _download_parallel(reader, destination, chunk_size, max_workers)
+        digest = file_digest(destination, chunk_size=chunk_size) if reader.content_md5 else None
+    else:
+        digest = _download_sequential(reader, destination, chunk_size)
+
+    _verify(reader, destination, digest)
+    return destination
+
+
+def upload_blocks(blob_client, data, block_size: int = DEFAULT_BLOCK_SIZE, max_concurrency: int = 4,
+                  max_in_flight: int = None, retries: int = DEFAULT_RETRIES,
+                  retry_backoff: float = DEFAULT_RETRY_BACKOFF) -> int:
+    """
+    Uploads a readable binary stream as a block blob. Blocks of `block_size` bytes are staged by
+    `max_concurrency` threads, each block is retried on its own, and the block list is committed
+    once every block is staged, only if the blob does not exist yet. At most `max_in_flight` bytes (by default two blocks per thread)
+    are read ahead of the blocks already staged. Returns the number of bytes uploaded.
+    """
+    max_in_flight = max_in_flight or block_size * max_concurrency * 2
+    slots = threading.Semaphore(max(1, max_in_flight // block_size))
+    errors = []
+    block_ids = []
+    futures = []
+    total = 0
+
+    def staged(future):
+        if not future.cancelled() and future.exception():
+            errors.append(future.exception())
+        slots.release()
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        try:
+            for block in _read_blocks(data, block_size):
+                slots.acquire()
+                if errors:
+                    raise errors[0]
+                # Block ids of a blob must all have the same length
+                block_id = base64.b64encode(f'{len(block_ids):010d}'.encode('utf-8')).decode('utf-8')
+                block_ids.append(block_id)
+                total += len(block)
+                future = executor.submit(_stage_block, blob_client, block_id, block, retries, retry_backoff)
+                future.add_done_callback(staged)
+                futures.append(future)
+            for future in futures:
+                future.result()
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    # Like `upload_blob(overwrite=False)` of the entity upload, an existing blob is never replaced
+    blob_client.commit_block_list([BlobBlock(block_id=block_id) for block_id in block_ids],
+                                  match_condition=MatchConditions.IfMissing)
+    logger.info(f' Uploaded {total} bytes in {len(block_ids)} blocks to {blob_client.url}')
+    return total
+
+
+def wait_for_copy(blob_client, timeout: float = 60 * 60, poll_interval: float = 1.0):
+    """Blocks until a server side copy into `blob_client` has finished."""
+    deadline = time.time() + timeout
+    while True:
+        copy = getattr(blob_client.get_blob_properties(), 'copy', None)
+        status = getattr(copy, 'status', None)
+        if status != 'pending':
+            break
+        if time.time() > deadline:
+            raise TimeoutError(f'Copy into {blob_client.url} did not finish in {timeout}s')
+        time.sleep(poll_interval)
+    if status not in (None, 'success'):
+        raise IOError(f'Copy into {blob_client.url} finished with status {status}')
+
+
+def file_digest(path: str, algorithm: str = 'md5', chunk_size: int = DEFAULT_CHUNK_SIZE) -> bytes:
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as data:
+        for chunk in iter(lambda: data.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _download_sequential(reader: BlobReader, destination: str, chunk_size: int) -> bytes:
+    digest = hashlib.md5()
+    with open(destination, 'wb') as output:
+        for chunk in reader.iter_chunks(chunk_size):
+            digest.update(chunk)
+            output.write(chunk)
+    return digest.digest()
+
+
+def _download_parallel(reader: BlobReader, destination: str, chunk_size: int, max_workers: int):
+    with open(destination, 'wb') as output:
+        output.truncate(reader.size)
+
+    def fetch(offset, length):
+        chunk = reader.read_range(offset, length)
+        with open(destination, 'r+b') as output:
+            output.seek(offset)
+            output.write(chunk)
+
+    logger.info(f' Downloading {reader.size} bytes with {max_workers} parallel ranges')
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(fetch, offset, length) for offset, length in reader.iter_ranges(chunk_size)]
+        try:
+            for future in as_completed(futures):
+                future.result()
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def _read_blocks(data, block_size: int):
+    while True:
+        block = data.read(block_size)
+        if not block:
+            return
+        # Raw streams may return less than asked for before the end
+        while len(block) < block_size:
+            more = data.read(block_size - len(block))
+            if not more:
+                break
+            block += more
+        yield block
+
+
+def _stage_block(blob_client, block_id: str, block: bytes, retries: int, retry_backoff: float):
+    attempt = 0
+    while True:
+        try:
+            return blob_client.stage_block(block_id=block_id, data=block, length=len(block))
+        except Exception as e:
+            if attempt >= retries:
+                raise
+            delay = retry_backoff * (2 ** attempt)
+            attempt += 1
+            logger.warning(f' Retrying block {block_id} ({attempt}/{retries}) in {delay}s: {e}')
+            time.sleep(delay)
+
+
+def _verify(reader: BlobReader, destination: str, digest: bytes):
+    with open(destination, 'rb') as output:
+        output.seek(0, 2)
+        size = output.tell()
+    if size != reader.size:
+        raise DownloadVerificationError(f'Downloaded {size} bytes, expected {reader.size}: {destination}')
+    expected = reader.content_md5
+    if expected and digest and digest != expected:
+        raise DownloadVerificationError(
+            f'Checksum mismatch for {destination}: expected {base64.b64encode(expected).decode()}, '
+            f'got {base64.b64encode(digest).decode()}'
+        )
@@ -0,0 +1,121 @@
+import os
+import uuid
+import errno
+import shutil
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger('osw-formatter')
+
+# ioctl request to clone file extents (Linux, btrfs/xfs)
+FICLONE = 0x40049409
+
+
+def link_file(source: str, destination: str) -> str:
+    """
+    Makes `destination` refer to the content of `source` without copying when possible:
+    a hardlink first, a reflink when hardlinks are not allowed, a plain copy otherwise.
+    Returns the method that was used.
+    """
+    try:
+        os.link(source, destination)
+        return 'hardlink'
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+            raise
+    try:
+        import fcntl
+        with open(source, 'rb') as src, open(destination, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return 'reflink'
+    except (ImportError, OSError):
+        shutil.copyfile(source, destination)
+        return 'copy'
+
+
+class DownloadCache:
+    """
+    On-disk LRU cache of source files, keyed by blob url and ETag.
+    Entries are linked into job directories, so removing a job directory never
+    touches the cache. Least recently used entries are evicted above `max_size` bytes.
+    """
+
+    def __init__(self, cache_dir: str, max_size: int):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def get_key(url: str, etag: str) -> str:
+        return hashlib.sha256(f'{url}\n{etag}'.encode('utf-8')).hexdigest()
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def fetch(self, key: str, destination: str) -> bool:
+        """Links a cached entry to `destination`. Returns False on a cache miss."""
+        path = self.get_path(key)
+        if os.path.exists(destination):
+            os.remove(destination)
+        try:
+            method = link_file(path, destination)
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        logger.info(f' Download cache hit ({method}): {destination}')
+        return True
+
+    def store(self, key: str, source: str):
+        """Adds a downloaded file to the cache and evicts entries above the size cap."""
+        if os.path.getsize(source) > self.max_size:
+            return
+        temp_path = f'{self.get_path(key)}.{uuid.uuid4().hex}.tmp'
+        try:
+            link_file(source, temp_path)
+            os.replace(temp_path, self.get_path(key))
+        except OSError as e:
+            logger.warning(f' Unable to add {source} to the download cache: {e}')
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_size:
+                    break
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                    logger.info(f' Evicted {name} from the download cache')
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def size(self) -> int:
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.tmp'):
+                continue
+            try:
+                total += os.path.getsize(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+        return total
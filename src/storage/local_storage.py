@@ -0,0 +1,283 @@
+# Filesystem backed stand-in for the Azure storage provider of python-ms-core.
+# The blob/container clients mimic the subset of the azure-storage-blob API used by
+# the formatter so that the same transfer code paths run against local files.
+import os
+import uuid
+import shutil
+import hashlib
+import urllib.parse
+from datetime import datetime
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError
+from python_ms_core.core.storage.abstract.file_entity import FileEntity
+from python_ms_core.core.storage.abstract.storage_client import StorageClient
+from python_ms_core.core.storage.abstract.storage_container import StorageContainer
+
+
+class LocalContentSettings:
+    def __init__(self, content_md5=None):
+        self.content_md5 = content_md5
+
+
+class LocalBlobProperties:
+    def __init__(self, name: str, size: int, etag: str, last_modified: datetime, content_md5=None):
+        self.name = name
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_settings = LocalContentSettings(content_md5=content_md5)
+
+
+class LocalBlobDownloader:
+    def __init__(self, path: str, offset: int = 0, length: int = None, chunk_size: int = 4 * 1024 * 1024):
+        self.path = path
+        self.offset = offset or 0
+        total = os.path.getsize(path)
+        self.size = max(0, min(total - self.offset, length if length is not None else total))
+        self.chunk_size = chunk_size
+
+    def chunks(self):
+        remaining = self.size
+        with open(self.path, 'rb') as blob:
+            blob.seek(self.offset)
+            while remaining > 0:
+                chunk = blob.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def readall(self) -> bytes:
+        return b''.join(self.chunks())
+
+    def readinto(self, stream) -> int:
+        written = 0
+        for chunk in self.chunks():
+            stream.write(chunk)
+            written += len(chunk)
+        return written
+
+
+class LocalBlobClient:
+    def __init__(self, container_path: str, blob_name: str, url: str):
+        self.container_path = container_path
+        self.blob_name = blob_name
+        self.path = os.path.join(container_path, *blob_name.split('/'))
+        self.url = url
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.path)
+
+    def get_blob_properties(self) -> LocalBlobProperties:
+        stat = os.stat(self.path)
+        return LocalBlobProperties(
+            name=self.blob_name,
+            size=stat.st_size,
+            etag=f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"',
+            last_modified=datetime.fromtimestamp(stat.st_mtime),
+            content_md5=self._read_md5()
+        )
+
+    def download_blob(self, offset: int = None, length: int = None, etag: str = None, match_condition=None,
+                      **kwargs) -> LocalBlobDownloader:
+        if not self.exists():
+            raise FileNotFoundError(f'Blob not found: {self.blob_name}')
+        if match_condition == MatchConditions.IfNotModified and etag != self.get_blob_properties().etag:
+            raise ResourceModifiedError(f'The condition specified using HTTP conditional header(s) is not met: '
+                                        f'{self.blob_name}')
+        return LocalBlobDownloader(self.path, offset=offset, length=length)
+
+    def upload_blob(self, data, overwrite: bool = True, **kwargs):
+        if not overwrite and self.exists():
+            raise FileExistsError(f'Blob already exists: {self.blob_name}')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        digest = hashlib.md5()
+        temp_path = f'{self.path}.{uuid.uuid4().hex}.tmp'
+        with open(temp_path, 'wb') as blob:
+            for chunk in _iter_data(data):
+                digest.update(chunk)
+                blob.write(chunk)
+        os.replace(temp_path, self.path)
+        self._write_md5(digest.digest())
+        return self
+
+    def stage_block(self, block_id: str, data, **kwargs):
+        os.makedirs(self._blocks_path(), exist_ok=True)
+        temp_path = os.path.join(self._blocks_path(), f'{uuid.uuid4().hex}.tmp')
+        with open(temp_path, 'wb') as block:
+            for chunk in _iter_data(data):
+                block.write(chunk)
+        os.replace(temp_path, self._block_path(block_id))
+
+    def commit_block_list(self, block_list, match_condition=None, **kwargs):
+        block_paths = [self._block_path(getattr(block, 'id', block)) for block in block_list]
+        missing = [path for path in block_paths if not os.path.isfile(path)]
+        if missing:
+            raise ValueError(f'{len(missing)} blocks of {self.blob_name} were not staged')
+        if match_condition == MatchConditions.IfMissing and self.exists():
+            raise ResourceExistsError(f'The specified blob already exists: {self.blob_name}')
+        self.upload_blob(_iter_files(block_paths), overwrite=True)
+        # Uncommitted blocks are discarded on commit, like in Azure
+        shutil.rmtree(self._blocks_path(), ignore_errors=True)
+        return self
+
+    def delete_blob(self, **kwargs):
+        for path in (self.path, self._md5_path()):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _blocks_path(self) -> str:
+        return os.path.join(self.container_path, '.blocks', *self.blob_name.split('/'))
+
+    def _block_path(self, block_id: str) -> str:
+        return os.path.join(self._blocks_path(), block_id.encode('utf-8').hex())
+
+    def _md5_path(self) -> str:
+        return os.path.join(self.container_path, '.md5', *self.blob_name.split('/'))
+
+    def _read_md5(self):
+        path = self._md5_path()
+        if os.path.isfile(path):
+            with open(path, 'rb') as md5_file:
+                return bytearray(md5_file.read())
+        return None
+
+    def _write_md5(self, value: bytes):
+        path = self._md5_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as md5_file:
+            md5_file.write(value)
+
+
+class LocalContainerClient:
+    def __init__(self, root_dir: str, container_name: str, base_url: str):
+        self.container_name = container_name
+        self.container_path = os.path.join(root_dir, container_name)
+        self.base_url = base_url
+        os.makedirs(self.container_path, exist_ok=True)
+
+    def get_blob_client(self, blob) -> LocalBlobClient:
+        url = f'{self.base_url}/{self.container_name}/{urllib.parse.quote(blob)}'
+        return LocalBlobClient(self.container_path, blob, url)
+
+    def list_blobs(self, name_starts_with=None):
+        blobs = []
+        for directory, folders, files in os.walk(self.container_path):
+            folders[:] = [folder for folder in folders if folder not in ('.md5', '.blocks')]
+            for file in files:
+                if file.endswith('.tmp'):
+                    continue
+                relative = os.path.relpath(os.path.join(directory, file), self.container_path)
+                name = relative.replace(os.sep, '/')
+                if name_starts_with and not name.startswith(name_starts_with):
+                    continue
+                blobs.append(self.get_blob_client(name).get_blob_properties())
+        return blobs
+
+    def upload_blob(self, name, data, **kwargs) -> LocalBlobClient:
+        return self.get_blob_client(name).upload_blob(data, **kwargs)
+
+
+class LocalFileEntity(FileEntity):
+    def __init__(self, name: str, blob_client: LocalBlobClient):
+        super().__init__(name)
+        self.blob_client = blob_client
+        self._get_remote_url = None
+
+    def get_stream(self):
+        return self.blob_client.download_blob().readall()
+
+    def get_body_text(self):
+        return self.get_stream().decode('utf-8')
+
+    def upload(self, upload_stream):
+        self.blob_client.upload_blob(upload_stream, overwrite=True)
+        self._get_remote_url = self.blob_client.url
+
+    def get_remote_url(self):
+        return self._get_remote_url or self.blob_client.url
+
+    def delete_file(self):
+        self.blob_client.delete_blob()
+
+
+class LocalStorageContainer(StorageContainer):
+    def __init__(self, name: str, container_client: LocalContainerClient):
+        super().__init__(name)
+        self.container_client = container_client
+
+    def list_files(self, name_starts_with=None):
+        return [
+            LocalFileEntity(blob.name, self.container_client.get_blob_client(blob.name))
+            for blob in self.container_client.list_blobs(name_starts_with=name_starts_with)
+        ]
+
+    def create_file(self, name: str, mimetype=None):
+        return LocalFileEntity(name, self.container_client.get_blob_client(name))
+
+
+class LocalStorageClient(StorageClient):
+    """
+    Storage client backed by a local directory, one sub directory per container.
+    Remote urls have the form `<base_url>/<container>/<path>`.
+    """
+
+    def __init__(self, root_dir: str, base_url: str = None):
+        super().__init__()
+        self.root_dir = os.path.abspath(root_dir)
+        self.base_url = (base_url or f'file://{self.root_dir}').rstrip('/')
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def get_container(self, container_name: str):
+        if container_name:
+            return LocalStorageContainer(container_name, self._container_client(container_name))
+
+    def get_file(self, container_name: str, file_name: str):
+        return LocalFileEntity(file_name, self._container_client(container_name).get_blob_client(file_name))
+
+    def get_file_from_url(self, container_name: str, full_url: str):
+        _, path = self.get_container_info(full_url)
+        blob_client = self._container_client(container_name).get_blob_client(path)
+        if blob_client.exists():
+            return LocalFileEntity(path, blob_client)
+        return LocalFileEntity
+
+    def get_sas_url(self, container_name: str, file_path: str, expiry_hours: int = 12) -> str:
+        return self._container_client(container_name).get_blob_client(file_path).url
+
+    def clone_file(self, file_url: str, destination_container_name: str, destination_file_path: str):
+        source_container, source_path = self.get_container_info(file_url)
+        source = self._container_client(source_container).get_blob_client(source_path)
+        destination = self._container_client(destination_container_name).get_blob_client(destination_file_path)
+        destination.upload_blob(source.download_blob().chunks(), overwrite=True)
+        return destination
+
+    def get_container_info(self, file_url: str):
+        relative = urllib.parse.unquote(file_url)[len(self.base_url):].lstrip('/')
+        container_name, _, file_path = relative.partition('/')
+        return container_name, file_path
+
+    def _container_client(self, container_name: str) -> LocalContainerClient:
+        return LocalContainerClient(self.root_dir, container_name, self.base_url)
+
+
+def _iter_data(data):
+    if isinstance(data, (bytes, bytearray)):
+        yield bytes(data)
+    elif isinstance(data, str):
+        yield data.encode('utf-8')
+    elif hasattr(data, 'read'):
+        while True:
+            chunk = data.read(4 * 1024 * 1024)
+            if not chunk:
+                break
+            yield chunk
+    else:
+        for chunk in data:
+            yield chunk
+
+
+def _iter_files(paths, chunk_size: int = 4 * 1024 * 1024):
+    for path in paths:
+        with open(path, 'rb') as file:
+            yield from iter(lambda: file.read(chunk_size), b'')
@@ -0,0 +1,303 @@
+import os
+import json
+import bisect
+import osmium
+from array import array
+from osm_osw_reformatter.helpers.osm import (
+    osw_way_filter,
+    osw_line_filter,
+    osw_zone_filter,
+    osw_polygon_filter,
+)
+from osm_osw_reformatter.serializer.osw.osw_normalizer import OSW_SCHEMA_ID
+
+# Output files in the order the reformatter lists them
+KINDS = ['nodes', 'edges', 'points', 'lines', 'zones', 'polygons']
+
+
+def is_relevant_way(tags) -> bool:
+    """Ways the reformatter turns into edges, lines, zones or polygons, all other ways are ignored by it."""
+    return osw_way_filter(tags) or osw_line_filter(tags) or osw_zone_filter(tags) or osw_polygon_filter(tags)
+
+
+def is_relevant_relation(tags) -> bool:
+    return osw_zone_filter(tags) or osw_polygon_filter(tags)
+
+
+class RelationCollector(osmium.SimpleHandler):
+    """The member ways of every relevant relation, relations come last so this is a pass of its own."""
+
+    def __init__(self):
+        super().__init__()
+        self.relations = {}
+        self.members = set()
+
+    def relation(self, r):
+        if not is_relevant_relation(r.tags):
+            return
+        ways = [member.ref for member in r.members if member.type == 'w']
+        self.relations[r.id] = ways
+        self.members.update(ways)
+
+
+class _WayCollector(osmium.SimpleHandler):
+    """Second pass, the longitude of the first node and the node references of every relevant or member way."""
+
+    def __init__(self, members):
+        super().__init__()
+        self.members = members
+        self.ways = {}
+        self.member_ways = {}
+
+    def way(self, w):
+        relevant = is_relevant_way(w.tags)
+        if not relevant and w.id not in self.members:
+            return
+        lon = None
+        for node in w.nodes:
+            if node.location.valid():
+                lon = node.location.lon
+                break
+        way = (lon, array('q', (node.ref for node in w.nodes)))
+        if relevant:
+            self.ways[w.id] = way
+        if w.id in self.members:
+            self.member_ways[w.id] = way
+
+
+class _TileWriter(osmium.SimpleHandler):
+    """Last pass, copies nodes, ways and relations to the tiles in their masks."""
+
+    def __init__(self, writers, boundaries, node_mask, way_mask, relation_mask):
+        super().__init__()
+        self.writers = writers
+        self.boundaries = boundaries
+        self.node_mask = node_mask
+        self.way_mask = way_mask
+        self.relation_mask = relation_mask
+        self.loose_nodes = [[] for _ in writers]
+
+    def node(self, n):
+        mask = self.node_mask.get(n.id, 0)
+        if len(n.tags) and n.location.valid():
+            # Points and loose nodes are converted by the tile they are in
+            tile = bisect.bisect_right(self.boundaries, n.location.lon)
+            if not mask:
+                self.loose_nodes[tile].append(n.id)
+            mask |= 1 << tile
+        self._copy(mask, 'add_node', n)
+
+    def way(self, w):
+        self._copy(self.way_mask.get(w.id, 0), 'add_way', w)
+
+    def relation(self, r):
+        self._copy(self.relation_mask.get(r.id, 0), 'add_relation', r)
+
+    def _copy(self, mask, method, obj):
+        for tile in tiles_of(mask):
+            getattr(self.writers[tile], method)(obj)
+
+
+def tiles_of(mask: int):
+    tile = 0
+    while mask:
+        if mask & 1:
+            yield tile
+        mask >>= 1
+        tile += 1
+
+
+def split(file_path: str, workdir: str, tiles: int):
+    """
+    Splits an OSM file into longitude strips for `tiles` independent conversions and returns
+    a list of `{'path', 'ownership'}` tiles, or None when there is nothing to split.
+
+    Every relevant way, and every relevant relation with the nodes of its member ways, is owned
+    by the strip of its first node. A tile holds what it owns and everything else that shares
+    a node with it, complete, so the nodes of owned ways have the same neighbours as in the
+    whole file and the reformatter splits and simplifies owned ways the same way. The ownership
+    file lists what the tile's output is kept for, see `keep_owned`.
+    """
+    relations = RelationCollector()
+    relations.apply_file(file_path)
+    collector = _WayCollector(relations.members)
+    collector.apply_file(file_path, locations=True)
+
+    # Relations are split like ways with the nodes of all their member ways
+    elements = {('way', way_id): way for way_id, way in collector.ways.items()}
+    for relation_id, members in relations.relations.items():
+        ways = [collector.member_ways[way_id] for way_id in members if way_id in collector.member_ways]
+        lon = next((lon for lon, _ in ways if lon is not None), None)
+        elements[('relation', relation_id)] = (lon, [ref for _, refs in ways for ref in refs])
+    members = relations.relations
+    del relations, collector
+
+    lons = sorted(lon for lon, _ in elements.values() if lon is not None)
+    if not lons:
+        return None
+    tiles = max(1, min(tiles, len(lons)))
+    boundaries = [lons[len(lons) * i // tiles] for i in range(1, tiles)]
+    del lons
+
+    owners = {}
+    owned_mask = {}
+    for key, (lon, refs) in elements.items():
+        owner = bisect.bisect_right(boundaries, lon) if lon is not None else 0
+        owners[key] = owner
+        for ref in refs:
+            owned_mask[ref] = owned_mask.get(ref, 0) | 1 << owner
+
+    masks = {}
+    node_mask = {}
+    for key, (_, refs) in elements.items():
+        mask = 0
+        for ref in refs:
+            mask |= owned_mask[ref]
+        masks[key] = mask
+        for ref in refs:
+            node_mask[ref] = node_mask.get(ref, 0) | mask
+    way_mask = {way_id: mask for (kind, way_id), mask in masks.items() if kind == 'way'}
+    relation_mask = {relation_id: mask for (kind, relation_id), mask in masks.items() if kind == 'relation'}
+    # Member ways go wherever their relation goes
+    for relation_id, mask in relation_mask.items():
+        for way_id in members[relation_id]:
+            way_mask[way_id] = way_mask.get(way_id, 0) | mask
+    del elements, masks, members
+
+    os.makedirs(workdir, exist_ok=True)
+    paths = [os.path.join(workdir, f'tile_{tile}.osm.pbf') for tile in range(tiles)]
+    writers = [osmium.SimpleWriter(path) for path in paths]
+    try:
+        writer = _TileWriter(writers, boundaries, node_mask, way_mask, relation_mask)
+        writer.apply_file(file_path)
+    finally:
+        for tile_writer in writers:
+            tile_writer.close()
+
+    owned = [{'owned_ways': [], 'owned_nodes': [], 'loose_nodes': loose} for loose in writer.loose_nodes]
+    for (kind, element_id), owner in owners.items():
+        if kind == 'way':
+            owned[owner]['owned_ways'].append(element_id)
+    for ref, mask in owned_mask.items():
+        for tile in tiles_of(mask):
+            owned[tile]['owned_nodes'].append(ref)
+
+    result = []
+    for tile, path in enumerate(paths):
+        ownership = os.path.join(workdir, f'tile_{tile}.ownership.json')
+        with open(ownership, 'w') as file:
+            json.dump(owned[tile], file)
+        result.append({'path': path, 'ownership': ownership})
+    return result
+
+
+def file_kind(path: str):
+    for kind in KINDS:
+        if path.endswith(f'.graph.{kind}.geojson'):
+            return kind
+    return None
+
+
+def keep_owned(generated_files: list, ownership_path: str) -> list:
+    """
+    Filters a tile's nodes and edges to those it owns. Edges are kept for owned ways, nodes
+    when they end a kept edge or, without any edge in the tile, are on an owned way or loose.
+    Other features are kept, they are identical in every tile they appear in.
+    """
+    with open(ownership_path) as file:
+        ownership = json.load(file)
+    owned_ways = {str(way_id) for way_id in ownership['owned_ways']}
+    owned_nodes = {str(ref) for ref in ownership['owned_nodes'] + ownership['loose_nodes']}
+    files = {file_kind(path): path for path in generated_files}
+
+    kept_ends = set()
+    edge_ends = set()
+    if 'edges' in files:
+        collection = _read(files['edges'])
+        features = []
+        for feature in collection['features']:
+            properties = feature['properties']
+            ends = (properties['_u_id'], properties['_v_id'])
+            edge_ends.update(ends)
+            if properties['ext:osm_id'] in owned_ways:
+                kept_ends.update(ends)
+                features.append(feature)
+        collection['features'] = features
+        _write(files['edges'], collection)
+    if 'nodes' in files:
+        collection = _read(files['nodes'])
+        collection['features'] = [
+            feature for feature in collection['features']
+            if feature['properties']['_id'] in kept_ends
+            or feature['properties']['_id'] not in edge_ends and feature['properties']['_id'] in owned_nodes
+        ]
+        _write(files['nodes'], collection)
+    return generated_files
+
+
+def merge(tile_files: list, workdir: str, filename: str) -> list:
+    """
+    Merges the kept output of the tiles into `{filename}.graph.*.geojson` files in `workdir`.
+    Features are streamed to the output one tile file at a time, those seen in several tiles
+    are written once, by the `_id`s already written, and edges are numbered again from 1.
+    """
+    generated_files = []
+    for kind in KINDS:
+        path = os.path.join(workdir, f'{filename}.graph.{kind}.geojson')
+        written = set()
+        with _CollectionWriter(path) as output:
+            for tile_path in (path for files in tile_files for path in files if file_kind(path) == kind):
+                for feature in _read(tile_path)['features']:
+                    if kind == 'edges':
+                        feature['properties']['_id'] = str(output.count + 1)
+                    elif feature['properties']['_id'] in written:
+                        continue
+                    else:
+                        written.add(feature['properties']['_id'])
+                    output.write(feature)
+        if output.count:
+            generated_files.append(path)
+    return generated_files
+
+
+class _CollectionWriter:
+    """
+    Writes features one at a time into a FeatureCollection laid out like `_write`. The file is
+    only created with the first feature.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._file = None
+
+    def write(self, feature: dict):
+        if self._file is None:
+            self._file = open(self.path, 'w')
+            # The members before the features, without the closing brace
+            self._file.write(json.dumps({'$schema': OSW_SCHEMA_ID, 'type': 'FeatureCollection'}, indent=2)[:-2])
+            self._file.write(',\n  "features": [\n    ')
+        else:
+            self._file.write(',\n    ')
+        self._file.write(json.dumps(feature, indent=2).replace('\n', '\n    '))
+        self.count += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._file is not None:
+            self._file.write('\n  ]\n}')
+            self._file.close()
+        return False
+
+
+def _read(path: str) -> dict:
+    with open(path) as file:
+        return json.load(file)
+
+
+def _write(path: str, collection: dict):
+    with open(path, 'w') as file:
+        json.dump({'$schema': OSW_SCHEMA_ID, 'type': 'FeatureCollection', 'features': collection['features']},
+                  file, indent=2)
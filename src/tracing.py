@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+from typing import Optional
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+logger = logging.getLogger('osw-formatter')
+
+SERVICE_NAME = 'osw-formatter'
+STATUS_UNSET = 'UNSET'
+STATUS_OK = 'OK'
+STATUS_ERROR = 'ERROR'
+# OTLP status codes
+_STATUS_CODES = {STATUS_UNSET: 0, STATUS_OK: 1, STATUS_ERROR: 2}
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+@dataclass
+class Span:
+    """A unit of work with W3C trace context ids, shaped like an OpenTelemetry span."""
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    start_time: int = 0
+    end_time: Optional[int] = None
+    attributes: dict = field(default_factory=dict)
+    status: str = STATUS_UNSET
+    status_message: str = ''
+    _tracer: 'Tracer' = field(default=None, repr=False, compare=False)
+    _token: contextvars.Token = field(default=None, repr=False, compare=False)
+
+    @property
+    def duration(self) -> float:
+        """Seconds, up to now while the span is running."""
+        return ((self.end_time or time.time_ns()) - self.start_time) / 1e9
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def end(self, error: BaseException = None):
+        if self.end_time is not None:
+            return
+        self.end_time = time.time_ns()
+        if error is not None:
+            self.status = STATUS_ERROR
+            self.status_message = f'{type(error).__name__}: {error}'
+        elif self.status == STATUS_UNSET:
+            self.status = STATUS_OK
+        if self._token is not None:
+            try:
+                _current_span.reset(self._token)
+            except ValueError:
+                # Ended in another context than it was started in
+                pass
+            self._token = None
+        if self._tracer is not None:
+            self._tracer.export(self)
+
+    def traceparent(self) -> str:
+        return f'00-{self.trace_id}-{self.span_id}-01'
+
+    def to_otlp(self) -> dict:
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': 1,
+            'startTimeUnixNano': str(self.start_time),
+            'endTimeUnixNano': str(self.end_time or 0),
+            'attributes': [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            'status': {'code': _STATUS_CODES[self.status], 'message': self.status_message},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+class NoOpSpanExporter:
+    def export(self, spans):
+        pass
+
+    def shutdown(self):
+        pass
+
+
+class InMemorySpanExporter:
+    """Keeps the last `max_spans` finished spans, for tests and offline inspection."""
+
+    def __init__(self, max_spans: int = 10000):
+        self.max_spans = max_spans
+        self._spans = []
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        with self._lock:
+            self._spans.extend(spans)
+            del self._spans[:-self.max_spans]
+
+    def get_finished_spans(self) -> list:
+        with self._lock:
+            return list(self._spans)
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+    def shutdown(self):
+        pass
+
+
+class LoggingSpanExporter:
+    """Logs one line per finished trace with the duration of each of its spans."""
+
+    def __init__(self):
+        self._traces = {}
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        for span in spans:
+            with self._lock:
+                children = self._traces.setdefault(span.trace_id, [])
+                if span.parent_id is not None:
+                    children.append(span)
+                    continue
+                del self._traces[span.trace_id]
+            phases = ', '.join(f'{child.name} {child.duration:.2f}s' for child in children)
+            attributes = ' '.join(f'{key}={value}' for key, value in span.attributes.items())
+            logger.info(f' Trace {span.trace_id} {span.name} {attributes} took {span.duration:.2f}s'
+                        f' ({span.status}): {phases}')
+
+    def shutdown(self):
+        with self._lock:
+            self._traces.clear()
+
+
+class OTLPJsonFileExporter:
+    """
+    Appends finished spans to `path` as OTLP/JSON export requests, one per line, the format
+    read by the OpenTelemetry Collector's otlpjsonfile receiver.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, spans):
+        request = {'resourceSpans': [{
+            'resource': {'attributes': [_otlp_attribute('service.name', SERVICE_NAME)]},
+            'scopeSpans': [{'scope': {'name': SERVICE_NAME}, 'spans': [span.to_otlp() for span in spans]}],
+        }]}
+        line = json.dumps(request)
+        with self._lock, open(self.path, 'a') as file:
+            file.write(line + '\n')
+
+    def shutdown(self):
+        pass
+
+
+EXPORTERS = {
+    'none': NoOpSpanExporter,
+    'memory': InMemorySpanExporter,
+    'log': LoggingSpanExporter,
+    'otlp-json': OTLPJsonFileExporter,
+}
+
+
+class Tracer:
+    def __init__(self, exporter=None):
+        self.exporter = exporter or NoOpSpanExporter()
+
+    def start_span(self, name: str, **attributes) -> Span:
+        """Starts a span as the child of the current one and makes it current, end it with `Span.end`."""
+        parent = _current_span.get()
+        span = Span(
+            name=name,
+            trace_id=parent.trace_id if parent else os.urandom(16).hex(),
+            span_id=os.urandom(8).hex(),
+            parent_id=parent.span_id if parent else None,
+            start_time=time.time_ns(),
+            attributes=attributes,
+            _tracer=self,
+        )
+        span._token = _current_span.set(span)
+        return span
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        span = self.start_span(name, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            span.end(error=e)
+            raise
+        span.end()
+
+    def export(self, span: Span):
+        try:
+            self.exporter.export([span])
+        except Exception as e:
+            logger.warning(f' Unable to export span {span.name}: {e}')
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def configure_tracing(exporter: str = 'none', path: str = None) -> Tracer:
+    """Sets the exporter of the process wide tracer, one of `EXPORTERS`."""
+    if exporter not in EXPORTERS:
+        raise ValueError(f'Unsupported tracing exporter {exporter}, expected one of {list(EXPORTERS)}')
+    previous = _tracer.exporter
+    _tracer.exporter = EXPORTERS[exporter](path) if exporter == 'otlp-json' else EXPORTERS[exporter]()
+    previous.shutdown()
+    return _tracer
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def span(name: str, **attributes):
+    """Context manager tracing `name` with the process wide tracer."""
+    return _tracer.span(name, **attributes)
@@ -0,0 +1,181 @@
+import pickle
+import signal
+import logging
+import threading
+import traceback
+import multiprocessing
+from multiprocessing.connection import wait
+
+logger = logging.getLogger('osw-formatter')
+
+
+class WorkerError(Exception):
+    """An exception raised in a worker process that could not be sent back as is."""
+
+    def __init__(self, message, remote_traceback=None):
+        super().__init__(message)
+        self.remote_traceback = remote_traceback
+
+
+class WorkerCrashedError(WorkerError):
+    pass
+
+
+class WorkerTimeoutError(WorkerError):
+    pass
+
+
+def _worker_main(connection):
+    while True:
+        try:
+            job = connection.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        fn, args, kwargs = job
+        try:
+            result = fn(*args, **kwargs)
+            connection.send(('ok', result))
+        except BaseException as e:
+            remote_traceback = traceback.format_exc()
+            try:
+                pickle.dumps(e)
+                error = e
+            except Exception:
+                error = WorkerError(f'{type(e).__name__}: {e}', remote_traceback)
+            connection.send(('error', (error, remote_traceback)))
+            if getattr(e, 'retire_worker', False):
+                break
+    connection.close()
+
+
+def _describe_exit(exitcode) -> str:
+    if exitcode is not None and exitcode < 0:
+        try:
+            return f'was killed by {signal.Signals(-exitcode).name}'
+        except ValueError:
+            pass
+    return f'exited with code {exitcode}'
+
+
+class _Worker:
+    def __init__(self, context):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_connection,), daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.tasks = 0
+        self.retired = False
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def run(self, fn, args, kwargs, timeout=None):
+        self.tasks += 1
+        self.connection.send((fn, args, kwargs))
+        if not wait([self.connection, self.process.sentinel], timeout):
+            self.retired = True
+            self.process.kill()
+            self.process.join()
+            raise WorkerTimeoutError(f'Worker process {self.pid} was killed after {timeout:g}s without a result')
+        try:
+            status, payload = self.connection.recv()
+        except (EOFError, OSError):
+            self.process.join()
+            raise WorkerCrashedError(f'Worker process {self.pid} {_describe_exit(self.process.exitcode)}')
+        if status == 'ok':
+            return payload
+        error, remote_traceback = payload
+        self.retired = getattr(error, 'retire_worker', False)
+        logger.error(f' Conversion failed in worker process {self.pid}:\n{remote_traceback}')
+        raise error
+
+    def stop(self, timeout: float = 5):
+        if self.process.is_alive():
+            try:
+                self.connection.send(None)
+            except (OSError, ValueError):
+                pass
+            self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+
+
+class WorkerPool:
+    """
+    Runs callables in a bounded set of long lived worker processes.
+    Workers are started on demand and replaced after `max_tasks_per_child` jobs, or when they die,
+    so that memory held by a conversion is returned to the OS and a crash only fails its own job.
+    Callables, arguments and results must be picklable.
+    """
+
+    def __init__(self, size: int, max_tasks_per_child: int = None, start_method: str = 'spawn'):
+        self.size = size
+        self.max_tasks_per_child = max_tasks_per_child
+        self._context = multiprocessing.get_context(start_method)
+        self._condition = threading.Condition()
+        self._idle = []
+        self._workers = 0
+        self._closed = False
+
+    def run(self, fn, *args, **kwargs):
+        return self.run_with_timeout(None, fn, *args, **kwargs)
+
+    def run_with_timeout(self, timeout, fn, *args, **kwargs):
+        """Like `run`, the worker is killed and replaced if it has no result after `timeout` seconds."""
+        worker = self._acquire()
+        try:
+            return worker.run(fn, args, kwargs, timeout)
+        finally:
+            self._release(worker)
+
+    def shutdown(self):
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._workers -= len(idle)
+            self._condition.notify_all()
+        for worker in idle:
+            worker.stop()
+
+    def _acquire(self) -> _Worker:
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError('Worker pool is shut down')
+                if self._idle:
+                    return self._idle.pop()
+                if self._workers < self.size:
+                    self._workers += 1
+                    break
+                self._condition.wait()
+        try:
+            worker = _Worker(self._context)
+            logger.info(f' Started worker process {worker.pid}')
+            return worker
+        except Exception:
+            with self._condition:
+                self._workers -= 1
+                self._condition.notify()
+            raise
+
+    def _release(self, worker: _Worker):
+        retire = worker.retired or not worker.is_alive() or self._closed or (
+            self.max_tasks_per_child and worker.tasks >= self.max_tasks_per_child
+        )
+        if retire:
+            logger.info(f' Retiring worker process {worker.pid} after {worker.tasks} jobs')
+            worker.stop()
+        with self._condition:
+            if retire:
+                self._workers -= 1
+            else:
+                self._idle.append(worker)
+            self._condition.notify()
@@ -0,0 +1,345 @@
+import io
+import os
+import time
+import zlib
+import queue
+import struct
+import zipfile
+import threading
+import contextvars
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+STORED = 'stored'
+DEFLATED = 'deflated'
+COMPRESSION_METHODS = {STORED: zipfile.ZIP_STORED, DEFLATED: zipfile.ZIP_DEFLATED}
+
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+# Deflate looks back at most 32 KB, priming each block with this much of the previous one
+# keeps the ratio close to a single threaded stream
+DICTIONARY_SIZE = 32 * 1024
+
+
+def _deflate_block(block: bytes, level: int, dictionary: bytes, last: bool) -> bytes:
+    if dictionary:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL,
+                                      zlib.Z_DEFAULT_STRATEGY, dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    # A sync flush ends the block on a byte boundary without marking the stream as finished,
+    # so independently compressed blocks concatenate into one valid deflate stream
+    return compressor.compress(block) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class ParallelDeflateCompressor:
+    """
+    zlib compressor compatible drop-in that deflates fixed size blocks on a thread pool
+    (zlib releases the GIL) and returns the compressed blocks in order, like pigz.
+    At most `max_pending` blocks are held in memory.
+    """
+
+    def __init__(self, executor, level: int, block_size: int = DEFAULT_BLOCK_SIZE, max_pending: int = 8):
+        self.executor = executor
+        self.level = level
+        self.block_size = block_size
+        self.max_pending = max_pending
+        self._buffer = bytearray()
+        self._dictionary = b''
+        self._pending = deque()
+
+    def compress(self, data) -> bytes:
+        self._buffer += data
+        output = []
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[:self.block_size])
+            del self._buffer[:self.block_size]
+            self._submit(block, last=False)
+            while len(self._pending) > self.max_pending:
+                output.append(self._pending.popleft().result())
+        while self._pending and self._pending[0].done():
+            output.append(self._pending.popleft().result())
+        return b''.join(output)
+
+    def flush(self) -> bytes:
+        self._submit(bytes(self._buffer), last=True)
+        self._buffer = bytearray()
+        output = [future.result() for future in self._pending]
+        self._pending.clear()
+        return b''.join(output)
+
+    def _submit(self, block: bytes, last: bool):
+        self._pending.append(self.executor.submit(_deflate_block, block, self.level, self._dictionary, last))
+        self._dictionary = block[-DICTIONARY_SIZE:]
+
+
+# A member whose size comes close to this is written with zip64 sizes up front, its
+# compressed size is only known once its data has been written
+ZIP64_LIMIT = (1 << 31) - 1
+ZIP_MAX = 0xFFFFFFFF
+ZIP_MAX_ENTRIES = 0xFFFF
+# General purpose flags: sizes and CRC follow the data, UTF-8 file name
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+VERSION_DEFAULT = 20
+VERSION_ZIP64 = 45
+# Made on Unix, so the external attributes hold the file mode
+CREATE_SYSTEM = 3
+
+
+class ParallelZipWriter:
+    """
+    Writes a zip archive of deflated members, each compressed by a ParallelDeflateCompressor,
+    or of members copied as is from another archive. The CRC and sizes of a member are only
+    known once its data is written, so they follow it in a data descriptor and `output` is
+    only ever appended to, it may be unseekable. Members and sizes beyond the classic zip
+    limits get zip64 fields.
+    """
+
+    def __init__(self, output, executor=None, level: int = 6, block_size: int = DEFAULT_BLOCK_SIZE,
+                 max_pending: int = 8):
+        self.output = output
+        self.executor = executor
+        self.level = level
+        self.block_size = block_size
+        self.max_pending = max_pending
+        self._offset = 0
+        self._entries = []
+        self._member = None
+
+    def add(self, path: str, arcname: str):
+        stat = os.stat(path)
+        self._start_member(arcname, zipfile.ZIP_DEFLATED, time.localtime(stat.st_mtime)[:6],
+                           (stat.st_mode & 0xFFFF) << 16, zip64=stat.st_size * 1.05 > ZIP64_LIMIT)
+        compressor = ParallelDeflateCompressor(self.executor, self.level, block_size=self.block_size,
+                                               max_pending=self.max_pending)
+        crc = 0
+        size = 0
+        compressed_size = 0
+        with open(path, 'rb') as source:
+            for chunk in iter(lambda: source.read(self.block_size), b''):
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+                compressed = compressor.compress(chunk)
+                compressed_size += len(compressed)
+                self._write(compressed)
+        compressed = compressor.flush()
+        compressed_size += len(compressed)
+        self._write(compressed)
+        self._end_member(crc, compressed_size, size)
+
+    def copy(self, info: zipfile.ZipInfo, arcname: str, source):
+        """Adds the member `info` of another archive as `arcname`, `source` is positioned at its compressed data."""
+        self._start_member(arcname, info.compress_type, info.date_time, info.external_attr,
+                           zip64=max(info.file_size, info.compress_size) > ZIP64_LIMIT)
+        remaining = info.compress_size
+        while remaining:
+            chunk = source.read(min(self.block_size, remaining))
+            if not chunk:
+                raise zipfile.BadZipFile(f'{info.filename} is truncated')
+            self._write(chunk)
+            remaining -= len(chunk)
+        self._end_member(info.CRC, info.compress_size, info.file_size)
+
+    def close(self):
+        directory_offset = self._offset
+        for name, flags, compress_type, dos_time, dos_date, crc, compressed_size, size, header_offset, \
+                attributes in self._entries:
+            # The zip64 extra lists the fields that do not fit, in this order
+            zip64_fields = [value for value in (size, compressed_size, header_offset) if value >= ZIP_MAX]
+            extra = struct.pack(f'<HH{len(zip64_fields)}Q', 1, 8 * len(zip64_fields), *zip64_fields) \
+                if zip64_fields else b''
+            version = VERSION_ZIP64 if extra else VERSION_DEFAULT
+            self._write(struct.pack(
+                '<IHHHHHHIIIHHHHHII', 0x02014b50, CREATE_SYSTEM << 8 | version, version, flags,
+                compress_type, dos_time, dos_date, crc, min(compressed_size, ZIP_MAX), min(size, ZIP_MAX),
+                len(name), len(extra), 0, 0, 0, attributes, min(header_offset, ZIP_MAX)
+            ) + name + extra)
+        directory_size = self._offset - directory_offset
+        entries = len(self._entries)
+        if entries >= ZIP_MAX_ENTRIES or directory_offset >= ZIP_MAX or directory_size >= ZIP_MAX:
+            zip64_end_offset = self._offset
+            self._write(struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, CREATE_SYSTEM << 8 | VERSION_ZIP64,
+                                    VERSION_ZIP64, 0, 0, entries, entries, directory_size, directory_offset))
+            self._write(struct.pack('<IIQI', 0x07064b50, 0, zip64_end_offset, 1))
+        self._write(struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, min(entries, ZIP_MAX_ENTRIES),
+                                min(entries, ZIP_MAX_ENTRIES), min(directory_size, ZIP_MAX),
+                                min(directory_offset, ZIP_MAX), 0))
+
+    def _start_member(self, arcname: str, compress_type: int, date_time, attributes: int, zip64: bool):
+        name = arcname.encode('utf-8')
+        flags = FLAG_DATA_DESCRIPTOR | (0 if arcname.isascii() else FLAG_UTF8)
+        dos_time, dos_date = _dos_date_time(date_time)
+        extra = struct.pack('<HHQQ', 1, 16, 0, 0) if zip64 else b''
+        self._member = (arcname, name, flags, compress_type, dos_time, dos_date, self._offset, attributes, zip64)
+        self._write(struct.pack(
+            '<IHHHHHIIIHH', 0x04034b50, VERSION_ZIP64 if zip64 else VERSION_DEFAULT, flags, compress_type,
+            dos_time, dos_date, 0, ZIP_MAX if zip64 else 0, ZIP_MAX if zip64 else 0, len(name), len(extra)
+        ) + name + extra)
+
+    def _end_member(self, crc: int, compressed_size: int, size: int):
+        arcname, name, flags, compress_type, dos_time, dos_date, header_offset, attributes, zip64 = self._member
+        if not zip64 and max(size, compressed_size) > ZIP_MAX:
+            raise zipfile.LargeZipFile(f'{arcname} grew past the zip64 limit while it was written')
+        self._write(struct.pack('<IIQQ' if zip64 else '<IIII', 0x08074b50, crc, compressed_size, size))
+        self._entries.append((name, flags, compress_type, dos_time, dos_date, crc, compressed_size, size,
+                              header_offset, attributes))
+        self._member = None
+
+    def _write(self, data: bytes):
+        if data:
+            self.output.write(data)
+            self._offset += len(data)
+
+
+def _dos_date_time(date_time):
+    year, month, day, hour, minute, second = date_time
+    if year < 1980:
+        year, month, day, hour, minute, second = 1980, 1, 1, 0, 0, 0
+    return hour << 11 | minute << 5 | second // 2, (year - 1980) << 9 | month << 5 | day
+
+
+def rename_members(source: str, output: str, rename):
+    """
+    Copies the zip archive at `source` to `output` with each member renamed by `rename`,
+    a function of the member name. The compressed data is copied as is, not recompressed.
+    """
+    with zipfile.ZipFile(source) as archive, open(source, 'rb') as data, open(output, 'wb') as destination:
+        writer = ParallelZipWriter(destination)
+        for info in archive.infolist():
+            # The local header repeats the name and may carry its own extra field, both are skipped
+            data.seek(info.header_offset)
+            header = data.read(30)
+            if len(header) != 30 or header[:4] != b'PK\x03\x04':
+                raise zipfile.BadZipFile(f'Bad local header for {info.filename}')
+            name_length, extra_length = struct.unpack('<HH', header[26:30])
+            data.seek(name_length + extra_length, os.SEEK_CUR)
+            writer.copy(info, rename(info.filename), data)
+        writer.close()
+
+
+def write_zip(output, files, compression: str = DEFLATED, level: int = 6, workers: int = 1,
+              chunk_size: int = DEFAULT_BLOCK_SIZE):
+    """
+    Writes `files` into a zip archive at `output` (a path or a writable file object),
+    each under its base name. With `workers` > 1, deflated members are compressed in
+    parallel blocks by a ParallelZipWriter; the archive stays readable by any zip tool.
+    """
+    if compression not in COMPRESSION_METHODS:
+        raise ValueError(f'Unsupported zip compression {compression}, expected one of {list(COMPRESSION_METHODS)}')
+    compress_type = COMPRESSION_METHODS[compression]
+    if compress_type != zipfile.ZIP_DEFLATED or workers <= 1:
+        with zipfile.ZipFile(output, 'w', compression=compress_type, compresslevel=level) as zip_file:
+            for file in files:
+                zip_file.write(file, os.path.basename(file))
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor, \
+            (open(output, 'wb') if isinstance(output, (str, os.PathLike)) else nullcontext(output)) as archive:
+        writer = ParallelZipWriter(archive, executor, level, block_size=chunk_size, max_pending=workers * 2)
+        for file in files:
+            writer.add(file, os.path.basename(file))
+        writer.close()
+
+
+class _StreamClosed(Exception):
+    pass
+
+
+class _QueueWriter(io.RawIOBase):
+    def __init__(self, stream):
+        self.stream = stream
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if len(data):
+            self.stream._put(bytes(data))
+        return len(data)
+
+
+class ZipStream(io.RawIOBase):
+    """
+    Readable stream of a zip archive of `files`. The archive is written by a background
+    thread while it is being read, with at most `max_buffered` writes held in memory,
+    so it never lands on disk. An error while zipping is raised from `read`.
+
+    `compress_seconds` is the time spent writing the archive, without the time spent waiting
+    for the reader. The thread runs `trace()`, a context manager, around the writing, in the
+    context the stream was created in, and passes `compress_seconds` to `observe` at the end.
+    """
+
+    def __init__(self, files, name: str, max_buffered: int = 16, trace=None, observe=None, **zip_options):
+        self.name = name
+        self.compress_seconds = 0.0
+        self._trace = trace or nullcontext
+        self._observe = observe
+        self._waited = 0.0
+        self._queue = queue.Queue(maxsize=max_buffered)
+        self._stopped = threading.Event()
+        self._error = None
+        self._eof = False
+        self._remaining = memoryview(b'')
+        context = contextvars.copy_context()
+        self._thread = threading.Thread(target=context.run, args=(self._produce, files, zip_options), daemon=True)
+        self._thread.start()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self._remaining:
+            if self._eof:
+                return 0
+            chunk = self._queue.get()
+            if chunk is None:
+                self._eof = True
+                if self._error is not None:
+                    raise self._error
+                return 0
+            self._remaining = memoryview(chunk)
+        size = min(len(buffer), len(self._remaining))
+        buffer[:size] = self._remaining[:size]
+        self._remaining = self._remaining[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._stopped.set()
+            self._thread.join()
+        super().close()
+
+    def _produce(self, files, zip_options):
+        start_time = time.monotonic()
+        try:
+            with self._trace() as trace_span:
+                try:
+                    write_zip(_QueueWriter(self), files, **zip_options)
+                finally:
+                    self.compress_seconds = time.monotonic() - start_time - self._waited
+                    if trace_span is not None:
+                        trace_span.set_attribute('compress_seconds', round(self.compress_seconds, 3))
+            if self._observe is not None:
+                self._observe(self.compress_seconds)
+        except _StreamClosed:
+            pass
+        except Exception as e:
+            self._error = e
+        finally:
+            try:
+                self._put(None)
+            except _StreamClosed:
+                pass
+
+    def _put(self, chunk):
+        start_time = time.monotonic()
+        try:
+            while not self._stopped.is_set():
+                try:
+                    self._queue.put(chunk, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+            raise _StreamClosed()
+        finally:
+            self._waited += time.monotonic() - start_time
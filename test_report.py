@@ -10,6 +10,28 @@ from tests.unit_tests.models.test_osw_ondemand_response import TestOSWOnDemandRe
 from tests.unit_tests.models.test_osw_validation_message import TestOSWValidationMessage
 from tests.unit_tests.test_osw_format import TestOSWFormat, TestOSMFormat, TestOSWFormatDownload, TesOSWFormatCleanUp
 from tests.unit_tests.models.test_queue_message_content import TestToJson, TestValidationResult
+from tests.unit_tests.storage.test_local_storage import TestLocalStorageClient
+from tests.unit_tests.storage.test_blob_transfer import TestBlobTransfer
+from tests.unit_tests.storage.test_download_cache import TestDownloadCache
+from tests.unit_tests.test_result_cache import TestResultCache
+from tests.unit_tests.test_worker_pool import TestWorkerPool
+from tests.unit_tests.test_resource_limits import TestResourceLimits
+from tests.unit_tests.test_admission import TestAdmissionController, TestAvailableMemory
+from tests.unit_tests.test_scheduler import TestLaneScheduler
+from tests.unit_tests.test_zip_writer import TestZipWriter
+from tests.unit_tests.test_handle_pool import TestHandlePool
+from tests.unit_tests.test_batch_publisher import TestBatchPublisher
+from tests.unit_tests.test_memory_policy import TestGCMonitor, TestMemoryPolicy
+from tests.unit_tests.test_conversion_loop import TestConversionLoop
+from tests.unit_tests.test_progress import TestProgressReporter
+from tests.unit_tests.test_metrics import TestMetrics
+from tests.unit_tests.test_tracing import TestTracer
+from tests.unit_tests.test_profiler import TestProfiler
+from tests.unit_tests.test_end_to_end_benchmark import TestEndToEndBenchmark
+from tests.unit_tests.test_local_backend import TestLocalBackend
+from tests.unit_tests.test_soak_benchmark import TestSoakBenchmark
+from tests.unit_tests.test_tiling import TestTiling
+from tests.unit_tests.test_clip import TestClip, TestOSWFormatClip
 
 if __name__ == '__main__':
     # Create a test suite
@@ -27,6 +49,31 @@ if __name__ == '__main__':
     test_suite.addTest(unittest.makeSuite(TesOSWFormatCleanUp))
     test_suite.addTest(unittest.makeSuite(TestToJson))
     test_suite.addTest(unittest.makeSuite(TestValidationResult))
+    test_suite.addTest(unittest.makeSuite(TestLocalStorageClient))
+    test_suite.addTest(unittest.makeSuite(TestBlobTransfer))
+    test_suite.addTest(unittest.makeSuite(TestDownloadCache))
+    test_suite.addTest(unittest.makeSuite(TestResultCache))
+    test_suite.addTest(unittest.makeSuite(TestWorkerPool))
+    test_suite.addTest(unittest.makeSuite(TestResourceLimits))
+    test_suite.addTest(unittest.makeSuite(TestAdmissionController))
+    test_suite.addTest(unittest.makeSuite(TestAvailableMemory))
+    test_suite.addTest(unittest.makeSuite(TestLaneScheduler))
+    test_suite.addTest(unittest.makeSuite(TestZipWriter))
+    test_suite.addTest(unittest.makeSuite(TestHandlePool))
+    test_suite.addTest(unittest.makeSuite(TestBatchPublisher))
+    test_suite.addTest(unittest.makeSuite(TestGCMonitor))
+    test_suite.addTest(unittest.makeSuite(TestMemoryPolicy))
+    test_suite.addTest(unittest.makeSuite(TestConversionLoop))
+    test_suite.addTest(unittest.makeSuite(TestProgressReporter))
+    test_suite.addTest(unittest.makeSuite(TestMetrics))
+    test_suite.addTest(unittest.makeSuite(TestTracer))
+    test_suite.addTest(unittest.makeSuite(TestProfiler))
+    test_suite.addTest(unittest.makeSuite(TestEndToEndBenchmark))
+    test_suite.addTest(unittest.makeSuite(TestLocalBackend))
+    test_suite.addTest(unittest.makeSuite(TestSoakBenchmark))
+test_suite.addTest(unittest.makeSuite(TestTiling))
+test_suite.addTest(unittest.makeSuite(TestClip))
+test_suite.addTest(unittest.makeSuite(TestOSWFormatClip))
 
     # Define the output file for the HTML report
     output_file = 'test_report.html'
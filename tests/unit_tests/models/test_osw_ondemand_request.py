@@ -41,6 +41,14 @@ class TestOSWOnDemandRequest(unittest.TestCase):
         # Ensure data is an instance of ResponseData after __post_init__
         self.assertIsInstance(osw_request.data, RequestData)
 
+    def test_polygon(self):
+        data = {'sourceUrl': 'https://example.com/source.pbf', 'jobId': 789, 'source': 'osm', 'target': 'osw'}
+        self.assertIsNone(OSWOnDemandRequest(messageType='on_demand', messageId='1', data=data).data.polygon)
+
+        bbox = [-122.14, 47.64, -122.13, 47.65]
+        osw_request = OSWOnDemandRequest(messageType='on_demand', messageId='1', data={**data, 'polygon': bbox})
+        self.assertEqual(osw_request.data.polygon, bbox)
+
     def test_invalid_data_type(self):
         # Test when data is not a dictionary
         with self.assertRaises(TypeError):
@@ -33,6 +33,13 @@ class TestOSWOnDemandResponse(unittest.TestCase):
         self.assertEqual(osw_response.data.success, data['success'])
         self.assertEqual(osw_response.data.message, data['message'])
 
+    def test_request_polygon_is_not_echoed(self):
+        data = {'sourceUrl': 'https://example.com/source.osm', 'jobId': '789', 'source': 'osm', 'target': 'osw',
+                'polygon': [-122.35, 47.6, -122.3, 47.65], 'status': 'completed', 'success': True}
+        osw_response = OSWOnDemandResponse(messageType='on_demand_response', messageId='123456', data=data)
+        self.assertFalse(hasattr(osw_response.data, 'polygon'))
+        self.assertEqual(osw_response.data.status, 'completed')
+
     def test_post_init(self):
         # Test post-init behavior
         message_type = 'on_demand_response'
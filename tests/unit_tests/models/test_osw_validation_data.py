@@ -49,6 +49,12 @@ class TestOSWValidationData(unittest.TestCase):
         self.assertEqual(json_data['tdei_project_group_id'], 'group_id')
         self.assertEqual(json_data['file_upload_path'], 'some_url')
 
+    def test_polygon(self):
+        polygon = {'type': 'Polygon', 'coordinates': [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]}
+        self.assertIsNone(OSWValidationData({'file_upload_path': 'some_url'}).polygon)
+        self.assertEqual(OSWValidationData({'file_upload_path': 'some_url', 'polygon': polygon}).polygon, polygon)
+        self.assertNotIn('polygon', OSWValidationData({'file_upload_path': 'some_url', 'polygon': polygon}).to_json())
+
     def test_remove_underscore(self):
         underscored_string = '_test_string'
         result = remove_underscore(underscored_string)
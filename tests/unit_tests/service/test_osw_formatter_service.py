@@ -69,7 +69,7 @@ class TestOSWFomatterService(unittest.TestCase):
         # Mock OSWFormat instance
         mock_osw_instance = MagicMock()
         mock_osw_instance.format.return_value = Mock(status=True, error=None, generated_files='file1.xml')
-        mock_osw_instance.create_zip.return_value = 'file1.zip'
+        mock_osw_instance.stream_zip.return_value = 'file1.zip'
         mock_osw_format.return_value = mock_osw_instance
         mock_download_single_file.return_value = f'{DOWNLOAD_PATH}/osw.zip'
 
@@ -86,7 +86,7 @@ class TestOSWFomatterService(unittest.TestCase):
 
         # Assert
         mock_send_status.assert_called_once()
-        mock_osw_instance.create_zip.assert_called_once_with(['file1.xml'])
+        mock_osw_instance.stream_zip.assert_called_once_with(['file1.xml'])
 
     @patch.object(OSWFomatterService, 'send_status')
     def test_format_failure(self, mock_send_status):
@@ -96,7 +96,7 @@ class TestOSWFomatterService(unittest.TestCase):
         # Mock OSWFormat instance
         with patch.object(OSWFormat, '__init__', return_value=None), \
                 patch.object(OSWFormat, 'format', return_value=Mock(status=True, error=None, generated_files='file1.xml')), \
-                patch.object(OSWFormat, 'create_zip', return_value='file1.zip'):
+                patch.object(OSWFormat, 'stream_zip', return_value='file1.zip'):
             self.OSW_format = OSWFormat(file_path=file_path, storage_client=MagicMock())
 
             # Arrange
@@ -121,7 +121,7 @@ class TestOSWFomatterService(unittest.TestCase):
         # Mock OSWFormat instance
         with patch.object(OSWFormat, '__init__', return_value=None), \
                 patch.object(OSWFormat, 'format', return_value=Mock(status=True, error=None, generated_files='file1.xml')), \
-                patch.object(OSWFormat, 'create_zip', return_value='file1.zip'):
+                patch.object(OSWFormat, 'stream_zip', return_value='file1.zip'):
             self.OSW_format = OSWFormat(file_path=file_path, storage_client=MagicMock())
 
             # Arrange
@@ -206,7 +206,7 @@ class TestOSWFomatterService(unittest.TestCase):
     def test_process_on_demand_format_success(self, mock_format):
         file_path = f'{SAVED_FILE_PATH}/osw.zip'
         with patch.object(OSWFormat, '__init__', return_value=None), \
-                patch.object(OSWFormat, 'create_zip', return_value='file1.zip') as mock_create_zip:
+                patch.object(OSWFormat, 'stream_zip', return_value='file1.zip') as mock_stream_zip:
             mock_init = OSWFormat(file_path=file_path, storage_client=MagicMock())
             mock_init.file_path = file_path
             mock_init.file_relative_path = file_path.split('/')[-1]
@@ -226,7 +226,7 @@ class TestOSWFomatterService(unittest.TestCase):
             self.formatter.process_on_demand_format(request=request)
 
             mock_format.assert_called_once()
-            mock_create_zip.assert_called_once_with(['file1.xml'])
+            mock_stream_zip.assert_called_once_with(['file1.xml'])
 
     @patch.object(OSWFormat, 'format')
     def test_process_on_demand_format_failure(self, mock_format):
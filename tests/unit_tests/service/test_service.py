@@ -1,9 +1,27 @@
+import io
+import os
+import shutil
+import zipfile
+import tempfile
+import time
 import unittest
+import threading
 from unittest.mock import patch, MagicMock, mock_open, PropertyMock
 from src.service.osw_formatter_service import OSWFomatterService
 from src.models.osw_ondemand_request import OSWOnDemandRequest, RequestData
 from src.models.osw_ondemand_response import OSWOnDemandResponse
 from src.models.osw_validation_message import OSWValidationMessage
+from src.result_cache import CachedResponse
+from src.resource_limits import ResourceLimitExceeded, ResourceUsage
+from src.osw_format import OSWFormat
+from src.progress import ConversionProgress
+from src.metrics import STAGE_SECONDS
+from src.tracing import configure_tracing, STATUS_ERROR
+from src.storage import LocalStorageClient
+from src.local_backend import LocalCore, LocalBroker, InProcessTopic
+from src.scheduler import LaneScheduler
+from python_ms_core.core.queue.models.queue_message import QueueMessage
+from python_ms_core.core.topic.azure_topic import AzureTopic
 
 
 class TestOSWFormatterService(unittest.TestCase):
@@ -191,8 +209,8 @@ class TestOSWFormatterService(unittest.TestCase):
         mock_format_result.generated_files = ['file1.geojson', 'file2.geojson']
         mock_osw_instance.format.return_value = mock_format_result
 
-        # Mock create_zip return value
-        mock_osw_instance.create_zip.return_value = 'zipped_file.zip'
+        # Mock stream_zip return value
+        mock_osw_instance.stream_zip.return_value = 'zipped_file.zip'
 
         self.service.upload_to_azure = MagicMock()
         self.service.upload_to_azure.return_value = 'uploaded_path'
@@ -201,7 +219,7 @@ class TestOSWFormatterService(unittest.TestCase):
         self.service.format(received_message)
 
         # Assert
-        mock_osw_instance.create_zip.assert_called_once_with(['file1.geojson', 'file2.geojson'])
+        mock_osw_instance.stream_zip.assert_called_once_with(['file1.geojson', 'file2.geojson'])
         self.service.upload_to_azure.assert_called_once()
 
     @patch('src.service.osw_formatter_service.OSWFormat')
@@ -230,7 +248,7 @@ class TestOSWFormatterService(unittest.TestCase):
         mock_format_result.generated_files = 'file1.xml'
         mock_osw_instance.format.return_value = mock_format_result
 
-        mock_osw_instance.create_zip.return_value = 'zipped_file.zip'
+        mock_osw_instance.stream_zip.return_value = 'zipped_file.zip'
 
         self.service.upload_to_azure = MagicMock()
         self.service.upload_to_azure.return_value = 'uploaded_path'
@@ -238,7 +256,7 @@ class TestOSWFormatterService(unittest.TestCase):
         # Act
         self.service.format(received_message)
 
-        mock_osw_instance.create_zip.assert_called_once_with(['file1.xml'])
+        mock_osw_instance.stream_zip.assert_called_once_with(['file1.xml'])
         self.service.upload_to_azure.assert_called_once()
 
     @patch('src.service.osw_formatter_service.OSWFormat')
@@ -267,8 +285,8 @@ class TestOSWFormatterService(unittest.TestCase):
         mock_format_result.generated_files = ['file1.geojson', 'file2.geojson']
         mock_osw_instance.format.return_value = mock_format_result
 
-        # Mock create_zip return value
-        mock_osw_instance.create_zip.return_value = 'zipped_file.zip'
+        # Mock stream_zip return value
+        mock_osw_instance.stream_zip.return_value = 'zipped_file.zip'
 
         self.service.upload_to_azure_on_demand = MagicMock()
         self.service.upload_to_azure_on_demand.return_value = 'uploaded_path'
@@ -277,7 +295,7 @@ class TestOSWFormatterService(unittest.TestCase):
         self.service.process_on_demand_format(received_message)
 
         # Assert
-        mock_osw_instance.create_zip.assert_called_once_with(['file1.geojson', 'file2.geojson'])
+        mock_osw_instance.stream_zip.assert_called_once_with(['file1.geojson', 'file2.geojson'])
         self.service.upload_to_azure_on_demand.assert_called_once()
 
     @patch('src.service.osw_formatter_service.OSWFormat')
@@ -306,8 +324,8 @@ class TestOSWFormatterService(unittest.TestCase):
         mock_format_result.generated_files = 'file1.xml'
         mock_osw_instance.format.return_value = mock_format_result
 
-        # Mock create_zip return value
-        mock_osw_instance.create_zip.return_value = 'zipped_file.zip'
+        # Mock stream_zip return value
+        mock_osw_instance.stream_zip.return_value = 'zipped_file.zip'
 
         self.service.upload_to_azure_on_demand = MagicMock()
         self.service.upload_to_azure_on_demand.return_value = 'uploaded_path'
@@ -316,9 +334,31 @@ class TestOSWFormatterService(unittest.TestCase):
         self.service.process_on_demand_format(received_message)
 
         # Assert
-        mock_osw_instance.create_zip.assert_called_once_with(['file1.xml'])
+        mock_osw_instance.stream_zip.assert_called_once_with(['file1.xml'])
         self.service.upload_to_azure_on_demand.assert_called_once()
 
+    @patch('src.service.osw_formatter_service.OSWFormat')
+    def test_process_on_demand_format_does_not_echo_polygon(self, mock_osw_format):
+        polygon = [-122.35, 47.6, -122.3, 47.65]
+        received_message = OSWOnDemandRequest(
+            messageId='1234',
+            messageType='message_type',
+            data={'sourceUrl': 'http://example.com/file.osm', 'jobId': '1234', 'source': 'osm', 'target': 'osw',
+                  'polygon': polygon}
+        )
+        mock_osw_instance = MagicMock()
+        mock_osw_instance.format.return_value = MagicMock(status=True, error=None, generated_files=['file1.geojson'])
+        mock_osw_format.return_value = mock_osw_instance
+        self.service.upload_to_azure_on_demand = MagicMock(return_value='uploaded_path')
+        self.service.publish = MagicMock()
+
+        self.service.process_on_demand_format(received_message)
+
+        self.assertEqual(mock_osw_format.call_args[1]['polygon'], polygon)
+        published = self.service.publish.call_args[1]['data'].data
+        self.assertTrue(published['success'])
+        self.assertNotIn('polygon', published)
+
     @patch('src.service.osw_formatter_service.OSWFormat')
     @patch('src.service.osw_formatter_service.logger')
     def test_process_on_demand_format_exception(self, mock_logger, mock_osw_format):
@@ -365,6 +405,142 @@ class TestOSWFormatterService(unittest.TestCase):
         self.assertFalse(response.data.success)
         self.assertEqual(response.data.formattedUrl, '')
 
+    @patch('src.service.osw_formatter_service.OSWFormat')
+    def test_format_reports_resource_limit_exceeded(self, mock_osw_format):
+        self.service.send_status = MagicMock()
+        received_message = OSWValidationMessage({
+            'messageId': '1234',
+            'messageType': 'message_type',
+            'data': {
+                'file_upload_path': 'http://example.com/file.osm',
+                'tdei_project_group_id': '1',
+                'formatted_url': '',
+                'success': False,
+                'message': ''
+            }
+        })
+        mock_osw_format.return_value.format.side_effect = ResourceLimitExceeded(
+            'memory (512 MB)', ResourceUsage(peak_rss=511 * 1024 * 1024, cpu_time=2.0)
+        )
+
+        self.service.format(received_message)
+
+        result = self.service.send_status.call_args[1]['result']
+        self.assertFalse(result.is_valid)
+        self.assertIn('exceeded the memory (512 MB) limit (peak RSS 511 MB, CPU time 2.0s)', result.validation_message)
+
+    @patch('src.service.osw_formatter_service.OSWFormat')
+    def test_format_is_admitted_and_released(self, mock_osw_format):
+        self.service.send_status = MagicMock()
+        self.service.admission = MagicMock()
+        received_message = OSWValidationMessage({
+            'messageId': '1234',
+            'messageType': 'message_type',
+            'data': {
+                'file_upload_path': 'http://example.com/file.pbf',
+                'tdei_project_group_id': '1',
+                'formatted_url': '',
+                'success': False,
+                'message': ''
+            }
+        })
+        mock_osw_format.return_value.get_input_size.return_value = 100
+        mock_osw_format.return_value.format.side_effect = Exception('Mocked formatting exception')
+
+        self.service.format(received_message)
+
+        self.service.admission.estimate.assert_called_once_with(mock_osw_format.return_value.file_path, 100)
+        self.service.admission.acquire.assert_called_once_with(self.service.admission.estimate.return_value)
+        self.service.admission.release.assert_called_once_with(self.service.admission.acquire.return_value)
+        self.assertEqual(self.service.scheduler.running, {'fast': 0, 'bulk': 0})
+
+    @patch('src.service.osw_formatter_service.Core')
+    def test_listening_starts_after_the_service_is_built(self, mock_core):
+        built = []
+
+        def start_listening(service):
+            built.append(all(getattr(service, name, None) is not None
+                             for name in ['memory_policy', 'scheduler', 'admission', 'download_dir']))
+
+        with patch.object(OSWFomatterService, 'start_listening', autospec=True, side_effect=start_listening):
+            service = OSWFomatterService()
+            service.listening_thread.join(timeout=5)
+        self.assertEqual(built, [True])
+        service.memory_policy.stop()
+        if service.worker_pool is not None:
+            service.worker_pool.shutdown()
+
+    @patch('src.service.osw_formatter_service.Core')
+    def test_receive_window_follows_admission(self, mock_core):
+        with patch.multiple(OSWFomatterService._settings, admission_control_enabled=True, admission_max_jobs=6,
+                            max_concurrent_messages=2), \
+                patch('src.service.osw_formatter_service.threading.Thread'):
+            service = OSWFomatterService()
+        mock_core.return_value.get_topic.assert_called_once_with(topic_name=unittest.mock.ANY,
+                                                                 max_concurrent_messages=6)
+        self.assertEqual(service.admission.max_jobs, 6)
+        self.assertLessEqual(sum(service.scheduler.budgets.values()), 6)
+        service.memory_policy.stop()
+        if service.worker_pool is not None:
+            service.worker_pool.shutdown()
+
+        with patch.object(OSWFomatterService._settings, 'admission_control_enabled', False):
+            self.assertEqual(OSWFomatterService._settings.get_receive_window(), 2)
+
+    @patch('src.service.osw_formatter_service.OSWFormat')
+    def test_lane_is_released_when_admission_fails(self, mock_osw_format):
+        self.service.send_status = MagicMock()
+        self.service.admission = MagicMock()
+        self.service.admission.estimate.side_effect = OSError('download directory unavailable')
+        received_message = OSWValidationMessage({
+            'messageId': '1234',
+            'messageType': 'message_type',
+            'data': {'file_upload_path': 'http://example.com/file.pbf', 'tdei_project_group_id': '1'}
+        })
+        mock_osw_format.return_value.get_input_size.return_value = 100
+
+        self.service.format(received_message)
+
+        self.assertFalse(self.service.send_status.call_args[1]['result'].is_valid)
+        mock_osw_format.return_value.format.assert_not_called()
+        self.service.admission.release.assert_not_called()
+        self.assertEqual(self.service.scheduler.running, {'fast': 0, 'bulk': 0})
+
+    @patch('src.service.osw_formatter_service.OSWFormat')
+    def test_format_is_traced(self, mock_osw_format):
+        received_message = OSWValidationMessage({
+            'messageId': '1234',
+            'messageType': 'message_type',
+            'data': {'file_upload_path': 'http://example.com/file.osm', 'tdei_project_group_id': '1'}
+        })
+        mock_osw_format.return_value.format.side_effect = Exception('Mocked formatting exception')
+        exporter = configure_tracing('memory').exporter
+        try:
+            self.service.format(received_message)
+        finally:
+            configure_tracing('none')
+
+        spans = {span.name: span for span in exporter.get_finished_spans()}
+        self.assertEqual(spans['format'].attributes['job_id'], '1234')
+        self.assertEqual(spans['format'].status, STATUS_ERROR)
+        self.assertEqual(spans['publish'].parent_id, spans['format'].span_id)
+        self.assertEqual(spans['admission'].trace_id, spans['format'].trace_id)
+
+    @patch('src.service.osw_formatter_service.OSWFormat')
+    def test_format_applies_memory_policy(self, mock_osw_format):
+        self.service.send_status = MagicMock()
+        self.service.memory_policy = MagicMock()
+        received_message = OSWValidationMessage({
+            'messageId': '1234',
+            'messageType': 'message_type',
+            'data': {'file_upload_path': 'http://example.com/file.osm', 'tdei_project_group_id': '1'}
+        })
+        mock_osw_format.return_value.format.side_effect = Exception('Mocked formatting exception')
+
+        self.service.format(received_message)
+
+        self.service.memory_policy.after_job.assert_called_once()
+
     @patch('src.service.osw_formatter_service.open', new_callable=mock_open, read_data=b"mock file content")
     @patch('src.service.osw_formatter_service.OSWFomatterService')
     def test_upload_to_azure_on_demand(self, mock_service, mock_open_file):
@@ -392,6 +568,353 @@ class TestOSWFormatterService(unittest.TestCase):
         mock_open_file.assert_called_once_with(local_url, "rb")
         self.assertEqual(result, "https://example.com/mock_remote_url")
 
+    def test_upload_to_azure_on_demand_from_zip_stream(self):
+        root_dir = tempfile.mkdtemp()
+        source = os.path.join(root_dir, 'edges.geojson')
+        with open(source, 'wb') as file:
+            file.write(b'{"type": "FeatureCollection"}' * 1000)
+        self.service.storage_client = LocalStorageClient(os.path.join(root_dir, 'storage'))
+        with patch.object(OSWFormat, '__init__', return_value=None):
+            formatter = OSWFormat()
+        formatter.download_dir = root_dir
+        formatter.prefix = 'job'
+
+        stream = self.service._prepare_upload_file(formatter=formatter, generated_files=[source])
+        result = self.service.upload_to_azure_on_demand('jobs/job/osw/job.zip', stream)
+
+        self.assertTrue(stream.closed)
+        self.assertFalse(os.path.exists(os.path.join(root_dir, 'job', 'job.zip')))
+        blob = self.service.storage_client.get_file_from_url('test_container', result)
+        with zipfile.ZipFile(io.BytesIO(blob.get_stream())) as archive:
+            self.assertEqual(archive.read('edges.geojson'), b'{"type": "FeatureCollection"}' * 1000)
+        shutil.rmtree(root_dir, ignore_errors=True)
+
+    def test_streamed_zip_is_recorded_as_zip_stage(self):
+        root_dir = tempfile.mkdtemp()
+        source = os.path.join(root_dir, 'edges.geojson')
+        with open(source, 'wb') as file:
+            file.write(b'{"type": "FeatureCollection"}' * 1000)
+        self.service.storage_client = LocalStorageClient(os.path.join(root_dir, 'storage'))
+        with patch.object(OSWFormat, '__init__', return_value=None):
+            formatter = OSWFormat()
+        formatter.download_dir = root_dir
+        formatter.prefix = 'job'
+        zipped = STAGE_SECONDS.count(stage='zip')
+        exporter = configure_tracing('memory').exporter
+        try:
+            # The default configuration streams the zip into the upload
+            self.assertTrue(self.service._settings.zip_streaming)
+            stream = self.service._prepare_upload_file(formatter=formatter, generated_files=[source])
+            self.service.upload_to_azure_on_demand('jobs/job/osw/job.zip', stream)
+        finally:
+            configure_tracing('none')
+            shutil.rmtree(root_dir, ignore_errors=True)
+
+        self.assertEqual(STAGE_SECONDS.count(stage='zip'), zipped + 1)
+        spans = {span.name: span for span in exporter.get_finished_spans()}
+        self.assertTrue(spans['zip'].attributes['streaming'])
+        self.assertGreater(spans['zip'].attributes['compress_seconds'], 0)
+
+    def test_prepare_upload_file_without_streaming(self):
+        formatter = MagicMock()
+        with patch.object(self.service._settings, 'zip_streaming', False):
+            result = self.service._prepare_upload_file(formatter=formatter, generated_files=['file1.geojson'])
+        formatter.create_zip.assert_called_once_with(['file1.geojson'])
+        formatter.stream_zip.assert_not_called()
+        self.assertEqual(result, formatter.create_zip.return_value)
+
+    def test_publishing_topic_is_reused(self):
+        self.service.core.get_topic.reset_mock()
+        self.service.publish(data=MagicMock())
+        self.service.publish(data=MagicMock())
+
+        self.service.core.get_topic.assert_called_once()
+        self.assertEqual(self.service.core.get_topic.return_value.publish.call_count, 2)
+        self.assertEqual(self.service.handles.stats(), {'created': 1, 'reused': 1, 'recycled': 0})
+
+    @patch('src.service.osw_formatter_service.QueueMessage')
+    def test_send_batch_uses_one_service_bus_batch(self, mock_queue_message):
+        mock_queue_message.to_dict.return_value = {'messageId': '1234'}
+        topic = MagicMock(spec=AzureTopic)
+        topic.publisher = MagicMock()
+        self.service.core.get_topic.return_value = topic
+
+        self.service.send_batch([MagicMock(), MagicMock()])
+
+        message_batch = topic.publisher.create_message_batch.return_value
+        self.assertEqual(message_batch.add_message.call_count, 2)
+        topic.publisher.send_messages.assert_called_once_with(message_batch)
+
+    @patch('src.service.osw_formatter_service.QueueMessage')
+    def test_send_batch_splits_full_batch(self, mock_queue_message):
+        mock_queue_message.to_dict.return_value = {'messageId': '1234'}
+        topic = MagicMock(spec=AzureTopic)
+        topic.publisher = MagicMock()
+        full_batch, next_batch = MagicMock(), MagicMock()
+        full_batch.add_message.side_effect = [None, ValueError('batch is full')]
+        topic.publisher.create_message_batch.side_effect = [full_batch, next_batch]
+        self.service.core.get_topic.return_value = topic
+
+        self.service.send_batch([MagicMock(), MagicMock()])
+
+        next_batch.add_message.assert_called_once()
+        self.assertEqual(topic.publisher.send_messages.call_count, 2)
+
+    @patch('src.service.osw_formatter_service.QueueMessage')
+    def test_send_progress(self, mock_queue_message):
+        self.service.publish = MagicMock()
+        progress = ConversionProgress(elapsed=60.0, timeout=600, input_size=1000, input_bytes_read=500,
+                                      output_bytes=0)
+
+        self.service.send_progress('1234', 'osw-format', 'job-1', progress)
+
+        message = mock_queue_message.data_from.call_args[0][0]
+        self.assertEqual(message['messageId'], '1234')
+        self.assertEqual(message['messageType'], 'osw-format-progress')
+        self.assertEqual(message['data']['progress']['input_bytes_read'], 500)
+        self.service.publish.assert_called_once_with(data=mock_queue_message.data_from.return_value)
+
+    def test_publish_is_timed(self):
+        published = STAGE_SECONDS.count(stage='publish')
+        self.service.send_batch([MagicMock()])
+        self.assertEqual(STAGE_SECONDS.count(stage='publish'), published + 1)
+
+    def test_stop_listening_flushes_publisher(self):
+        self.service.listening_thread = MagicMock()
+        self.service.publisher = MagicMock()
+        self.service.stop_listening()
+        self.service.publisher.close.assert_called_once()
+
+    @patch('src.service.osw_formatter_service.Core')
+    def test_create_core_for_backend(self, mock_core):
+        root_dir = tempfile.mkdtemp()
+        try:
+            with patch.multiple(self.service._settings, backend='local', local_storage_directory=root_dir,
+                                local_topic_latency=0.5):
+                core = self.service.create_core()
+            self.assertIsInstance(core, LocalCore)
+            self.assertEqual(core.get_storage_client().root_dir, root_dir)
+            self.assertEqual(core.get_topic('topic').latency, 0.5)
+            mock_core.assert_not_called()
+
+            with patch.object(self.service._settings, 'backend', 'azure'):
+                self.assertIs(self.service.create_core(), mock_core.return_value)
+        finally:
+            shutil.rmtree(root_dir, ignore_errors=True)
+
+    def test_stop_listening_closes_local_core(self):
+        self.service.listening_thread = MagicMock()
+        self.service.core = MagicMock(spec=LocalCore)
+        self.service.stop_listening()
+        self.service.core.close.assert_called_once()
+
+    def _listen_on_local_topic(self, mock_osw_format, names, bulk_done, small_started):
+        """Publishes a format request for each of `names` and listens with a window of 3 messages."""
+        topic = InProcessTopic(LocalBroker(), 'requests', max_concurrent_messages=3)
+        self.service.listening_topic = topic
+        self.service.scheduler = LaneScheduler(fast_workers=1, bulk_workers=1, fast_max_size=1024, max_jobs=3)
+        self.service.admission = None
+        self.service.send_status = MagicMock()
+
+        def formatter(file_path, **kwargs):
+            instance = MagicMock(file_path=file_path)
+            instance.get_input_size.return_value = 1024 if file_path.endswith('small.osm') else 1024 * 1024
+
+            def format():
+                if instance.get_input_size.return_value > 1024:
+                    bulk_done.wait(5)
+                else:
+                    small_started.set()
+                return MagicMock(status=False)
+
+            instance.format.side_effect = format
+            return instance
+
+        mock_osw_format.side_effect = formatter
+        for name in names:
+            self._publish_format_request(topic, name)
+        listening_thread = threading.Thread(target=self.service.start_listening, daemon=True)
+        listening_thread.start()
+        return topic, listening_thread
+
+    @staticmethod
+    def _publish_format_request(topic, name):
+        topic.publish(QueueMessage.data_from({
+            'messageId': name,
+            'messageType': 'osw-format',
+            'data': {'file_upload_path': f'http://example.com/{name}', 'tdei_project_group_id': '1'}
+        }))
+
+    @patch('src.service.osw_formatter_service.OSWFormat')
+    def test_small_job_runs_while_bulk_jobs_wait(self, mock_osw_format):
+        bulk_done, small_started = threading.Event(), threading.Event()
+        topic, listening_thread = self._listen_on_local_topic(
+            mock_osw_format, ['bulk_0.osm', 'bulk_1.osm'], bulk_done, small_started)
+        try:
+            # One bulk job runs and the other waits in the process
+            deadline = time.monotonic() + 5
+            while self.service.scheduler.waiting['bulk'] < 1 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(self.service.scheduler.running['bulk'], 1)
+            self.assertEqual(self.service.scheduler.waiting['bulk'], 1)
+            # The small job is received in the slot left and has its own lane
+            self._publish_format_request(topic, 'small.osm')
+            self.assertTrue(small_started.wait(5))
+        finally:
+            bulk_done.set()
+            topic.close()
+            listening_thread.join(timeout=10)
+
+    @patch('src.service.osw_formatter_service.OSWFormat')
+    def test_burst_of_bulk_jobs_is_queued_not_dropped(self, mock_osw_format):
+        bulk_done, small_started = threading.Event(), threading.Event()
+        names = [f'bulk_{i}.osm' for i in range(6)] + ['small.osm']
+        bulk_done.set()
+        topic, listening_thread = self._listen_on_local_topic(mock_osw_format, names, bulk_done, small_started)
+        try:
+            self.assertTrue(small_started.wait(5))
+            deadline = time.monotonic() + 5
+            while self.service.send_status.call_count < len(names) and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            topic.close()
+            listening_thread.join(timeout=10)
+        # Every job ran and got its status, none was handed back to the broker
+        self.assertEqual(sorted(call[1]['upload_message'].message_id
+                                for call in self.service.send_status.call_args_list), sorted(names))
+        self.assertEqual(self.service.scheduler.running, {'fast': 0, 'bulk': 0})
+
+    def test_container_is_reused(self):
+        self.assertIs(self.service.get_container(), self.service.get_container())
+        self.service.storage_client.get_container.assert_called_once_with(container_name='test_container')
+
+    @patch('src.service.osw_formatter_service.wait_for_copy')
+    @patch('src.service.osw_formatter_service.OSWFormat')
+    def test_format_reuses_cached_result(self, mock_osw_format, mock_wait_for_copy):
+        # Arrange
+        received_message = OSWValidationMessage({
+            'messageId': '1234',
+            'messageType': 'message_type',
+            'data': {'file_upload_path': 'http://example.com/file.osm', 'tdei_project_group_id': '1'}
+        })
+        mock_osw_instance = MagicMock()
+        mock_osw_instance.prefix = '1234'
+        mock_osw_instance.format.return_value = CachedResponse(
+            status=True, remote_url='https://example.com/osw/old/1234.zip', cache_key='key', prefix='1234')
+        mock_osw_format.return_value = mock_osw_instance
+        self.service.result_cache = MagicMock()
+        self.service.storage_client.clone_file.return_value.url = 'https://example.com/osw/new/1234.zip'
+        self.service.upload_to_azure = MagicMock()
+        self.service.send_status = MagicMock()
+
+        # Act
+        self.service.format(received_message)
+
+        # Assert
+        source_url, container_name, remote_path = self.service.storage_client.clone_file.call_args[0]
+        self.assertEqual(source_url, 'https://example.com/osw/old/1234.zip')
+        self.assertIn('/1/1234/1234_', remote_path)
+        self.assertTrue(remote_path.endswith('.zip'))
+        self.service.upload_to_azure.assert_not_called()
+        mock_osw_instance.format.assert_called_once()
+        self.assertEqual(self.service.send_status.call_args[1]['upload_url'], 'https://example.com/osw/new/1234.zip')
+        self.assertTrue(self.service.send_status.call_args[1]['result'].is_valid)
+
+    @patch('src.service.osw_formatter_service.OSWFormat')
+    def test_format_renames_cached_result_of_another_record(self, mock_osw_format):
+        # Arrange
+        received_message = OSWValidationMessage({
+            'messageId': '1234',
+            'messageType': 'message_type',
+            'data': {'file_upload_path': 'http://example.com/file.osm', 'tdei_project_group_id': '1'}
+        })
+        mock_osw_instance = MagicMock()
+        mock_osw_instance.prefix = '1234'
+        cached = CachedResponse(status=True, remote_url='https://example.com/osw/old/5678.zip', cache_key='key',
+                                prefix='5678')
+        mock_osw_instance.format.return_value = cached
+        mock_osw_instance.rename_cached_result.return_value = 'downloads/1234/cached/1234.zip'
+        mock_osw_format.return_value = mock_osw_instance
+        self.service.result_cache = MagicMock()
+        self.service.upload_to_azure_on_demand = MagicMock(return_value='https://example.com/osw/new/1234.zip')
+        self.service.send_status = MagicMock()
+
+        # Act
+        self.service.format(received_message)
+
+        # Assert
+        self.service.storage_client.clone_file.assert_not_called()
+        mock_osw_instance.rename_cached_result.assert_called_once_with(cached)
+        upload = self.service.upload_to_azure_on_demand.call_args[1]
+        self.assertIn('/1/1234/1234_', upload['remote_path'])
+        self.assertEqual(upload['local_url'], 'downloads/1234/cached/1234.zip')
+        mock_osw_instance.format_downloaded.assert_not_called()
+        self.assertEqual(self.service.send_status.call_args[1]['upload_url'], 'https://example.com/osw/new/1234.zip')
+
+    @patch('src.service.osw_formatter_service.OSWFormat')
+    def test_format_cached_result_copy_failure_formats_again(self, mock_osw_format):
+        # Arrange
+        received_message = OSWValidationMessage({
+            'messageId': '1234',
+            'messageType': 'message_type',
+            'data': {'file_upload_path': 'http://example.com/file.osm', 'tdei_project_group_id': '1'}
+        })
+        mock_osw_instance = MagicMock()
+        mock_osw_instance.prefix = '1234'
+        mock_osw_instance.result_key = 'key'
+        converted = MagicMock(status=True, error=None, generated_files=['file1.geojson'])
+        mock_osw_instance.format.return_value = CachedResponse(
+            status=True, remote_url='https://example.com/osw/old/1234.zip', cache_key='key', prefix='1234')
+        mock_osw_instance.format_downloaded.return_value = converted
+        mock_osw_format.return_value = mock_osw_instance
+        self.service.result_cache = MagicMock()
+        self.service.storage_client.clone_file.side_effect = Exception('Blob not found')
+        self.service.upload_to_azure = MagicMock(return_value='uploaded_path')
+        self.service.send_status = MagicMock()
+
+        # Act
+        self.service.format(received_message)
+
+        # Assert
+        self.service.result_cache.invalidate.assert_called_once_with('key')
+        # The downloaded input is converted, it is not downloaded and hashed again
+        mock_osw_instance.format.assert_called_once()
+        mock_osw_instance.format_downloaded.assert_called_once_with()
+        self.service.upload_to_azure.assert_called_once()
+        self.service.result_cache.put.assert_called_once_with('key', 'uploaded_path', prefix='1234')
+        self.assertEqual(self.service.send_status.call_args[1]['upload_url'], 'uploaded_path')
+
+    @patch('src.service.osw_formatter_service.OSWFormat')
+    def test_process_on_demand_format_reuses_cached_result(self, mock_osw_format):
+        # Arrange
+        received_message = OSWOnDemandRequest(
+            messageId='1234',
+            messageType='message_type',
+            data={'sourceUrl': 'http://example.com/file.zip', 'jobId': '42', 'source': 'osw', 'target': 'osm'}
+        )
+        mock_osw_instance = MagicMock()
+        mock_osw_instance.prefix = '42'
+        mock_osw_instance.format.return_value = CachedResponse(
+            status=True, remote_url='https://example.com/osw/jobs/7/osm/7.zip', cache_key='key', prefix='7')
+        mock_osw_instance.rename_cached_result.return_value = 'downloads/42/cached/42.zip'
+        mock_osw_format.return_value = mock_osw_instance
+        self.service.result_cache = MagicMock()
+        self.service.upload_to_azure_on_demand = MagicMock(return_value='https://example.com/osw/jobs/42/osm/42.zip')
+        self.service.send_on_demand_response = MagicMock()
+
+        # Act
+        self.service.process_on_demand_format(received_message)
+
+        # Assert
+        self.service.storage_client.clone_file.assert_not_called()
+        self.service.upload_to_azure_on_demand.assert_called_once_with(remote_path='jobs/42/osm/42.zip',
+                                                                       local_url='downloads/42/cached/42.zip')
+        mock_osw_instance.format_downloaded.assert_not_called()
+        response = self.service.send_on_demand_response.call_args[1]['response']
+        self.assertEqual(response.data.status, 'completed')
+        self.assertEqual(response.data.formattedUrl, 'https://example.com/osw/jobs/42/osm/42.zip')
+        self.assertTrue(response.data.success)
+
     @patch('src.service.osw_formatter_service.threading.Thread')
     def test_stop_listening(self, mock_thread):
         # Arrange
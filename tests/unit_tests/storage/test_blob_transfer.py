@@ -0,0 +1,198 @@
+import io
+import os
+import shutil
+import threading
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError
+from src.storage.local_storage import LocalStorageClient, LocalBlobClient
+from src.storage.blob_transfer import BlobReader, BlobChangedError, DownloadVerificationError, download_to_file, \
+    get_blob_client, upload_blocks
+
+
+class TestBlobTransfer(unittest.TestCase):
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.client = LocalStorageClient(os.path.join(self.root_dir, 'storage'))
+        self.content = os.urandom(10 * 1024 + 7)
+        container = self.client.get_container(container_name='osw')
+        container.create_file('input/test.pbf').upload(self.content)
+        self.file = self.client.get_file_from_url('osw', f'{self.client.base_url}/osw/input/test.pbf')
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir, ignore_errors=True)
+
+    def test_get_blob_client_for_created_file(self):
+        file = self.client.get_container(container_name='osw').create_file('input/test.pbf')
+        self.assertEqual(get_blob_client(file).blob_name, 'input/test.pbf')
+
+    def test_get_blob_client_unsupported_entity(self):
+        self.assertIsNone(get_blob_client(MagicMock()))
+
+    def test_iter_chunks_is_bounded(self):
+        reader = BlobReader(self.file)
+        chunks = list(reader.iter_chunks(chunk_size=1024))
+        self.assertEqual(len(chunks), 11)
+        self.assertTrue(all(len(chunk) <= 1024 for chunk in chunks))
+        self.assertEqual(b''.join(chunks), self.content)
+
+    def test_download_to_file_streams_in_chunks(self):
+        destination = os.path.join(self.root_dir, 'test.pbf')
+        reader_calls = []
+        original = BlobReader.read_range
+
+        def read_range(reader, offset, length):
+            reader_calls.append(length)
+            return original(reader, offset, length)
+
+        with patch.object(BlobReader, 'read_range', new=read_range):
+            download_to_file(self.file, destination, chunk_size=4096)
+
+        self.assertEqual(reader_calls, [4096, 4096, 2055])
+        with open(destination, 'rb') as downloaded:
+            self.assertEqual(downloaded.read(), self.content)
+
+    def test_download_to_file_without_range_support(self):
+        destination = os.path.join(self.root_dir, 'fallback.bin')
+        file = MagicMock()
+        file.get_stream.return_value = b'whole-file'
+        download_to_file(file, destination)
+        file.get_stream.assert_called_once()
+        with open(destination, 'rb') as downloaded:
+            self.assertEqual(downloaded.read(), b'whole-file')
+
+    def test_download_empty_blob(self):
+        self.client.get_container(container_name='osw').create_file('empty.osm').upload(b'')
+        file = self.client.get_file('osw', 'empty.osm')
+        destination = os.path.join(self.root_dir, 'empty.osm')
+        download_to_file(file, destination)
+        self.assertEqual(os.path.getsize(destination), 0)
+
+    def test_parallel_download(self):
+        destination = os.path.join(self.root_dir, 'parallel.pbf')
+        with patch('src.storage.blob_transfer._download_sequential') as mock_sequential:
+            download_to_file(self.file, destination, chunk_size=1000, max_workers=4, parallel_threshold=1024)
+        mock_sequential.assert_not_called()
+        with open(destination, 'rb') as downloaded:
+            self.assertEqual(downloaded.read(), self.content)
+
+    def test_parallel_download_below_threshold_is_sequential(self):
+        destination = os.path.join(self.root_dir, 'small.pbf')
+        with patch('src.storage.blob_transfer._download_parallel') as mock_parallel:
+            download_to_file(self.file, destination, chunk_size=1000, max_workers=4, parallel_threshold=1024 * 1024)
+        mock_parallel.assert_not_called()
+        with open(destination, 'rb') as downloaded:
+            self.assertEqual(downloaded.read(), self.content)
+
+    def test_read_range_retries_failed_range(self):
+        reader = BlobReader(self.file, retries=2, retry_backoff=0)
+        original = reader.blob_client.download_blob
+        reader.blob_client.download_blob = MagicMock(side_effect=[IOError('reset'), original(offset=0, length=10)])
+        self.assertEqual(reader.read_range(0, 10), self.content[:10])
+        self.assertEqual(reader.blob_client.download_blob.call_count, 2)
+
+    def test_read_range_gives_up_after_retries(self):
+        reader = BlobReader(self.file, retries=1, retry_backoff=0)
+        reader.blob_client.download_blob = MagicMock(side_effect=IOError('reset'))
+        with self.assertRaises(IOError):
+            reader.read_range(0, 10)
+        self.assertEqual(reader.blob_client.download_blob.call_count, 2)
+
+    def test_parallel_download_checksum_mismatch(self):
+        destination = os.path.join(self.root_dir, 'corrupt.pbf')
+        with patch.object(BlobReader, 'content_md5', new=b'0' * 16):
+            with self.assertRaises(DownloadVerificationError):
+                download_to_file(self.file, destination, chunk_size=1000, max_workers=4, parallel_threshold=1)
+
+    def test_parallel_download_fails_when_blob_changes(self):
+        destination = os.path.join(self.root_dir, 'changed.pbf')
+        etag = BlobReader(self.file).etag
+        original = LocalBlobClient.download_blob
+        conditions = []
+        overwrite = threading.Lock()
+
+        def download_blob(client, **kwargs):
+            conditions.append((kwargs['etag'], kwargs['match_condition']))
+            # The first range overwrites the blob, the ranges after it must not mix in the new content
+            if overwrite.acquire(blocking=False):
+                self.client.get_container(container_name='osw').create_file('input/test.pbf').upload(
+                    os.urandom(len(self.content)))
+            return original(client, **kwargs)
+
+        # A changed blob fails the download right away, no range is retried
+        with patch.object(LocalBlobClient, 'download_blob', new=download_blob), \
+                self.assertNoLogs('osw-formatter', level='WARNING'):
+            with self.assertRaises(BlobChangedError):
+                download_to_file(self.file, destination, chunk_size=1000, max_workers=4, parallel_threshold=1)
+        self.assertEqual(set(conditions), {(etag, MatchConditions.IfNotModified)})
+
+    def _upload_client(self):
+        return get_blob_client(self.client.get_container(container_name='osw').create_file('output/test.zip'))
+
+    def test_upload_blocks(self):
+        blob_client = self._upload_client()
+        uploaded = upload_blocks(blob_client, io.BytesIO(self.content), block_size=1024, max_concurrency=4)
+        self.assertEqual(uploaded, len(self.content))
+        self.assertEqual(blob_client.download_blob().readall(), self.content)
+
+    def test_upload_blocks_does_not_overwrite(self):
+        blob_client = self._upload_client()
+        upload_blocks(blob_client, io.BytesIO(self.content), block_size=1024)
+        with self.assertRaises(ResourceExistsError):
+            upload_blocks(blob_client, io.BytesIO(b'other content'), block_size=1024)
+        self.assertEqual(blob_client.download_blob().readall(), self.content)
+
+    def test_upload_blocks_empty_stream(self):
+        blob_client = self._upload_client()
+        self.assertEqual(upload_blocks(blob_client, io.BytesIO(b''), block_size=1024), 0)
+        self.assertEqual(blob_client.download_blob().readall(), b'')
+
+    def test_upload_blocks_bounds_in_flight_bytes(self):
+        blob_client = self._upload_client()
+        original = blob_client.stage_block
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def stage_block(**kwargs):
+            with lock:
+                active.append(kwargs['length'])
+                peak.append(sum(active))
+            original(**kwargs)
+            with lock:
+                active.remove(kwargs['length'])
+
+        blob_client.stage_block = stage_block
+        upload_blocks(blob_client, io.BytesIO(self.content), block_size=1024, max_concurrency=4, max_in_flight=2048)
+        self.assertLessEqual(max(peak), 2048)
+        self.assertEqual(blob_client.download_blob().readall(), self.content)
+
+    def test_upload_blocks_retries_failed_block(self):
+        blob_client = self._upload_client()
+        original = blob_client.stage_block
+        failures = {'MDAwMDAwMDAwMw=='}
+
+        def stage_block(block_id, **kwargs):
+            if block_id in failures:
+                failures.remove(block_id)
+                raise IOError('reset')
+            return original(block_id=block_id, **kwargs)
+
+        blob_client.stage_block = MagicMock(side_effect=stage_block)
+        upload_blocks(blob_client, io.BytesIO(self.content), block_size=1024, retry_backoff=0)
+        self.assertEqual(blob_client.stage_block.call_count, 12)
+        self.assertEqual(blob_client.download_blob().readall(), self.content)
+
+    def test_upload_blocks_gives_up_after_retries(self):
+        blob_client = self._upload_client()
+        blob_client.stage_block = MagicMock(side_effect=IOError('reset'))
+        blob_client.commit_block_list = MagicMock()
+        with self.assertRaises(IOError):
+            upload_blocks(blob_client, io.BytesIO(self.content), block_size=1024, retries=1, retry_backoff=0)
+        blob_client.commit_block_list.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
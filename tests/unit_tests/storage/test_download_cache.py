@@ -0,0 +1,84 @@
+import os
+import time
+import errno
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from src.storage.download_cache import DownloadCache, link_file
+
+
+class TestDownloadCache(unittest.TestCase):
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.cache = DownloadCache(cache_dir=os.path.join(self.root_dir, '.cache'), max_size=100)
+        self.job_dir = os.path.join(self.root_dir, 'job')
+        os.makedirs(self.job_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir, ignore_errors=True)
+
+    def _write(self, name, size):
+        path = os.path.join(self.job_dir, name)
+        with open(path, 'wb') as file:
+            file.write(b'x' * size)
+        return path
+
+    def test_get_key_depends_on_url_and_etag(self):
+        key = DownloadCache.get_key('osw/a.pbf', '"etag-1"')
+        self.assertEqual(key, DownloadCache.get_key('osw/a.pbf', '"etag-1"'))
+        self.assertNotEqual(key, DownloadCache.get_key('osw/a.pbf', '"etag-2"'))
+        self.assertNotEqual(key, DownloadCache.get_key('osw/b.pbf', '"etag-1"'))
+
+    def test_fetch_miss(self):
+        destination = os.path.join(self.job_dir, 'missing.pbf')
+        self.assertFalse(self.cache.fetch('missing', destination))
+        self.assertFalse(os.path.exists(destination))
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_store_and_fetch_links_file(self):
+        source = self._write('input.pbf', 10)
+        self.cache.store('key', source)
+        destination = os.path.join(self.root_dir, 'other-job.pbf')
+
+        self.assertTrue(self.cache.fetch('key', destination))
+        self.assertEqual(os.stat(destination).st_ino, os.stat(self.cache.get_path('key')).st_ino)
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_removing_job_directory_keeps_cache_entry(self):
+        source = self._write('input.pbf', 10)
+        self.cache.store('key', source)
+        shutil.rmtree(self.job_dir)
+        self.assertTrue(os.path.exists(self.cache.get_path('key')))
+
+    def test_store_skips_files_larger_than_cache(self):
+        self.cache.store('key', self._write('big.pbf', 101))
+        self.assertFalse(os.path.exists(self.cache.get_path('key')))
+
+    def test_evicts_least_recently_used(self):
+        self.cache.store('first', self._write('first.pbf', 40))
+        self.cache.store('second', self._write('second.pbf', 40))
+        past = time.time() - 60
+        os.utime(self.cache.get_path('second'), (past, past))
+        os.utime(self.cache.get_path('first'), (past + 1, past + 1))
+
+        self.cache.store('third', self._write('third.pbf', 40))
+
+        self.assertFalse(os.path.exists(self.cache.get_path('second')))
+        self.assertTrue(os.path.exists(self.cache.get_path('first')))
+        self.assertTrue(os.path.exists(self.cache.get_path('third')))
+        self.assertLessEqual(self.cache.size(), 100)
+
+    def test_link_file_falls_back_to_copy(self):
+        source = self._write('source.pbf', 5)
+        destination = os.path.join(self.root_dir, 'copied.pbf')
+        with patch('src.storage.download_cache.os.link', side_effect=OSError(errno.EXDEV, 'cross-device')), \
+                patch('fcntl.ioctl', side_effect=OSError(errno.EOPNOTSUPP, 'not supported')):
+            method = link_file(source, destination)
+        self.assertEqual(method, 'copy')
+        with open(destination, 'rb') as file:
+            self.assertEqual(file.read(), b'x' * 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import unittest
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceModifiedError
+from src.storage.local_storage import LocalStorageClient, LocalFileEntity
+
+
+class TestLocalStorageClient(unittest.TestCase):
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.client = LocalStorageClient(self.root_dir)
+        self.container = self.client.get_container(container_name='osw')
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir, ignore_errors=True)
+
+    def test_upload_and_get_file_from_url(self):
+        file = self.container.create_file('2024/test/osw.zip')
+        file.upload(b'zip-content')
+
+        downloaded = self.client.get_file_from_url('osw', file.get_remote_url())
+
+        self.assertIsInstance(downloaded, LocalFileEntity)
+        self.assertEqual(downloaded.file_path, '2024/test/osw.zip')
+        self.assertEqual(downloaded.get_stream(), b'zip-content')
+
+    def test_get_file_from_url_not_found(self):
+        file = self.client.get_file_from_url('osw', f'{self.client.base_url}/osw/missing.zip')
+        self.assertEqual(file.file_path, '')
+
+    def test_upload_from_file_object(self):
+        source = os.path.join(self.root_dir, 'source.bin')
+        with open(source, 'wb') as data:
+            data.write(b'a' * 1024)
+        file = self.container.create_file('source.bin')
+        with open(source, 'rb') as data:
+            file.upload(data)
+        self.assertEqual(file.blob_client.get_blob_properties().size, 1024)
+
+    def test_blob_properties(self):
+        file = self.container.create_file('test.pbf')
+        file.upload(b'0123456789')
+        properties = file.blob_client.get_blob_properties()
+        self.assertEqual(properties.size, 10)
+        self.assertTrue(properties.etag)
+        self.assertEqual(bytes(properties.content_settings.content_md5), hashlib.md5(b'0123456789').digest())
+
+    def test_download_range(self):
+        file = self.container.create_file('test.pbf')
+        file.upload(b'0123456789')
+        self.assertEqual(file.blob_client.download_blob(offset=2, length=3).readall(), b'234')
+        self.assertEqual(file.blob_client.download_blob(offset=8, length=10).readall(), b'89')
+
+    def test_download_if_not_modified(self):
+        file = self.container.create_file('test.pbf')
+        file.upload(b'0123456789')
+        etag = file.blob_client.get_blob_properties().etag
+        self.assertEqual(file.blob_client.download_blob(
+            offset=0, length=4, etag=etag, match_condition=MatchConditions.IfNotModified).readall(), b'0123')
+        file.upload(b'9876543210')
+        with self.assertRaises(ResourceModifiedError):
+            file.blob_client.download_blob(offset=0, length=4, etag=etag, match_condition=MatchConditions.IfNotModified)
+
+    def test_list_files(self):
+        self.container.create_file('a/one.zip').upload(b'1')
+        self.container.create_file('b/two.zip').upload(b'2')
+        names = sorted(file.file_path for file in self.container.list_files())
+        self.assertEqual(names, ['a/one.zip', 'b/two.zip'])
+        self.assertEqual([file.file_path for file in self.container.list_files(name_starts_with='b/')], ['b/two.zip'])
+
+    def test_clone_file(self):
+        file = self.container.create_file('source.zip')
+        file.upload(b'clone-me')
+        self.client.clone_file(file.get_remote_url(), 'osw', 'jobs/1/source.zip')
+        self.assertEqual(self.client.get_file('osw', 'jobs/1/source.zip').get_stream(), b'clone-me')
+
+    def test_delete_file(self):
+        file = self.container.create_file('delete.zip')
+        file.upload(b'x')
+        file.delete_file()
+        self.assertFalse(file.blob_client.exists())
+
+    def test_stage_and_commit_blocks(self):
+        blob_client = self.container.create_file('blocks/osw.zip').blob_client
+        blob_client.stage_block(block_id='YQ==', data=b'first-')
+        blob_client.stage_block(block_id='Yg==', data=b'second')
+        blob_client.stage_block(block_id='Yw==', data=b'uncommitted')
+        blob_client.commit_block_list(['YQ==', 'Yg=='])
+        self.assertEqual(blob_client.download_blob().readall(), b'first-second')
+        self.assertEqual(blob_client.get_blob_properties().content_settings.content_md5,
+                         bytearray(hashlib.md5(b'first-second').digest()))
+        self.assertEqual([file.file_path for file in self.container.list_files()], ['blocks/osw.zip'])
+
+    def test_commit_missing_block(self):
+        blob_client = self.container.create_file('blocks/osw.zip').blob_client
+        with self.assertRaises(ValueError):
+            blob_client.commit_block_list(['YQ=='])
+        self.assertFalse(blob_client.exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch, mock_open
+from src.admission import AdmissionController, JobEstimate, available_memory, total_memory
+
+GB = 1024 * 1024 * 1024
+
+
+class TestAdmissionController(unittest.TestCase):
+    def setUp(self):
+        self.controller = AdmissionController(max_jobs=3, directory=tempfile.gettempdir(), poll_interval=0.05)
+        self.available_memory = self._patch('src.admission.available_memory', 8 * GB)
+        self.total_memory = self._patch('src.admission.total_memory', 8 * GB)
+        self.available_disk = self._patch('src.admission.available_disk', 100 * GB)
+        self.directory_size = self._patch('src.admission.directory_size', 0)
+
+    def _patch(self, target, return_value):
+        patcher = patch(target, return_value=return_value)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def _acquire_in_thread(self, estimate):
+        admitted = threading.Event()
+
+        def run():
+            self.controller.acquire(estimate)
+            admitted.set()
+
+        threading.Thread(target=run, daemon=True).start()
+        return admitted
+
+    def test_estimate_depends_on_format(self):
+        pbf = AdmissionController.estimate('osw/a.pbf', 100)
+        osm = AdmissionController.estimate('osw/a.osm', 100)
+        self.assertGreater(pbf.memory, osm.memory)
+        self.assertEqual(AdmissionController.estimate('osw/a.zip', None), JobEstimate())
+
+    def test_small_jobs_run_in_parallel(self):
+        for _ in range(3):
+            self.controller.acquire(JobEstimate(memory=GB, disk=GB))
+        self.assertEqual(self.controller.running, 3)
+
+    def test_max_jobs(self):
+        for _ in range(3):
+            self.controller.acquire(JobEstimate())
+        admitted = self._acquire_in_thread(JobEstimate())
+        self.assertFalse(admitted.wait(0.2))
+        self.controller.release(JobEstimate())
+        self.assertTrue(admitted.wait(1))
+
+    def test_huge_job_waits_for_memory(self):
+        small = self.controller.acquire(JobEstimate(memory=GB))
+        admitted = self._acquire_in_thread(JobEstimate(memory=10 * GB))
+        self.assertFalse(admitted.wait(0.2))
+        self.controller.release(small)
+        self.assertTrue(admitted.wait(1))
+
+    def test_huge_job_runs_alone(self):
+        huge = self.controller.acquire(JobEstimate(memory=10 * GB))
+        self.assertEqual(self.controller.running, 1)
+        admitted = self._acquire_in_thread(JobEstimate(memory=GB))
+        self.assertFalse(admitted.wait(0.2))
+        self.controller.release(huge)
+        self.assertTrue(admitted.wait(1))
+
+    def test_job_waits_for_disk(self):
+        self.controller.acquire(JobEstimate())
+        self.available_disk.return_value = GB
+        admitted = self._acquire_in_thread(JobEstimate(disk=2 * GB))
+        self.assertFalse(admitted.wait(0.2))
+        # Space freed outside of the controller is picked up on the next poll
+        self.available_disk.return_value = 10 * GB
+        self.assertTrue(admitted.wait(1))
+
+    def test_reservations_of_running_jobs_are_counted(self):
+        self.controller.acquire(JobEstimate(memory=5 * GB))
+        self.controller.acquire(JobEstimate(memory=GB))
+        admitted = self._acquire_in_thread(JobEstimate(memory=3 * GB))
+        self.assertFalse(admitted.wait(0.2))
+
+    def test_memory_running_jobs_use_is_not_counted_twice(self):
+        # The running job uses 4 GB of its 5 GB already, that is no longer available
+        self.controller.acquire(JobEstimate(memory=5 * GB))
+        self.available_memory.return_value = 4 * GB
+        self.controller.acquire(JobEstimate(memory=2 * GB))
+        self.assertEqual(self.controller.running, 2)
+
+    def test_disk_running_jobs_use_is_not_counted_twice(self):
+        self.controller.acquire(JobEstimate(disk=50 * GB))
+        self.available_disk.return_value = 60 * GB
+        self.directory_size.return_value = 40 * GB
+        self.controller.acquire(JobEstimate(disk=40 * GB))
+        self.assertEqual(self.controller.running, 2)
+        admitted = self._acquire_in_thread(JobEstimate(disk=20 * GB))
+        self.assertFalse(admitted.wait(0.2))
+
+
+class TestAvailableMemory(unittest.TestCase):
+    @patch('src.admission._cgroup_available_memory', return_value=None)
+    def test_available_memory_from_meminfo(self, _):
+        with patch('builtins.open', mock_open(read_data='MemTotal: 4096 kB\nMemAvailable: 2048 kB\n')):
+            self.assertEqual(available_memory(), 2048 * 1024)
+
+    @patch('src.admission._cgroup_available_memory', return_value=1024)
+    def test_available_memory_capped_by_cgroup(self, _):
+        with patch('builtins.open', mock_open(read_data='MemAvailable: 2048 kB\n')):
+            self.assertEqual(available_memory(), 1024)
+
+    @patch('src.admission._cgroup_memory', return_value=(1024, 512))
+    def test_total_memory_capped_by_cgroup(self, _):
+        with patch('builtins.open', mock_open(read_data='MemTotal: 4096 kB\nMemAvailable: 2048 kB\n')):
+            self.assertEqual(total_memory(), 1024)
+
+    @patch('src.admission._cgroup_memory', return_value=None)
+    def test_total_memory_from_meminfo(self, _):
+        with patch('builtins.open', mock_open(read_data='MemTotal: 4096 kB\nMemAvailable: 2048 kB\n')):
+            self.assertEqual(total_memory(), 4096 * 1024)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import time
+import threading
+import unittest
+from unittest.mock import MagicMock
+from src.batch_publisher import BatchPublisher
+
+
+class TestBatchPublisher(unittest.TestCase):
+    def setUp(self):
+        self.batches = []
+        self.publisher = None
+
+    def tearDown(self):
+        if self.publisher:
+            self.publisher.close()
+
+    def publish_concurrently(self, messages):
+        threads = [threading.Thread(target=self.publisher.publish, args=(message,)) for message in messages]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_messages_are_sent_together(self):
+        self.publisher = BatchPublisher(self.batches.append, max_batch_size=10, max_delay=0.2)
+        self.publish_concurrently(range(10))
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual(sorted(self.batches[0]), list(range(10)))
+        self.assertEqual(self.publisher.messages_sent, 10)
+
+    def test_batch_size_is_bounded(self):
+        self.publisher = BatchPublisher(self.batches.append, max_batch_size=3, max_delay=0.2)
+        self.publish_concurrently(range(7))
+        self.assertTrue(all(len(batch) <= 3 for batch in self.batches))
+        self.assertEqual(sorted(message for batch in self.batches for message in batch), list(range(7)))
+
+    def test_single_message_waits_at_most_the_delay(self):
+        self.publisher = BatchPublisher(self.batches.append, max_batch_size=10, max_delay=0.05)
+        start_time = time.monotonic()
+        self.publisher.publish('status')
+        self.assertLess(time.monotonic() - start_time, 1)
+        self.assertEqual(self.batches, [['status']])
+
+    def test_send_error_is_raised_to_every_publisher(self):
+        send_batch = MagicMock(side_effect=IOError('broker unavailable'))
+        self.publisher = BatchPublisher(send_batch, max_batch_size=2, max_delay=1)
+        errors = []
+
+        def publish(message):
+            try:
+                self.publisher.publish(message)
+            except IOError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=publish, args=(message,)) for message in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(self.publisher.messages_sent, 0)
+
+    def test_close_flushes_pending_messages(self):
+        self.publisher = BatchPublisher(self.batches.append, max_batch_size=10, max_delay=60)
+        thread = threading.Thread(target=self.publisher.publish, args=('status',))
+        thread.start()
+        time.sleep(0.05)
+        self.publisher.close()
+        thread.join(timeout=5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(self.batches, [['status']])
+
+    def test_publish_after_close_sends_directly(self):
+        self.publisher = BatchPublisher(self.batches.append)
+        self.publisher.close()
+        self.publisher.publish('late')
+        self.assertEqual(self.batches, [['late']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+import os
+import shutil
+import tempfile
+import unittest
+import osmium
+from pathlib import Path
+from unittest.mock import patch, MagicMock
+from src.clip import clip, clip_area
+from src.config import Settings
+from src.osw_format import OSWFormat, WORKER_TIMEOUT_GRACE
+from src.resource_limits import run_limited
+from src.result_cache import ResultCache
+from benchmarks.end_to_end import write_osm, grid_node
+
+SQUARE = {'type': 'Polygon', 'coordinates': [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]}
+
+# A footway crossing the west edge of the area, one outside and a building multipolygon with
+# one member way in the area
+AREA_OSM = '''<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="0.5" lon="-0.5" version="1"/>
+  <node id="2" lat="0.5" lon="0.5" version="1"/>
+  <node id="3" lat="0.5" lon="2.5" version="1"/>
+  <node id="4" lat="0.5" lon="3.5" version="1"/>
+  <node id="5" lat="0.2" lon="0.2" version="1"><tag k="kerb" v="lowered"/><tag k="barrier" v="kerb"/></node>
+  <node id="6" lat="0.2" lon="2.2" version="1"><tag k="kerb" v="lowered"/><tag k="barrier" v="kerb"/></node>
+  <node id="7" lat="0.6" lon="0.6" version="1"/>
+  <node id="8" lat="0.6" lon="0.8" version="1"/>
+  <node id="9" lat="0.8" lon="0.8" version="1"/>
+  <node id="10" lat="0.6" lon="1.6" version="1"/>
+  <node id="11" lat="0.8" lon="1.6" version="1"/>
+  <way id="100" version="1"><nd ref="1"/><nd ref="2"/><tag k="highway" v="footway"/></way>
+  <way id="101" version="1"><nd ref="3"/><nd ref="4"/><tag k="highway" v="footway"/></way>
+  <way id="102" version="1"><nd ref="7"/><nd ref="8"/><nd ref="9"/></way>
+  <way id="103" version="1"><nd ref="9"/><nd ref="11"/><nd ref="10"/><nd ref="7"/></way>
+  <relation id="1000" version="1">
+    <member type="way" ref="102" role="outer"/>
+    <member type="way" ref="103" role="outer"/>
+    <tag k="type" v="multipolygon"/><tag k="building" v="yes"/>
+  </relation>
+</osm>
+'''
+
+
+class Collector(osmium.SimpleHandler):
+    def __init__(self):
+        super().__init__()
+        self.nodes, self.ways, self.relations = set(), set(), set()
+
+    def node(self, n):
+        self.nodes.add(n.id)
+
+    def way(self, w):
+        self.ways.add(w.id)
+
+    def relation(self, r):
+        self.relations.add(r.id)
+
+
+def elements(path):
+    collector = Collector()
+    collector.apply_file(path)
+    return collector
+
+
+class TestClip(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_clip_area(self):
+        self.assertIsNone(clip_area(None))
+        self.assertIsNone(clip_area({}))
+        self.assertEqual(clip_area([0, 0, 1, 1]).bounds, (0, 0, 1, 1))
+        self.assertEqual(clip_area(SQUARE).area, 1)
+        self.assertEqual(clip_area({'type': 'Feature', 'properties': {}, 'geometry': SQUARE}).area, 1)
+        moved = {'type': 'Polygon', 'coordinates': [[[2, 0], [3, 0], [3, 1], [2, 1], [2, 0]]]}
+        collection = {'type': 'FeatureCollection', 'features': [
+            {'type': 'Feature', 'properties': {}, 'geometry': SQUARE},
+            {'type': 'Feature', 'properties': {}, 'geometry': moved},
+        ]}
+        self.assertEqual(clip_area(collection).area, 2)
+
+    def test_clip_keeps_ways_in_the_area_and_what_they_reference(self):
+        path = os.path.join(self.work_dir, 'area.osm')
+        Path(path).write_text(AREA_OSM)
+        clipped_path = os.path.join(self.work_dir, 'clipped.osm')
+
+        count = clip(path, clipped_path, clip_area(SQUARE))
+
+        clipped = elements(clipped_path)
+        self.assertEqual(clipped.ways, {100, 102, 103})
+        self.assertEqual(clipped.relations, {1000})
+        # Node 1 is outside but on a way in the area, the outside kerb ramp is dropped
+        self.assertEqual(clipped.nodes, {1, 2, 5, 7, 8, 9, 10, 11})
+        self.assertEqual(count, {'nodes': 8, 'ways': 3, 'relations': 1})
+
+    def test_clip_grid_to_a_bounding_box(self):
+        path = write_osm(os.path.join(self.work_dir, 'grid.osm'), 100)
+        _, south, west = grid_node(10, 0, 0)
+        _, north, east = grid_node(10, 2, 2)
+        area = clip_area([west, south, east, north])
+        clipped_path = os.path.join(self.work_dir, 'clipped.osm')
+
+        clip(path, clipped_path, area)
+
+        # The first three rows and columns cross the box, complete
+        clipped = elements(clipped_path)
+        self.assertEqual(len(clipped.ways), 6)
+        self.assertEqual(len(clipped.nodes), 10 * 10 - 7 * 7)
+
+
+class TestOSWFormatClip(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.work_dir, 'area.osm')
+        Path(self.file_path).write_text(AREA_OSM)
+        clip_to_polygon = patch.object(OSWFormat._settings, 'clip_to_polygon', True)
+        clip_to_polygon.start()
+        self.addCleanup(clip_to_polygon.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_clip_input_without_polygon(self):
+        formatter = OSWFormat(file_path=self.file_path, prefix='test')
+        self.assertEqual(formatter.clip_input(self.file_path, self.work_dir, '.osm'), self.file_path)
+
+    def test_clip_input_skips_osw_inputs(self):
+        formatter = OSWFormat(file_path='input.zip', prefix='test', polygon=SQUARE)
+        self.assertEqual(formatter.clip_input('input.zip', self.work_dir, '.zip'), 'input.zip')
+
+    def test_clip_input_disabled(self):
+        formatter = OSWFormat(file_path=self.file_path, prefix='test', polygon=SQUARE)
+        with patch.object(formatter._settings, 'clip_to_polygon', False):
+            self.assertEqual(formatter.clip_input(self.file_path, self.work_dir, '.osm'), self.file_path)
+
+    def test_clip_is_off_by_default(self):
+        self.assertFalse(Settings().clip_to_polygon)
+
+    def test_clip_input_keeps_the_file_name(self):
+        formatter = OSWFormat(file_path=self.file_path, prefix='test', polygon=SQUARE)
+        clipped_path = formatter.clip_input(self.file_path, self.work_dir, '.osm')
+        self.assertEqual(clipped_path, os.path.join(self.work_dir, 'clipped', 'area.osm'))
+        self.assertEqual(elements(clipped_path).ways, {100, 102, 103})
+
+    def test_clip_input_in_worker_pool(self):
+        worker_pool = MagicMock()
+        # Runs in this process, without limits run_limited only measures
+        worker_pool.run_with_timeout.side_effect = lambda timeout, fn, *args: fn(*args)
+        formatter = OSWFormat(file_path=self.file_path, prefix='test', polygon=SQUARE, worker_pool=worker_pool)
+
+        clipped_path = formatter.clip_input(self.file_path, self.work_dir, '.osm')
+
+        self.assertEqual(elements(clipped_path).ways, {100, 102, 103})
+        timeout = OSWFormat.get_conversion_timeout(os.path.getsize(self.file_path), '.osm')
+        args = worker_pool.run_with_timeout.call_args[0]
+        self.assertEqual(args[:4], (timeout + WORKER_TIMEOUT_GRACE, run_limited, OSWFormat.get_resource_limits(), clip))
+
+    def test_cached_results_depend_on_the_polygon(self):
+        result_cache = ResultCache(cache_dir=os.path.join(self.work_dir, 'results'))
+        keys = []
+        for polygon in [None, SQUARE, [0, 0, 1, 1]]:
+            formatter = OSWFormat(file_path=self.file_path, prefix='test', polygon=polygon,
+                                  result_cache=result_cache)
+            formatter.get_cached_result(self.file_path, '.osm')
+            keys.append(formatter.result_key)
+        self.assertEqual(len(set(keys)), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import time
+import asyncio
+import unittest
+from concurrent.futures import CancelledError
+from src.conversion_loop import ConversionLoop, ConversionTimeout, get_conversion_loop, close_conversion_loop
+
+
+async def convert(value, delay=0):
+    await asyncio.sleep(delay)
+    return value
+
+
+async def convert_in_executor(value):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, lambda: value)
+
+
+class TestConversionLoop(unittest.TestCase):
+    def setUp(self):
+        self.conversion_loop = ConversionLoop(max_workers=2)
+
+    def tearDown(self):
+        self.conversion_loop.close()
+
+    def test_loop_is_reused_across_conversions(self):
+        self.assertEqual(self.conversion_loop.run(convert_in_executor(1)), 1)
+        self.assertEqual(self.conversion_loop.run(convert_in_executor(2)), 2)
+        self.assertFalse(self.conversion_loop.loop.is_closed())
+        self.assertEqual(self.conversion_loop.running, 0)
+
+    def test_conversions_run_concurrently(self):
+        start_time = time.monotonic()
+        futures = [self.conversion_loop.submit(convert(i, delay=0.2)) for i in range(5)]
+        self.assertEqual([future.result() for future in futures], list(range(5)))
+        self.assertLess(time.monotonic() - start_time, 0.9)
+
+    def test_timeout(self):
+        with self.assertRaises(ConversionTimeout) as context:
+            self.conversion_loop.run(convert(1, delay=5), timeout=0.1)
+        self.assertTrue(context.exception.retire_worker)
+        self.assertIn('within 0.1s', str(context.exception))
+
+    def test_cancel(self):
+        future = self.conversion_loop.submit(convert(1, delay=5))
+        time.sleep(0.05)
+        self.conversion_loop.cancel_all()
+        with self.assertRaises(CancelledError):
+            future.result(timeout=1)
+
+    def test_close_cancels_running_conversions(self):
+        future = self.conversion_loop.submit(convert(1, delay=5))
+        self.conversion_loop.close()
+        self.assertTrue(future.cancelled())
+        self.assertTrue(self.conversion_loop.loop.is_closed())
+
+    def test_process_loop_is_shared(self):
+        try:
+            self.assertIs(get_conversion_loop(), get_conversion_loop())
+        finally:
+            close_conversion_loop()
+
+
+if __name__ == '__main__':
+    unittest.main()
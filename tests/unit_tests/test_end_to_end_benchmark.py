@@ -0,0 +1,112 @@
+import os
+import json
+import shutil
+import zipfile
+import unittest
+import tempfile
+import xml.etree.ElementTree as ET
+from python_ms_core.core.queue.models.queue_message import QueueMessage
+from src.tracing import Span
+from benchmarks.end_to_end import (
+    write_osm,
+    write_osw,
+    Responses,
+    trace_stages,
+    job_trace_id,
+    summarize,
+    find_regressions,
+)
+
+
+def result(name, wall_time=1.0, peak_rss=100, success=True):
+    return {'name': name, 'wall_time': wall_time, 'peak_rss': peak_rss, 'success': success}
+
+
+class TestEndToEndBenchmark(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_write_osm_is_a_sidewalk_grid(self):
+        path = write_osm(os.path.join(self.work_dir, 'grid.osm'), 9)
+        root = ET.parse(path).getroot()
+        self.assertEqual(len(root.findall('node')), 9)
+        ways = root.findall('way')
+        # A way along every row and every column of the 3x3 grid
+        self.assertEqual(len(ways), 6)
+        self.assertEqual({tag.get('v') for tag in ways[0].findall('tag')}, {'footway', 'sidewalk'})
+        node_ids = {node.get('id') for node in root.findall('node')}
+        self.assertTrue(all(nd.get('ref') in node_ids for way in ways for nd in way.findall('nd')))
+
+    def test_write_osw_edges_join_existing_nodes(self):
+        path = write_osw(os.path.join(self.work_dir, 'grid.zip'), 9)
+        with zipfile.ZipFile(path) as archive:
+            self.assertEqual(sorted(archive.namelist()), ['bench.graph.edges.geojson', 'bench.graph.nodes.geojson'])
+            nodes = json.loads(archive.read('bench.graph.nodes.geojson'))['features']
+            edges = json.loads(archive.read('bench.graph.edges.geojson'))['features']
+        node_ids = {node['properties']['_id'] for node in nodes}
+        self.assertEqual(len(nodes), 9)
+        self.assertEqual(len(edges), 12)
+        for edge in edges:
+            self.assertIn(edge['properties']['_u_id'], node_ids)
+            self.assertIn(edge['properties']['_v_id'], node_ids)
+
+    def test_responses_skip_progress_messages(self):
+        responses = Responses()
+        responses.receive(QueueMessage.data_from({'messageId': '1', 'messageType': 'osw-format-progress'}))
+        with self.assertRaises(TimeoutError):
+            responses.wait('1', timeout=0.01)
+        responses.receive(QueueMessage.data_from({'messageId': '1', 'messageType': 'osw-format',
+                                                  'data': {'success': True}}))
+        self.assertEqual(responses.wait('1', timeout=1).data, {'success': True})
+
+    def test_trace_stages_sums_the_children_of_a_trace(self):
+        spans = [
+            Span(name='benchmark', trace_id='a', span_id='1', start_time=0, end_time=int(5e9)),
+            Span(name='publish', trace_id='a', span_id='2', parent_id='1', start_time=0, end_time=int(1e9)),
+            Span(name='publish', trace_id='a', span_id='3', parent_id='1', start_time=0, end_time=int(2e9)),
+            Span(name='download', trace_id='b', span_id='4', parent_id='5', start_time=0, end_time=int(1e9)),
+        ]
+        self.assertEqual(trace_stages(spans, 'a'), {'publish': 3.0})
+
+    def test_job_trace_id(self):
+        spans = [
+            Span(name='publish', trace_id='a', span_id='2', parent_id='1', attributes={'job_id': 'job'}),
+            Span(name='format', trace_id='a', span_id='1', attributes={'job_id': 'job'}),
+        ]
+        self.assertEqual(job_trace_id(spans, 'job'), 'a')
+        self.assertIsNone(job_trace_id(spans, 'other'))
+
+    def test_summarize_takes_medians(self):
+        runs = [
+            {'wall_time': 1.0, 'stages': {'conversion': 0.5}, 'peak_rss': 10, 'success': True, 'error': None},
+            {'wall_time': 3.0, 'stages': {'conversion': 1.5}, 'peak_rss': 30, 'success': True, 'error': None},
+            {'wall_time': 2.0, 'stages': {}, 'peak_rss': 20, 'success': False, 'error': 'Exception: failed'},
+        ]
+        summary = summarize('format/osm/9', 'format', 'osm', 9, 100, runs)
+        self.assertEqual(summary['wall_time'], 2.0)
+        self.assertEqual(summary['stages'], {'conversion': 0.5})
+        self.assertEqual(summary['peak_rss'], 30)
+        self.assertFalse(summary['success'])
+        self.assertEqual(summary['errors'], ['Exception: failed'])
+
+    def test_find_regressions(self):
+        baseline = {'results': [result('a'), result('b'), result('c'), result('d')]}
+        report = {'results': [
+            result('a', wall_time=1.2),
+            result('b', wall_time=1.5),
+            result('c', peak_rss=200),
+            result('d', success=False),
+            result('new', wall_time=100),
+        ]}
+        regressions = find_regressions(report, baseline, max_regression=0.25)
+        self.assertEqual(len(regressions), 3)
+        self.assertTrue(regressions[0].startswith('b: wall_time'))
+        self.assertTrue(regressions[1].startswith('c: peak_rss'))
+        self.assertEqual(regressions[2], 'd: failed, the baseline succeeded')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import time
+import threading
+import unittest
+from unittest.mock import MagicMock
+from src.handle_pool import HandlePool
+from src.metrics import REGISTRY, HANDLES_CREATED, HANDLES_REUSED, HANDLES_RECYCLED
+
+
+class TestHandlePool(unittest.TestCase):
+    def setUp(self):
+        self.pool = HandlePool()
+        self.factory = MagicMock(side_effect=lambda: MagicMock())
+
+    def test_handle_is_created_once(self):
+        first = self.pool.get('topic', self.factory)
+        second = self.pool.get('topic', self.factory)
+        self.assertIs(first, second)
+        self.factory.assert_called_once()
+        self.assertEqual(self.pool.stats(), {'created': 1, 'reused': 1, 'recycled': 0})
+
+    def test_stats_are_exported_as_metrics(self):
+        created, reused, recycled = (counter.value(kind='metrics-test')
+                                     for counter in (HANDLES_CREATED, HANDLES_REUSED, HANDLES_RECYCLED))
+        self.pool.get(('metrics-test', 'topic'), self.factory)
+        self.pool.get(('metrics-test', 'topic'), self.factory)
+        self.pool.invalidate(('metrics-test', 'topic'))
+        self.pool.get(('metrics-test', 'topic'), self.factory)
+
+        self.assertEqual(HANDLES_CREATED.value(kind='metrics-test'), created + 2)
+        self.assertEqual(HANDLES_REUSED.value(kind='metrics-test'), reused + 1)
+        self.assertEqual(HANDLES_RECYCLED.value(kind='metrics-test'), recycled + 1)
+        self.assertIn('osw_formatter_handles_created_total{kind="metrics-test"}', REGISTRY.render())
+
+    def test_handles_per_key(self):
+        self.assertIsNot(self.pool.get('a', self.factory), self.pool.get('b', self.factory))
+        self.assertEqual(self.pool.stats()['created'], 2)
+
+    def test_failed_lease_recycles_handle(self):
+        with self.assertRaises(IOError):
+            with self.pool.lease('topic', self.factory) as handle:
+                raise IOError('connection lost')
+        replacement = self.pool.get('topic', self.factory)
+        self.assertIsNot(replacement, handle)
+        handle.close.assert_called_once()
+        self.assertEqual(self.pool.stats(), {'created': 2, 'reused': 0, 'recycled': 1})
+
+    def test_expired_handle_is_recycled(self):
+        self.pool.max_age = 0.01
+        first = self.pool.get('topic', self.factory)
+        time.sleep(0.02)
+        self.assertIsNot(self.pool.get('topic', self.factory), first)
+        first.publisher.close.assert_called_once()
+        first.client.close.assert_called_once()
+
+    def test_invalidate(self):
+        first = self.pool.get('topic', self.factory)
+        self.pool.invalidate('topic')
+        self.assertIsNot(self.pool.get('topic', self.factory), first)
+
+    def test_exclusive_lease(self):
+        active = []
+        overlaps = []
+
+        def publish():
+            with self.pool.lease('topic', self.factory, exclusive=True):
+                active.append(1)
+                overlaps.append(len(active))
+                time.sleep(0.01)
+                active.pop()
+
+        threads = [threading.Thread(target=publish) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(max(overlaps), 1)
+        self.factory.assert_called_once()
+
+    def test_close(self):
+        handle = self.pool.get('topic', self.factory)
+        self.pool.close()
+        handle.close.assert_called_once()
+        self.assertIsNot(self.pool.get('topic', self.factory), handle)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+import time
+import shutil
+import tempfile
+import unittest
+import threading
+from python_ms_core.core.queue.models.queue_message import QueueMessage
+from src.local_backend import LocalBroker, InProcessTopic, LocalCore, get_broker
+from src.storage import LocalStorageClient
+
+
+def message(message_id):
+    return QueueMessage.data_from({'messageId': message_id, 'messageType': 'osw-format', 'data': {'id': message_id}})
+
+
+class Subscriber:
+    """Subscribes on a thread and collects what it receives."""
+
+    def __init__(self, topic, subscription, handle=None):
+        self.topic = topic
+        self.received = []
+        self.handle = handle
+        self._lock = threading.Lock()
+        self.thread = threading.Thread(target=topic.subscribe, args=(subscription, self.callback), daemon=True)
+        self.thread.start()
+
+    def callback(self, received):
+        if self.handle:
+            self.handle(received)
+        with self._lock:
+            self.received.append(received)
+
+    def wait_for(self, count, timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if len(self.received) >= count:
+                    return list(self.received)
+            time.sleep(0.01)
+        raise AssertionError(f'Received {len(self.received)} of {count} messages')
+
+    def stop(self):
+        self.topic.close()
+        self.thread.join(timeout=5)
+
+
+class TestLocalBackend(unittest.TestCase):
+    def setUp(self):
+        self.broker = LocalBroker()
+        self.subscribers = []
+
+    def tearDown(self):
+        for subscriber in self.subscribers:
+            subscriber.stop()
+
+    def subscribe(self, topic, subscription, handle=None):
+        subscriber = Subscriber(topic, subscription, handle)
+        self.subscribers.append(subscriber)
+        return subscriber
+
+    def test_every_subscription_gets_a_copy(self):
+        first = self.subscribe(InProcessTopic(self.broker, 'requests'), 'first')
+        second = self.subscribe(InProcessTopic(self.broker, 'requests'), 'second')
+        self.broker.subscription('requests', 'first')
+        self.broker.subscription('requests', 'second')
+        sent = message('1')
+        InProcessTopic(self.broker, 'requests').publish(sent)
+
+        received = first.wait_for(1)[0]
+        self.assertEqual(received.messageId, '1')
+        self.assertEqual(received.data, {'id': '1'})
+        self.assertIsNot(received, sent)
+        self.assertEqual(second.wait_for(1)[0].messageId, '1')
+
+    def test_messages_published_before_subscribing_are_kept(self):
+        topic = InProcessTopic(self.broker, 'requests')
+        topic.publish(message('1'))
+        topic.publish(message('2'))
+        self.assertEqual(self.broker.pending('requests'), 2)
+
+        subscriber = self.subscribe(topic, 'formatter')
+        self.assertEqual([received.messageId for received in subscriber.wait_for(2)], ['1', '2'])
+        self.assertEqual(self.broker.pending('requests'), 0)
+
+    def test_concurrency_is_limited(self):
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def handle(_):
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.pop()
+
+        topic = InProcessTopic(self.broker, 'requests', max_concurrent_messages=2)
+        for i in range(6):
+            topic.publish(message(str(i)))
+        subscriber = self.subscribe(topic, 'formatter', handle)
+        subscriber.wait_for(6)
+        self.assertEqual(max(peak), 2)
+
+    def test_latency_is_added_to_publish(self):
+        topic = InProcessTopic(self.broker, 'requests', latency=0.05)
+        start_time = time.monotonic()
+        topic.publish(message('1'))
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.05)
+
+    def test_callback_errors_do_not_stop_the_subscription(self):
+        def handle(received):
+            if received.messageId == '1':
+                raise ValueError('bad message')
+
+        topic = InProcessTopic(self.broker, 'requests', max_concurrent_messages=1)
+        subscriber = self.subscribe(topic, 'formatter', handle)
+        topic.publish(message('1'))
+        topic.publish(message('2'))
+        self.assertEqual([received.messageId for received in subscriber.wait_for(1)], ['2'])
+
+    def test_failed_messages_are_delivered_again(self):
+        failed = []
+
+        def handle(received):
+            if not failed:
+                failed.append(received.messageId)
+                raise ValueError('lane full')
+
+        topic = InProcessTopic(self.broker, 'requests', max_concurrent_messages=1)
+        subscriber = self.subscribe(topic, 'formatter', handle)
+        topic.publish(message('1'))
+        topic.publish(message('2'))
+        self.assertEqual(sorted(received.messageId for received in subscriber.wait_for(2)), ['1', '2'])
+        self.assertEqual(failed, ['1'])
+
+    def test_close_ends_subscribe(self):
+        topic = InProcessTopic(self.broker, 'requests')
+        subscriber = Subscriber(topic, 'formatter')
+        subscriber.stop()
+        self.assertFalse(subscriber.thread.is_alive())
+
+    def test_local_core(self):
+        root_dir = tempfile.mkdtemp()
+        try:
+            core = LocalCore(root_dir=root_dir)
+            self.assertIs(core.broker, get_broker())
+            self.assertIsInstance(core.get_storage_client(), LocalStorageClient)
+            self.assertEqual(core.get_storage_client().root_dir, root_dir)
+
+            topic = core.get_topic(topic_name='requests', max_concurrent_messages=3)
+            self.assertEqual(topic.max_concurrent_messages, 3)
+            subscriber = Subscriber(topic, 'formatter')
+            core.close()
+            subscriber.thread.join(timeout=5)
+            self.assertFalse(subscriber.thread.is_alive())
+        finally:
+            shutil.rmtree(root_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,6 +18,13 @@ class TestApp(unittest.TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.text.strip('\"'), "I'm healthy !!")
 
+    def test_metrics(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.headers['content-type'].startswith('text/plain'))
+        self.assertIn('# TYPE osw_formatter_stage_seconds histogram', response.text)
+        self.assertIn('# TYPE osw_formatter_jobs_in_flight gauge', response.text)
+
     def test_get_settings(self):
         settings = get_settings()
         self.assertIsNotNone(settings)
@@ -0,0 +1,69 @@
+import gc
+import unittest
+from unittest.mock import patch
+from src.memory_policy import MemoryPolicy, GCMonitor, current_rss
+
+
+class TestGCMonitor(unittest.TestCase):
+    def setUp(self):
+        self.monitor = GCMonitor()
+
+    def tearDown(self):
+        self.monitor.uninstall()
+
+    def test_collections_are_timed(self):
+        self.monitor.install()
+        gc.collect()
+        stats = self.monitor.stats()
+        self.assertGreaterEqual(stats['collections'][2], 1)
+        self.assertGreater(stats['pause_time'], 0)
+        self.assertGreaterEqual(stats['pause_time'], stats['max_pause'])
+
+    def test_install_is_idempotent(self):
+        self.monitor.install()
+        self.monitor.install()
+        self.assertEqual(gc.callbacks.count(self.monitor._callback), 1)
+        self.monitor.uninstall()
+        self.assertNotIn(self.monitor._callback, gc.callbacks)
+
+
+class TestMemoryPolicy(unittest.TestCase):
+    def test_current_rss(self):
+        self.assertGreater(current_rss(), 0)
+
+    @patch('src.memory_policy.gc.collect')
+    @patch('src.memory_policy.current_rss', return_value=100)
+    def test_skips_collection_below_threshold(self, mock_rss, mock_collect):
+        policy = MemoryPolicy(rss_threshold=200, freeze=False)
+        self.assertFalse(policy.after_job())
+        mock_collect.assert_not_called()
+        self.assertEqual(policy.stats()['skipped'], 1)
+
+    @patch('src.memory_policy.gc.collect', return_value=0)
+    @patch('src.memory_policy.current_rss', return_value=300)
+    def test_collects_above_threshold(self, mock_rss, mock_collect):
+        policy = MemoryPolicy(rss_threshold=200, freeze=False)
+        self.assertTrue(policy.after_job())
+        mock_collect.assert_called_once()
+        self.assertEqual(policy.stats()['collected'], 1)
+
+    @patch('src.memory_policy.gc.collect')
+    @patch('src.memory_policy.current_rss', return_value=300)
+    def test_zero_threshold_never_collects(self, mock_rss, mock_collect):
+        self.assertFalse(MemoryPolicy(rss_threshold=0, freeze=False).after_job())
+        mock_collect.assert_not_called()
+
+    @patch('src.memory_policy.gc.freeze')
+    def test_start_freezes_and_installs_monitor(self, mock_freeze):
+        policy = MemoryPolicy(freeze=True)
+        policy.start()
+        try:
+            mock_freeze.assert_called_once()
+            self.assertIn(policy.monitor._callback, gc.callbacks)
+        finally:
+            policy.stop()
+        self.assertNotIn(policy.monitor._callback, gc.callbacks)
+
+
+if __name__ == '__main__':
+    unittest.main()
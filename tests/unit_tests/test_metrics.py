@@ -0,0 +1,64 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from src.metrics import Registry, Counter, Gauge, Histogram, queue_lag
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter(self):
+        counter = Counter('test_bytes_total', 'Bytes', registry=self.registry)
+        counter.inc(10)
+        counter.inc(5)
+        self.assertEqual(counter.value(), 15)
+        with self.assertRaises(ValueError):
+            counter.inc(-1)
+        self.assertIn('test_bytes_total 15', self.registry.render())
+
+    def test_gauge_tracks_in_progress(self):
+        gauge = Gauge('test_jobs', 'Jobs', ['kind'], registry=self.registry)
+        with gauge.track_inprogress(kind='format'):
+            self.assertEqual(gauge.value(kind='format'), 1)
+        self.assertEqual(gauge.value(kind='format'), 0)
+
+    def test_labels_are_validated(self):
+        gauge = Gauge('test_jobs', 'Jobs', ['kind'], registry=self.registry)
+        with self.assertRaises(ValueError):
+            gauge.inc(lane='fast')
+
+    def test_histogram(self):
+        histogram = Histogram('test_seconds', 'Stage duration', ['stage'], buckets=(1, 10), registry=self.registry)
+        histogram.observe(0.5, stage='upload')
+        histogram.observe(5, stage='upload')
+        histogram.observe(50, stage='upload')
+        with histogram.time(stage='zip'):
+            pass
+        self.assertEqual(histogram.count(stage='upload'), 3)
+        self.assertEqual(histogram.count(stage='zip'), 1)
+        text = self.registry.render()
+        self.assertIn('# TYPE test_seconds histogram', text)
+        self.assertIn('test_seconds_bucket{stage="upload",le="1"} 1', text)
+        self.assertIn('test_seconds_bucket{stage="upload",le="10"} 2', text)
+        self.assertIn('test_seconds_bucket{stage="upload",le="+Inf"} 3', text)
+        self.assertIn('test_seconds_sum{stage="upload"} 55.5', text)
+
+    def test_label_values_are_escaped(self):
+        counter = Counter('test_total', 'Test', ['path'], registry=self.registry)
+        counter.inc(path='a"b')
+        self.assertIn('test_total{path="a\\"b"} 1', self.registry.render())
+
+    def test_duplicate_metric(self):
+        Counter('test_total', 'Test', registry=self.registry)
+        with self.assertRaises(ValueError):
+            Counter('test_total', 'Test', registry=self.registry)
+
+    def test_queue_lag(self):
+        published = (datetime.now(timezone.utc) - timedelta(seconds=30)).isoformat().replace('+00:00', 'Z')
+        self.assertAlmostEqual(queue_lag(published), 30, delta=5)
+        self.assertIsNone(queue_lag(None))
+        self.assertIsNone(queue_lag('yesterday'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,16 @@
 import os
+import time
 import uuid
+import zipfile
 import unittest
 from pathlib import Path
 from unittest.mock import patch, MagicMock, Mock
-from src.osw_format import OSWFormat
+from src.osw_format import OSWFormat, convert, WORKER_TIMEOUT_GRACE
+from src.storage import LocalStorageClient, DownloadCache
+from src.result_cache import ResultCache, CachedResponse
+from src.resource_limits import ResourceUsage, run_limited
+from src.conversion_loop import ConversionTimeout
+from python_ms_core.core.storage.providers.azure.azure_file_entity import AzureFileEntity
 
 DOWNLOAD_FILE_PATH = f'{Path.cwd()}/downloads'
 SAVED_FILE_PATH = f'{Path.cwd()}/tests/unit_tests/test_files'
@@ -57,6 +64,87 @@ class TestOSWFormat(unittest.TestCase):
         downloaded_file_path = self.formatter.download_single_file(file_upload_path=file_path)
         self.assertEqual(downloaded_file_path, file_path)
 
+    @patch('src.osw_format.Formatter')
+    def test_format_returns_cached_result(self, mock_formatter):
+        result_cache = ResultCache(cache_dir=f'{DOWNLOAD_FILE_PATH}/results-test')
+        self.formatter.result_cache = result_cache
+        self.formatter.get_cached_result(f'{SAVED_FILE_PATH}/osw.zip', '.zip')
+        result_cache.put(self.formatter.result_key, 'https://example.com/osw/test.zip')
+
+        result = self.formatter.format()
+
+        self.assertIsInstance(result, CachedResponse)
+        self.assertEqual(result.remote_url, 'https://example.com/osw/test.zip')
+        self.assertEqual(result.cache_key, self.formatter.result_key)
+        mock_formatter.assert_not_called()
+        OSWFormat.clean_up(f'{DOWNLOAD_FILE_PATH}/results-test')
+
+    @patch('src.osw_format.convert')
+    def test_format_downloaded_converts_the_downloaded_file(self, mock_convert):
+        result_cache = ResultCache(cache_dir=f'{DOWNLOAD_FILE_PATH}/results-test')
+        self.formatter.result_cache = result_cache
+        self.formatter.get_cached_result(f'{SAVED_FILE_PATH}/osw.zip', '.zip')
+        result_cache.put(self.formatter.result_key, 'https://example.com/osw/test.zip', prefix='old')
+        self.assertEqual(self.formatter.format().prefix, 'old')
+        mock_convert.return_value = MagicMock(status=True)
+
+        result = self.formatter.format_downloaded()
+
+        # The cached result could not be reused, the input is converted without a second download
+        self.assertIs(result, mock_convert.return_value)
+        self.assertEqual(mock_convert.call_args[0][0], f'{SAVED_FILE_PATH}/osw.zip')
+        self.formatter.download_single_file.assert_called_once()
+        OSWFormat.clean_up(f'{DOWNLOAD_FILE_PATH}/results-test')
+
+    def test_format_runs_conversion_in_worker_pool(self):
+        self.formatter.worker_pool = MagicMock()
+        usage = ResourceUsage(peak_rss=1024, cpu_time=1.0)
+        self.formatter.worker_pool.run_with_timeout.return_value = (Mock(status=True), usage)
+
+        result = self.formatter.format()
+
+        self.assertTrue(result.status)
+        self.assertEqual(self.formatter.resource_usage, usage)
+        timeout = OSWFormat.get_conversion_timeout(os.path.getsize(f'{SAVED_FILE_PATH}/osw.zip'), '.zip')
+        self.formatter.worker_pool.run_with_timeout.assert_called_once_with(
+            timeout + WORKER_TIMEOUT_GRACE, run_limited, OSWFormat.get_resource_limits(), convert,
+            f'{SAVED_FILE_PATH}/osw.zip', SAVED_FILE_PATH, 'test', timeout, None
+        )
+
+    @patch('src.osw_format.Formatter')
+    def test_convert_zip_times_out(self, mock_formatter):
+        mock_formatter.return_value.osw2osm.side_effect = lambda: time.sleep(1)
+        with self.assertRaises(ConversionTimeout):
+            convert(f'{SAVED_FILE_PATH}/osw.zip', SAVED_FILE_PATH, 'test', timeout=0.1)
+
+    @patch('src.osw_format.Formatter')
+    def test_convert_zip_runs_on_conversion_loop(self, mock_formatter):
+        mock_formatter.return_value.osw2osm.return_value = Mock(status=True)
+        self.assertTrue(convert(f'{SAVED_FILE_PATH}/osw.zip', SAVED_FILE_PATH, 'test', timeout=10).status)
+
+    def test_get_profile_options(self):
+        self.formatter.prefix = 'test'
+        with patch.object(OSWFormat._settings, 'profile_slow_jobs', False):
+            self.assertIsNone(self.formatter.get_profile_options())
+        with patch.multiple(OSWFormat._settings, profile_slow_jobs=True, profile_threshold=60):
+            options = self.formatter.get_profile_options()
+        self.assertEqual(options.threshold, 60)
+        self.assertTrue(os.path.basename(options.path).startswith('test-'))
+        self.assertTrue(options.path.endswith('.folded'))
+
+    def test_get_conversion_timeout(self):
+        with patch.multiple(OSWFormat._settings, conversion_timeout_base=60, conversion_seconds_per_mb_osm=30,
+                            conversion_seconds_per_mb_osw=10, conversion_timeout_max=3600):
+            self.assertEqual(OSWFormat.get_conversion_timeout(0, '.pbf'), 60)
+            self.assertEqual(OSWFormat.get_conversion_timeout(10 * 1024 * 1024, '.pbf'), 360)
+            self.assertEqual(OSWFormat.get_conversion_timeout(10 * 1024 * 1024, '.zip'), 160)
+            self.assertEqual(OSWFormat.get_conversion_timeout(1024 * 1024 * 1024, '.osm'), 3600)
+            self.assertEqual(OSWFormat.get_conversion_timeout(None, '.osm'), 3600)
+
+    def test_get_cached_result_without_cache(self):
+        self.assertIsNone(self.formatter.get_cached_result(f'{SAVED_FILE_PATH}/osw.zip', '.zip'))
+        self.assertIsNone(self.formatter.result_key)
+
     @patch('src.osw_format.uuid.uuid1')
     def test_get_unique_id(self, mock_uuid1):
         # Arrange
@@ -148,6 +236,10 @@ class TestOSMFormat(unittest.TestCase):
         os.makedirs(os.path.join(self.formatter.download_dir, self.formatter.prefix), exist_ok=True)
         zip_filename = self.formatter.create_zip(file_paths)
         self.assertTrue(os.path.isfile(zip_filename))
+        with zipfile.ZipFile(zip_filename) as zip_file:
+            self.assertEqual(zip_file.namelist(), [f'test_file_{i}.txt' for i in range(3)])
+            self.assertEqual(zip_file.read('test_file_1.txt'), b'Test content for file 1')
+            self.assertEqual(zip_file.getinfo('test_file_1.txt').compress_type, zipfile.ZIP_DEFLATED)
 
         for file_path in file_paths:
             self.assertFalse(os.path.exists(file_path))
@@ -206,6 +298,131 @@ class TestOSWFormatDownload(unittest.TestCase):
         self.assertIsNone(result)
         mock_file.get_stream.assert_not_called()
 
+    def test_download_single_file_streams_from_storage(self):
+        # Arrange
+        storage_client = LocalStorageClient(f'{DOWNLOAD_FILE_PATH}/storage')
+        container = storage_client.get_container(container_name='osw')
+        with open(f'{SAVED_FILE_PATH}/osw.zip', 'rb') as data:
+            container.create_file('test_upload/osw.zip').upload(data)
+        self.formatter.storage_client = storage_client
+        self.formatter.container_name = 'osw'
+        self.formatter.prefix = 'stream'
+
+        # Act
+        with patch.object(OSWFormat._settings, 'download_chunk_size', 1024):
+            result = self.formatter.download_single_file(f'{storage_client.base_url}/osw/test_upload/osw.zip')
+
+        # Assert
+        self.assertEqual(result, f'{DOWNLOAD_FILE_PATH}/stream/osw.zip')
+        with open(result, 'rb') as downloaded, open(f'{SAVED_FILE_PATH}/osw.zip', 'rb') as source:
+            self.assertEqual(downloaded.read(), source.read())
+        OSWFormat.clean_up(f'{DOWNLOAD_FILE_PATH}/stream')
+        OSWFormat.clean_up(f'{DOWNLOAD_FILE_PATH}/storage')
+
+    @patch('src.osw_format.download_to_file')
+    def test_download_single_file_uses_download_cache(self, mock_download_to_file):
+        # Arrange
+        storage_client = LocalStorageClient(f'{DOWNLOAD_FILE_PATH}/storage')
+        container = storage_client.get_container(container_name='osw')
+        container.create_file('test_upload/osw.zip').upload(b'zip-content')
+        url = f'{storage_client.base_url}/osw/test_upload/osw.zip'
+        self.formatter.storage_client = storage_client
+        self.formatter.container_name = 'osw'
+        cache = DownloadCache(cache_dir=f'{DOWNLOAD_FILE_PATH}/cache-test', max_size=1024)
+
+        def download(file, destination, **kwargs):
+            with open(destination, 'wb') as output:
+                output.write(file.get_stream())
+
+        mock_download_to_file.side_effect = download
+
+        # Act
+        with patch.object(OSWFormat, 'get_download_cache', return_value=cache):
+            self.formatter.prefix = 'first'
+            first = self.formatter.download_single_file(url)
+            self.formatter.prefix = 'second'
+            second = self.formatter.download_single_file(url)
+
+        # Assert
+        mock_download_to_file.assert_called_once()
+        self.assertEqual(cache.hits, 1)
+        with open(second, 'rb') as downloaded:
+            self.assertEqual(downloaded.read(), b'zip-content')
+        for path in ['first', 'second', 'storage', 'cache-test']:
+            OSWFormat.clean_up(f'{DOWNLOAD_FILE_PATH}/{path}')
+
+    def test_get_input_size(self):
+        storage_client = LocalStorageClient(f'{DOWNLOAD_FILE_PATH}/storage')
+        container = storage_client.get_container(container_name='osw')
+        container.create_file('test_upload/osw.zip').upload(b'zip-content')
+        self.formatter.storage_client = storage_client
+        self.formatter.container_name = 'osw'
+        self.formatter.file_path = f'{storage_client.base_url}/osw/test_upload/osw.zip'
+
+        self.assertEqual(self.formatter.get_input_size(), len(b'zip-content'))
+        OSWFormat.clean_up(f'{DOWNLOAD_FILE_PATH}/storage')
+
+    def test_get_input_size_unknown(self):
+        self.formatter.storage_client = MagicMock()
+        self.formatter.storage_client.get_file_from_url.side_effect = Exception('not found')
+        self.assertIsNone(self.formatter.get_input_size())
+
+    def test_source_file_is_looked_up_once(self):
+        storage_client = LocalStorageClient(f'{DOWNLOAD_FILE_PATH}/storage')
+        container = storage_client.get_container(container_name='osw')
+        container.create_file('test_upload/osw.zip').upload(b'zip-content')
+        self.formatter.storage_client = MagicMock(wraps=storage_client)
+        self.formatter.container_name = 'osw'
+        self.formatter.prefix = 'once'
+        self.formatter.file_path = f'{storage_client.base_url}/osw/test_upload/osw.zip'
+
+        self.assertEqual(self.formatter.get_input_size(), len(b'zip-content'))
+        result = self.formatter.download_single_file(self.formatter.file_path)
+
+        self.formatter.storage_client.get_file_from_url.assert_called_once_with('osw', self.formatter.file_path)
+        with open(result, 'rb') as downloaded:
+            self.assertEqual(downloaded.read(), b'zip-content')
+        OSWFormat.clean_up(f'{DOWNLOAD_FILE_PATH}/once')
+        OSWFormat.clean_up(f'{DOWNLOAD_FILE_PATH}/storage')
+
+    def test_rename_cached_result(self):
+        storage_client = LocalStorageClient(f'{DOWNLOAD_FILE_PATH}/storage')
+        container = storage_client.get_container(container_name='osw')
+        cached = f'{DOWNLOAD_FILE_PATH}/old.zip'
+        with zipfile.ZipFile(cached, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('old.graph.edges.geojson', '{"type": "FeatureCollection", "features": []}')
+            archive.writestr('old.graph.nodes.geojson', '{"type": "FeatureCollection", "features": []}')
+        with open(cached, 'rb') as data:
+            container.create_file('jobs/old/osm/old.zip').upload(data)
+        self.formatter.storage_client = storage_client
+        self.formatter.container_name = 'osw'
+        self.formatter.prefix = 'new'
+
+        result = self.formatter.rename_cached_result(CachedResponse(
+            status=True, remote_url=f'{storage_client.base_url}/osw/jobs/old/osm/old.zip', cache_key='key',
+            prefix='old'))
+
+        with zipfile.ZipFile(result) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.namelist(), ['new.graph.edges.geojson', 'new.graph.nodes.geojson'])
+        self.assertEqual(os.path.basename(result), 'new.zip')
+        with self.assertRaises(ValueError):
+            self.formatter.rename_cached_result(CachedResponse(status=True, remote_url='url', cache_key='key'))
+        os.remove(cached)
+        OSWFormat.clean_up(f'{DOWNLOAD_FILE_PATH}/new')
+        OSWFormat.clean_up(f'{DOWNLOAD_FILE_PATH}/storage')
+
+    def test_get_input_size_file_not_found(self):
+        # The Azure client returns the entity class when no blob matches the path
+        self.formatter.storage_client = MagicMock()
+        self.formatter.storage_client.get_file_from_url.return_value = AzureFileEntity
+        self.assertIsNone(self.formatter.get_input_size())
+        self.assertIsNone(self.formatter.download_single_file(self.formatter.file_path))
+
+    def test_get_download_cache_disabled_by_default(self):
+        with patch.object(OSWFormat._settings, 'download_cache_size', 0):
+            self.assertIsNone(OSWFormat.get_download_cache())
+
 
 class TesOSWFormatCleanUp(unittest.TestCase):
 
@@ -0,0 +1,64 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from src.profiler import SamplingProfiler, SlowJobProfiler, ProfileOptions
+
+
+def busy(seconds):
+    end_time = time.monotonic() + seconds
+    total = 0
+    while time.monotonic() < end_time:
+        total += sum(range(1000))
+    return total
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'profiles', 'job.folded')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_sampling_profiler_records_stacks(self):
+        profiler = SamplingProfiler(interval=0.005)
+        profiler.start()
+        busy(0.3)
+        profiler.stop()
+        self.assertGreater(profiler.samples, 0)
+        self.assertTrue(any('busy (test_profiler.py' in stack for stack in profiler.stacks))
+        profiler.write(self.path)
+        with open(self.path) as file:
+            stack, count = file.readline().rsplit(' ', 1)
+        self.assertGreater(int(count), 0)
+
+    def test_fast_job_is_not_profiled(self):
+        with SlowJobProfiler(ProfileOptions(path=self.path, threshold=10)) as profiler:
+            busy(0.05)
+        self.assertIsNone(profiler.profiler)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_slow_job_is_profiled(self):
+        with self.assertLogs('osw-formatter', level='INFO') as logs:
+            with SlowJobProfiler(ProfileOptions(path=self.path, threshold=0.1, interval=0.005)):
+                busy(0.4)
+        self.assertTrue(os.path.exists(self.path))
+        self.assertIn(self.path, logs.output[0])
+
+    def test_profile_is_written_when_job_fails(self):
+        with self.assertRaises(TimeoutError):
+            with SlowJobProfiler(ProfileOptions(path=self.path, threshold=0.05, interval=0.005)):
+                busy(0.2)
+                raise TimeoutError()
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_disabled_without_options(self):
+        with SlowJobProfiler(None) as profiler:
+            pass
+        self.assertIsNone(profiler._timer)
+
+
+if __name__ == '__main__':
+    unittest.main()
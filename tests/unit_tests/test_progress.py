@@ -0,0 +1,89 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from src.config import Settings
+from src.progress import ProgressReporter, ConversionProgress, FeatureCounter, input_position, output_bytes
+
+
+class TestProgressReporter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.input_path = os.path.join(self.directory, 'input.osm')
+        with open(self.input_path, 'wb') as input_file:
+            input_file.write(b'x' * 1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_input_position(self):
+        self.assertIsNone(input_position(self.input_path))
+        with open(self.input_path, 'rb', buffering=0) as input_file:
+            input_file.read(300)
+            self.assertEqual(input_position(self.input_path), 300)
+
+    def test_output_bytes_excludes_input(self):
+        with open(os.path.join(self.directory, 'output.geojson'), 'wb') as output_file:
+            output_file.write(b'y' * 200)
+        self.assertEqual(output_bytes(self.directory, exclude=self.input_path), 200)
+
+    def test_feature_counter_reads_only_new_output(self):
+        path = os.path.join(self.directory, 'test.graph.edges.geojson')
+        counter = FeatureCounter(self.directory, '.geojson', chunk_size=16)
+        self.assertEqual(counter.count(), 0)
+        with open(path, 'w') as output_file:
+            output_file.write('{\n  "type": "FeatureCollection",\n  "features": [\n')
+            output_file.write('    {\n      "type": "Feature",\n      "properties": {}\n    },\n')
+            output_file.flush()
+            self.assertEqual(counter.count(), 1)
+            output_file.write('    {\n      "type": "Feature",\n      "properties": {}\n    }\n  ]\n}')
+        os.makedirs(os.path.join(self.directory, 'tiles'))
+        with open(os.path.join(self.directory, 'tiles', 'tile.geojson'), 'w') as tile_file:
+            tile_file.write('{"type": "Feature"}')
+        self.assertEqual(counter.count(), 2)
+        self.assertEqual(counter.count(), 2)
+
+    def test_feature_counter_osm_elements(self):
+        with open(os.path.join(self.directory, 'test.graph.osm.xml'), 'w') as output_file:
+            output_file.write('<osm><node id="1" /><node id="2" /><way id="3"><nd ref="1" /></way></osm>')
+        self.assertEqual(FeatureCounter(self.directory, '.xml').count(), 3)
+
+    def test_reports_while_running(self):
+        callback = MagicMock()
+        with ProgressReporter(callback, 0.05, self.input_path, self.directory, timeout=60):
+            time.sleep(0.3)
+        self.assertGreaterEqual(callback.call_count, 2)
+        progress = callback.call_args[0][0]
+        self.assertIsInstance(progress, ConversionProgress)
+        self.assertEqual(progress.input_size, 1000)
+        self.assertEqual(progress.timeout, 60)
+        self.assertEqual(progress.output_bytes, 0)
+        self.assertEqual(progress.features_emitted, 0)
+
+    def test_short_conversion_reports_nothing(self):
+        callback = MagicMock()
+        with ProgressReporter(callback, 10, self.input_path, self.directory):
+            pass
+        callback.assert_not_called()
+
+    def test_disabled_without_interval(self):
+        reporter = ProgressReporter(MagicMock(), 0, self.input_path, self.directory)
+        with reporter:
+            self.assertIsNone(reporter._thread)
+
+    def test_disabled_by_default(self):
+        reporter = ProgressReporter(MagicMock(), Settings().progress_interval, self.input_path, self.directory)
+        with reporter:
+            self.assertIsNone(reporter._thread)
+
+    def test_callback_errors_are_not_raised(self):
+        callback = MagicMock(side_effect=IOError('topic unavailable'))
+        with ProgressReporter(callback, 0.05, self.input_path, self.directory):
+            time.sleep(0.15)
+        self.assertGreaterEqual(callback.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import pickle
+import unittest
+from src.worker_pool import WorkerPool
+from src.resource_limits import ResourceLimits, ResourceUsage, ResourceLimitExceeded, run_limited
+
+MB = 1024 * 1024
+
+
+def allocate(size):
+    return len(bytearray(size))
+
+
+def spin():
+    while True:
+        pass
+
+
+class TestResourceLimits(unittest.TestCase):
+    def setUp(self):
+        self.pool = WorkerPool(size=1)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_limits_enabled(self):
+        self.assertFalse(ResourceLimits().enabled)
+        self.assertTrue(ResourceLimits(memory=MB).enabled)
+        self.assertTrue(ResourceLimits(cpu_time=1).enabled)
+
+    def test_run_limited_returns_result_and_usage(self):
+        result, usage = self.pool.run(run_limited, ResourceLimits(memory=1024 * MB, cpu_time=60), allocate, 16 * MB)
+        self.assertEqual(result, 16 * MB)
+        self.assertGreaterEqual(usage.peak_rss, 16 * MB)
+        self.assertGreaterEqual(usage.cpu_time, 0)
+
+    def test_memory_limit_exceeded(self):
+        with self.assertRaises(ResourceLimitExceeded) as context:
+            self.pool.run(run_limited, ResourceLimits(memory=512 * MB), allocate, 2048 * MB)
+        self.assertIn('memory', str(context.exception))
+        self.assertIn('peak RSS', str(context.exception))
+        self.assertIsInstance(context.exception.usage, ResourceUsage)
+
+    def test_cpu_time_limit_exceeded(self):
+        with self.assertRaises(ResourceLimitExceeded) as context:
+            self.pool.run(run_limited, ResourceLimits(cpu_time=1), spin)
+        self.assertIn('CPU time', str(context.exception))
+        self.assertGreaterEqual(context.exception.usage.cpu_time, 0.5)
+
+    def test_worker_is_replaced_after_limit_exceeded(self):
+        pid = self.pool.run(os.getpid)
+        with self.assertRaises(ResourceLimitExceeded):
+            self.pool.run(run_limited, ResourceLimits(memory=512 * MB), allocate, 2048 * MB)
+        self.assertNotEqual(self.pool.run(os.getpid), pid)
+
+    def test_limits_are_restored_after_job(self):
+        self.pool.run(run_limited, ResourceLimits(memory=512 * MB), allocate, MB)
+        self.assertEqual(self.pool.run(allocate, 1024 * MB), 1024 * MB)
+
+    def test_exception_is_picklable(self):
+        error = pickle.loads(pickle.dumps(ResourceLimitExceeded('memory (1 MB)', ResourceUsage(peak_rss=MB, cpu_time=1.5))))
+        self.assertEqual(error.limit, 'memory (1 MB)')
+        self.assertEqual(error.usage.cpu_time, 1.5)
+        self.assertEqual(str(error), 'Conversion exceeded the memory (1 MB) limit (peak RSS 1 MB, CPU time 1.5s)')
+
+
+if __name__ == '__main__':
+    unittest.main()
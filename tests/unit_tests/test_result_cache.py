@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import unittest
+from src.result_cache import ResultCache, CachedResponse, OSM_TO_OSW, OSW_TO_OSM
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = ResultCache(cache_dir=self.cache_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_get_key(self):
+        key = ResultCache.get_key('abc', OSM_TO_OSW, '0.3.1')
+        self.assertEqual(key, ResultCache.get_key('abc', OSM_TO_OSW, '0.3.1'))
+        self.assertNotEqual(key, ResultCache.get_key('abc', OSW_TO_OSM, '0.3.1'))
+        self.assertNotEqual(key, ResultCache.get_key('abc', OSM_TO_OSW, '0.3.2'))
+        self.assertNotEqual(key, ResultCache.get_key('abd', OSM_TO_OSW, '0.3.1'))
+
+    def test_miss(self):
+        self.assertIsNone(self.cache.get('missing'))
+        self.assertEqual(self.cache.stats(), {'hits': 0, 'misses': 1, 'hit_ratio': 0.0})
+
+    def test_put_and_get(self):
+        self.cache.put('key', 'https://example.com/osw/output.zip')
+        self.assertEqual(self.cache.get('key'), 'https://example.com/osw/output.zip')
+        self.assertIsNone(self.cache.get('other'))
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+    def test_entry_keeps_the_prefix(self):
+        self.cache.put('key', 'https://example.com/osw/output.zip', prefix='1234')
+        entry = self.cache.get_entry('key')
+        self.assertEqual(entry['remote_url'], 'https://example.com/osw/output.zip')
+        self.assertEqual(entry['prefix'], '1234')
+        self.assertIsNone(self.cache.get_entry('other'))
+
+    def test_invalidate(self):
+        self.cache.put('key', 'https://example.com/osw/output.zip')
+        self.cache.invalidate('key')
+        self.cache.invalidate('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_corrupt_entry_is_a_miss(self):
+        with open(self.cache.get_path('key'), 'w') as entry:
+            entry.write('{not json')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_cached_response(self):
+        response = CachedResponse(status=True, remote_url='url', cache_key='key')
+        self.assertTrue(response.status)
+        self.assertIsNone(response.generated_files)
+        self.assertIsNone(response.error)
+
+
+if __name__ == '__main__':
+    unittest.main()
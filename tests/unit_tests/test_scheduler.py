@@ -0,0 +1,58 @@
+import threading
+import unittest
+from src.scheduler import LaneScheduler, FAST_LANE, BULK_LANE
+
+MB = 1024 * 1024
+
+
+class TestLaneScheduler(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = LaneScheduler(fast_workers=2, bulk_workers=1, fast_max_size=64 * MB)
+
+    def _acquire_in_thread(self, size):
+        admitted = threading.Event()
+
+        def run():
+            self.scheduler.acquire(size)
+            admitted.set()
+
+        threading.Thread(target=run, daemon=True).start()
+        return admitted
+
+    def test_lane_for(self):
+        self.assertEqual(self.scheduler.lane_for(MB), FAST_LANE)
+        self.assertEqual(self.scheduler.lane_for(64 * MB), FAST_LANE)
+        self.assertEqual(self.scheduler.lane_for(64 * MB + 1), BULK_LANE)
+        self.assertEqual(self.scheduler.lane_for(None), BULK_LANE)
+
+    def test_small_job_does_not_wait_for_bulk_lane(self):
+        self.scheduler.acquire(10 * 1024 * MB)
+        admitted = self._acquire_in_thread(MB)
+        self.assertTrue(admitted.wait(1))
+        self.assertEqual(self.scheduler.running, {FAST_LANE: 1, BULK_LANE: 1})
+
+    def test_bulk_jobs_are_serialized(self):
+        lane = self.scheduler.acquire(None)
+        admitted = self._acquire_in_thread(10 * 1024 * MB)
+        self.assertFalse(admitted.wait(0.2))
+        self.assertEqual(self.scheduler.waiting[BULK_LANE], 1)
+        self.scheduler.release(lane)
+        self.assertTrue(admitted.wait(1))
+        self.assertEqual(self.scheduler.waiting[BULK_LANE], 0)
+
+    def test_fast_lane_budget(self):
+        self.scheduler.acquire(MB)
+        self.scheduler.acquire(MB)
+        admitted = self._acquire_in_thread(MB)
+        self.assertFalse(admitted.wait(0.2))
+        self.scheduler.release(FAST_LANE)
+        self.assertTrue(admitted.wait(1))
+
+    def test_budgets_fit_in_the_receive_window(self):
+        self.assertEqual(LaneScheduler(2, 1, 64 * MB, max_jobs=2).budgets, {FAST_LANE: 1, BULK_LANE: 1})
+        self.assertEqual(LaneScheduler(2, 4, 64 * MB, max_jobs=4).budgets, {FAST_LANE: 1, BULK_LANE: 3})
+        self.assertEqual(LaneScheduler(2, 1, 64 * MB, max_jobs=8).budgets, {FAST_LANE: 2, BULK_LANE: 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+from python_ms_core.core.queue.models.queue_message import QueueMessage
+from src.models import OSWOnDemandRequest
+from benchmarks.soak import slope, LeakDetector, on_demand_message
+
+
+class TestSoakBenchmark(unittest.TestCase):
+    def test_slope(self):
+        self.assertEqual(slope([(0, 10), (10, 30), (20, 50)]), 2.0)
+        self.assertEqual(slope([(5, 10)]), 0.0)
+        self.assertEqual(slope([(5, 10), (5, 20)]), 0.0)
+
+    def test_leak_detector_finds_retained_memory(self):
+        retained = []
+        detector = LeakDetector(frames=5)
+        detector.start()
+        try:
+            detector.snapshot(0)
+            for jobs in range(10, 40, 10):
+                for _ in range(10):
+                    retained.append(bytearray(10000))
+                detector.snapshot(jobs)
+        finally:
+            detector.stop()
+
+        self.assertGreater(detector.growth_per_job(), 9000)
+        self.assertLess(detector.growth_per_job(), 11000)
+        top = detector.top()
+        self.assertIn('test_soak_benchmark.py', ''.join(top[0]['traceback']))
+        self.assertGreaterEqual(top[0]['count_diff'], 30)
+        self.assertGreater(top[0]['per_job'], 9000)
+
+    def test_leak_detector_without_growth(self):
+        detector = LeakDetector(frames=1)
+        detector.start()
+        try:
+            detector.snapshot(0)
+            for jobs in range(10, 40, 10):
+                garbage = [bytearray(10000) for _ in range(10)]
+                del garbage
+                detector.snapshot(jobs)
+        finally:
+            detector.stop()
+        self.assertLess(detector.growth_per_job(), 1000)
+
+    def test_on_demand_message_is_a_valid_request(self):
+        message = on_demand_message('job', 'file:///storage/osw/input.zip', 'osw')
+        request = OSWOnDemandRequest(messageType=message.messageType, messageId=message.messageId,
+                                     data=QueueMessage.to_dict(message)['data'])
+        self.assertIn('on_demand', request.messageType)
+        self.assertEqual(request.data.jobId, 'job')
+        self.assertEqual(request.data.target, 'osm')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch, MagicMock
+from src import tiling
+from src.osw_format import OSWFormat, convert
+from src.worker_pool import WorkerPool
+from src.resource_limits import ResourceUsage
+from benchmarks.end_to_end import write_osm
+
+SAVED_FILE_PATH = f'{Path.cwd()}/tests/unit_tests/test_files'
+
+
+def features(files):
+    """Output features by kind, edges without their sequential `_id`, ignoring order."""
+    result = {}
+    for path in files:
+        collection = json.loads(Path(path).read_text())
+        kind = tiling.file_kind(path)
+        found = set()
+        for feature in collection['features']:
+            properties = dict(feature['properties'])
+            if kind == 'edges':
+                properties.pop('_id')
+            found.add(json.dumps([properties, feature['geometry']], sort_keys=True))
+        result[kind] = found
+    return result
+
+
+def feature(_id, **properties):
+    return {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [0, 0]},
+            'properties': {'_id': _id, **properties}}
+
+
+class TestTiling(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_split_owns_every_way_once(self):
+        path = write_osm(os.path.join(self.work_dir, 'grid.osm'), 100)
+        tiles = tiling.split(path, os.path.join(self.work_dir, 'tiles'), 3)
+        self.assertEqual(len(tiles), 3)
+        owned_ways = []
+        for tile in tiles:
+            self.assertTrue(os.path.exists(tile['path']))
+            owned_ways += json.loads(Path(tile['ownership']).read_text())['owned_ways']
+        # A way along every row and every column of the 10x10 grid
+        self.assertEqual(len(owned_ways), 20)
+        self.assertEqual(len(set(owned_ways)), 20)
+
+    def test_split_without_ways(self):
+        path = os.path.join(self.work_dir, 'nodes.osm')
+        Path(path).write_text('<?xml version="1.0"?><osm version="0.6">'
+                              '<node id="1" lat="47.6" lon="-122.3" version="1"/></osm>')
+        self.assertIsNone(tiling.split(path, os.path.join(self.work_dir, 'tiles'), 2))
+
+    def test_merge_writes_shared_features_once(self):
+        tile_files = []
+        for tile, (node, edge) in enumerate([('1', '10'), ('1', '20')]):
+            directory = os.path.join(self.work_dir, str(tile))
+            os.makedirs(directory)
+            nodes = os.path.join(directory, 'tile.graph.nodes.geojson')
+            edges = os.path.join(directory, 'tile.graph.edges.geojson')
+            Path(nodes).write_text(json.dumps({'features': [feature(node)]}))
+            Path(edges).write_text(json.dumps({'features': [feature('1', **{'ext:osm_id': edge})]}))
+            tile_files.append([nodes, edges])
+
+        generated_files = tiling.merge(tile_files, self.work_dir, 'test.grid')
+
+        self.assertEqual(generated_files, [os.path.join(self.work_dir, 'test.grid.graph.nodes.geojson'),
+                                           os.path.join(self.work_dir, 'test.grid.graph.edges.geojson')])
+        nodes, edges = [json.loads(Path(path).read_text()) for path in generated_files]
+        self.assertEqual(nodes['type'], 'FeatureCollection')
+        self.assertEqual(len(nodes['features']), 1)
+        self.assertEqual([edge['properties']['_id'] for edge in edges['features']], ['1', '2'])
+        self.assertEqual([edge['properties']['ext:osm_id'] for edge in edges['features']], ['10', '20'])
+
+    def test_merge_streams_the_layout_of_a_single_write(self):
+        features = [feature('1', note='two\nlines'), feature('2')]
+        tile = os.path.join(self.work_dir, 'tile.graph.points.geojson')
+        Path(tile).write_text(json.dumps({'features': features}))
+        expected = os.path.join(self.work_dir, 'expected.geojson')
+        tiling._write(expected, {'features': features})
+
+        generated_files = tiling.merge([[tile], [tile]], self.work_dir, 'test.grid')
+
+        self.assertEqual(generated_files, [os.path.join(self.work_dir, 'test.grid.graph.points.geojson')])
+        self.assertEqual(Path(generated_files[0]).read_text(), Path(expected).read_text())
+        self.assertFalse(os.path.exists(os.path.join(self.work_dir, 'test.grid.graph.edges.geojson')))
+
+    def test_tiled_conversion_matches_single_conversion(self):
+        file_path = os.path.join(self.work_dir, 'wa.microsoft.osm.pbf')
+        shutil.copy(f'{SAVED_FILE_PATH}/wa.microsoft.osm.pbf', file_path)
+        single = convert(file_path, os.path.join(self.work_dir, 'single'), 'test')
+
+        formatter = OSWFormat(file_path=file_path, prefix='test', worker_pool=WorkerPool(size=2))
+        try:
+            with patch.object(formatter._settings, 'tiled_conversion_tiles', 4):
+                tiled = formatter.convert_tiled(file_path, self.work_dir, timeout=300)
+        finally:
+            formatter.worker_pool.shutdown()
+
+        self.assertTrue(tiled.status)
+        self.assertEqual([os.path.basename(path) for path in tiled.generated_files],
+                         [os.path.basename(path) for path in single.generated_files])
+        self.assertEqual(features(tiled.generated_files), features(single.generated_files))
+        self.assertFalse(os.path.exists(os.path.join(self.work_dir, 'tiles')))
+        self.assertGreater(formatter.resource_usage.cpu_time, 0)
+
+    def test_convert_tiled_falls_back_when_not_split(self):
+        formatter = OSWFormat(file_path='input.osm', prefix='test', worker_pool=MagicMock(size=2))
+        formatter.worker_pool.run_with_timeout.return_value = (None, ResourceUsage(peak_rss=1024, cpu_time=1.0))
+        self.assertIsNone(formatter.convert_tiled('input.osm', self.work_dir, timeout=60))
+        self.assertEqual(formatter.resource_usage, ResourceUsage(peak_rss=1024, cpu_time=1.0))
+
+    def test_use_tiles(self):
+        formatter = OSWFormat(file_path='input.osm', prefix='test')
+        with patch.multiple(formatter._settings, tiled_conversion=True, tiled_conversion_threshold=100):
+            self.assertTrue(formatter.use_tiles(100, '.pbf'))
+            self.assertFalse(formatter.use_tiles(99, '.osm'))
+            self.assertFalse(formatter.use_tiles(100, '.zip'))
+        self.assertFalse(formatter.use_tiles(10 ** 12, '.pbf'))
+
+
+if __name__ == '__main__':
+    unittest.main()
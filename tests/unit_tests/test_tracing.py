@@ -0,0 +1,99 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from src.tracing import (Tracer, InMemorySpanExporter, LoggingSpanExporter, OTLPJsonFileExporter, STATUS_OK,
+                         STATUS_ERROR, configure_tracing, get_tracer, current_span)
+
+
+class TestTracer(unittest.TestCase):
+    def setUp(self):
+        self.exporter = InMemorySpanExporter()
+        self.tracer = Tracer(self.exporter)
+
+    def test_spans_are_nested(self):
+        with self.tracer.span('format', job_id='1234') as job:
+            with self.tracer.span('download'):
+                pass
+            with self.tracer.span('upload'):
+                pass
+        download, upload, root = self.exporter.get_finished_spans()
+        self.assertIs(root, job)
+        self.assertIsNone(root.parent_id)
+        self.assertEqual(root.attributes, {'job_id': '1234'})
+        for child in (download, upload):
+            self.assertEqual(child.trace_id, root.trace_id)
+            self.assertEqual(child.parent_id, root.span_id)
+        self.assertEqual(len(root.trace_id), 32)
+        self.assertEqual(len(root.span_id), 16)
+        self.assertIsNone(current_span())
+
+    def test_error_status(self):
+        with self.assertRaises(IOError):
+            with self.tracer.span('upload'):
+                raise IOError('connection reset')
+        span = self.exporter.get_finished_spans()[0]
+        self.assertEqual(span.status, STATUS_ERROR)
+        self.assertIn('connection reset', span.status_message)
+
+    def test_manual_span_end_is_idempotent(self):
+        span = self.tracer.start_span('format')
+        span.end()
+        span.end(error=ValueError())
+        self.assertEqual(span.status, STATUS_OK)
+        self.assertEqual(len(self.exporter.get_finished_spans()), 1)
+
+    def test_threads_start_their_own_traces(self):
+        spans = []
+        with self.tracer.span('format'):
+            thread = threading.Thread(target=lambda: spans.append(self.tracer.start_span('other')))
+            thread.start()
+            thread.join()
+        self.assertIsNone(spans[0].parent_id)
+
+    def test_traceparent(self):
+        span = self.tracer.start_span('format')
+        self.assertEqual(span.traceparent(), f'00-{span.trace_id}-{span.span_id}-01')
+        span.end()
+
+    def test_logging_exporter_logs_trace_summary(self):
+        tracer = Tracer(LoggingSpanExporter())
+        with self.assertLogs('osw-formatter', level='INFO') as logs:
+            with tracer.span('format', job_id='1234'):
+                with tracer.span('conversion'):
+                    pass
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('format job_id=1234', logs.output[0])
+        self.assertIn('conversion', logs.output[0])
+
+    def test_otlp_json_file_exporter(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'traces', 'spans.jsonl')
+            tracer = Tracer(OTLPJsonFileExporter(path))
+            with tracer.span('format', job_id='1234', input_size=10):
+                pass
+            with open(path) as file:
+                request = json.loads(file.readline())
+            span = request['resourceSpans'][0]['scopeSpans'][0]['spans'][0]
+            self.assertEqual(span['name'], 'format')
+            self.assertEqual(span['status']['code'], 1)
+            self.assertIn({'key': 'input_size', 'value': {'intValue': '10'}}, span['attributes'])
+            self.assertNotIn('parentSpanId', span)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def test_configure_tracing(self):
+        try:
+            self.assertIsInstance(configure_tracing('memory').exporter, InMemorySpanExporter)
+            with self.assertRaises(ValueError):
+                configure_tracing('zipkin')
+        finally:
+            configure_tracing('none')
+        self.assertIs(get_tracer(), configure_tracing('none'))
+
+
+if __name__ == '__main__':
+    unittest.main()
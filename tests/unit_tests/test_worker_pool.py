@@ -0,0 +1,57 @@
+import os
+import math
+import time
+import operator
+import unittest
+from src.worker_pool import WorkerPool, WorkerCrashedError, WorkerTimeoutError
+
+
+class TestWorkerPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = WorkerPool(size=1, max_tasks_per_child=2)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_run_returns_result(self):
+        self.assertEqual(self.pool.run(operator.add, 2, 3), 5)
+
+    def test_run_in_separate_process(self):
+        self.assertNotEqual(self.pool.run(os.getpid), os.getpid())
+
+    def test_worker_is_reused(self):
+        self.pool.max_tasks_per_child = None
+        self.assertEqual(self.pool.run(os.getpid), self.pool.run(os.getpid))
+
+    def test_worker_is_replaced_after_max_tasks(self):
+        pids = [self.pool.run(os.getpid) for _ in range(3)]
+        self.assertEqual(pids[0], pids[1])
+        self.assertNotEqual(pids[1], pids[2])
+
+    def test_exception_is_raised_in_caller(self):
+        with self.assertRaises(ValueError):
+            self.pool.run(math.sqrt, -1)
+        self.assertEqual(self.pool.run(operator.add, 1, 1), 2)
+
+    def test_crashed_worker_fails_only_its_job(self):
+        with self.assertRaises(WorkerCrashedError):
+            self.pool.run(os._exit, 1)
+        self.assertEqual(self.pool.run(operator.add, 1, 1), 2)
+
+    def test_unresponsive_worker_is_killed(self):
+        pid = self.pool.run(os.getpid)
+        with self.assertRaises(WorkerTimeoutError):
+            self.pool.run_with_timeout(0.5, time.sleep, 30)
+        self.assertNotEqual(self.pool.run(os.getpid), pid)
+
+    def test_run_with_timeout_returns_result(self):
+        self.assertEqual(self.pool.run_with_timeout(30, operator.add, 2, 3), 5)
+
+    def test_run_after_shutdown(self):
+        self.pool.shutdown()
+        with self.assertRaises(RuntimeError):
+            self.pool.run(operator.add, 1, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+import io
+import os
+import time
+import shutil
+import zipfile
+import tempfile
+import unittest
+from unittest.mock import patch
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from src import zip_writer
+from src.zip_writer import write_zip, ParallelDeflateCompressor, ZipStream, STORED, DEFLATED
+
+
+class Unseekable(io.RawIOBase):
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+
+class TestZipWriter(unittest.TestCase):
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.files = []
+        for name, content in [
+            ('edges.geojson', b''.join(b'{"type": "Feature", "id": %d}\n' % i for i in range(50000))),
+            ('points.geojson', os.urandom(100000)),
+            ('empty.geojson', b''),
+        ]:
+            path = os.path.join(self.root_dir, name)
+            with open(path, 'wb') as file:
+                file.write(content)
+            self.files.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir, ignore_errors=True)
+
+    def _assert_archive(self, data, compress_type):
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.namelist(), [os.path.basename(file) for file in self.files])
+            for file in self.files:
+                info = archive.getinfo(os.path.basename(file))
+                self.assertEqual(info.compress_type, compress_type)
+                with open(file, 'rb') as source:
+                    self.assertEqual(archive.read(info), source.read())
+
+    def test_parallel_deflate(self):
+        output = io.BytesIO()
+        write_zip(output, self.files, level=6, workers=4, chunk_size=16 * 1024)
+        self._assert_archive(output.getvalue(), zipfile.ZIP_DEFLATED)
+
+    def test_parallel_deflate_compresses_in_blocks(self):
+        output = io.BytesIO()
+        with patch('src.zip_writer._deflate_block', wraps=zip_writer._deflate_block) as deflate_block:
+            write_zip(output, self.files, level=6, workers=4, chunk_size=16 * 1024)
+        self.assertGreater(deflate_block.call_count, len(self.files))
+        self._assert_archive(output.getvalue(), zipfile.ZIP_DEFLATED)
+
+    def test_parallel_deflate_to_path_with_zip64_members(self):
+        path = os.path.join(self.root_dir, 'output.zip')
+        with patch.object(zip_writer, 'ZIP64_LIMIT', 1024):
+            write_zip(path, self.files, level=6, workers=4, chunk_size=16 * 1024)
+        with open(path, 'rb') as output:
+            self._assert_archive(output.read(), zipfile.ZIP_DEFLATED)
+
+    def test_parallel_deflate_keeps_non_ascii_names_and_modes(self):
+        path = os.path.join(self.root_dir, 'calle_señal.geojson')
+        with open(path, 'wb') as file:
+            file.write(b'{"type": "FeatureCollection", "features": []}')
+        os.chmod(path, 0o640)
+        output = io.BytesIO()
+        write_zip(output, [path], level=6, workers=2)
+        with zipfile.ZipFile(io.BytesIO(output.getvalue())) as archive:
+            self.assertIsNone(archive.testzip())
+            info = archive.getinfo('calle_señal.geojson')
+            self.assertEqual(info.external_attr >> 16 & 0o777, 0o640)
+            self.assertEqual(archive.read(info), b'{"type": "FeatureCollection", "features": []}')
+
+    def test_rename_members_copies_compressed_data(self):
+        for compression in [DEFLATED, STORED]:
+            with self.subTest(compression=compression):
+                source = os.path.join(self.root_dir, 'source.zip')
+                renamed = os.path.join(self.root_dir, 'renamed.zip')
+                write_zip(source, self.files, compression=compression)
+                with patch('src.zip_writer._deflate_block') as deflate_block:
+                    zip_writer.rename_members(source, renamed, lambda name: f'new.{name}')
+                deflate_block.assert_not_called()
+                with zipfile.ZipFile(source) as original, zipfile.ZipFile(renamed) as archive:
+                    self.assertIsNone(archive.testzip())
+                    self.assertEqual(archive.namelist(), [f'new.{name}' for name in original.namelist()])
+                    for info in original.infolist():
+                        copy = archive.getinfo(f'new.{info.filename}')
+                        self.assertEqual((copy.compress_type, copy.compress_size, copy.CRC, copy.date_time),
+                                         (info.compress_type, info.compress_size, info.CRC, info.date_time))
+                        self.assertEqual(archive.read(copy), original.read(info))
+
+    def test_parallel_ratio_close_to_sequential(self):
+        sequential, parallel = io.BytesIO(), io.BytesIO()
+        write_zip(sequential, self.files[:1], level=6, workers=1)
+        write_zip(parallel, self.files[:1], level=6, workers=4, chunk_size=64 * 1024)
+        self.assertLess(len(parallel.getvalue()), len(sequential.getvalue()) * 1.05)
+
+    def test_sequential_deflate(self):
+        path = os.path.join(self.root_dir, 'output.zip')
+        write_zip(path, self.files, level=1, workers=1)
+        with open(path, 'rb') as output:
+            self._assert_archive(output.read(), zipfile.ZIP_DEFLATED)
+
+    def test_stored(self):
+        output = io.BytesIO()
+        write_zip(output, self.files, compression=STORED, workers=4)
+        self._assert_archive(output.getvalue(), zipfile.ZIP_STORED)
+
+    def test_unseekable_output(self):
+        output = Unseekable()
+        write_zip(output, self.files, compression=DEFLATED, workers=2, chunk_size=16 * 1024)
+        self._assert_archive(output.buffer.getvalue(), zipfile.ZIP_DEFLATED)
+
+    def test_zip_stream(self):
+        stream = io.BufferedReader(ZipStream(self.files, name='output.zip', workers=2, chunk_size=16 * 1024))
+        self.assertEqual(stream.name, 'output.zip')
+        data = stream.read()
+        stream.close()
+        self._assert_archive(data, zipfile.ZIP_DEFLATED)
+
+    def test_zip_stream_reports_compress_time(self):
+        traced = []
+        observed = []
+
+        @contextmanager
+        def trace():
+            traced.append(True)
+            yield None
+
+        stream = io.BufferedReader(ZipStream(self.files, name='output.zip', max_buffered=1, trace=trace,
+                                             observe=observed.append))
+        time.sleep(0.3)
+        stream.read()
+        stream.close()
+        self.assertEqual(traced, [True])
+        # Time blocked on the full buffer is not compress time
+        self.assertEqual(len(observed), 1)
+        self.assertLess(observed[0], 0.3)
+        self.assertEqual(stream.raw.compress_seconds, observed[0])
+
+    def test_zip_stream_raises_zip_errors(self):
+        stream = ZipStream(self.files + [os.path.join(self.root_dir, 'missing.geojson')], name='output.zip')
+        with self.assertRaises(FileNotFoundError):
+            stream.read()
+        stream.close()
+
+    def test_zip_stream_closed_before_end(self):
+        stream = ZipStream(self.files, name='output.zip', max_buffered=1, compression=STORED)
+        stream.read(10)
+        stream.close()
+        self.assertFalse(stream._thread.is_alive())
+
+    def test_unsupported_compression(self):
+        with self.assertRaises(ValueError):
+            write_zip(io.BytesIO(), self.files, compression='zstd')
+
+    def test_compressor_bounds_pending_blocks(self):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            compressor = ParallelDeflateCompressor(executor, level=6, block_size=1024, max_pending=2)
+            compressor.compress(os.urandom(10 * 1024))
+            self.assertLessEqual(len(compressor._pending), 2)
+            compressor.flush()
+            self.assertEqual(len(compressor._pending), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()